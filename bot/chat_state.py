@@ -0,0 +1,175 @@
+import logging
+import time
+from collections import OrderedDict
+from .history import Message, MessageHistory
+
+# Приблизительные накладные расходы на одно сообщение в истории (словарь и строки)
+MESSAGE_OVERHEAD = 200
+
+
+def message_size(message):
+    """Приблизительный размер сообщения истории в байтах."""
+    return (
+        MESSAGE_OVERHEAD + len(message.user) + len(message.message) + len(message.line)
+    )
+
+
+class ChatState:
+    """Состояние одного чата: история, таймеры и признак незавершённой обработки."""
+
+    __slots__ = (
+        "chat_id",
+        "conversation_history",
+        "last_human_message_time",
+        "last_bot_message_time",
+        "last_activity_time",
+        "pending_reply",
+        "replying",
+        "burst_started",
+        "burst_messages",
+        "addressed",
+        "bot_spoke",
+        "memory",
+        "message_count",
+        "summary",
+        "summarized",
+        "summarizing",
+    )
+
+    def __init__(self, chat_id, now, history_size):
+        self.chat_id = chat_id
+        self.conversation_history = MessageHistory(history_size)  # История чата
+        self.last_human_message_time = now  # Время последнего сообщения от человека
+        # Время последнего сообщения от бота; до первого - время создания
+        # состояния, чтобы бот не начинал разговор сразу
+        self.last_bot_message_time = now
+        self.bot_spoke = False  # Писал ли бот в чат
+        self.last_activity_time = now  # Время последнего обращения к состоянию
+        self.pending_reply = None  # Задача отложенного ответа на серию сообщений
+        # Задача ответа, которая уже не отменяется новыми сообщениями
+        self.replying = None
+        self.burst_started = now  # Время начала текущей серии сообщений
+        self.burst_messages = 0  # Сообщений людей, ещё не учтённых решением об ответе
+        self.addressed = False  # Обращались ли к боту в текущей серии сообщений
+        self.memory = 0  # Приблизительный объём истории в байтах
+        self.message_count = 0  # Число сообщений, добавленных за всё время
+        self.summary = ""  # Сводка сообщений, вышедших из окна последних сообщений
+        self.summarized = 0  # Число первых сообщений чата, учтённых в сводке
+        self.summarizing = None  # Задача фонового обновления сводки
+
+    @property
+    def in_flight(self):
+        """Идёт ли сейчас обработка сообщений в чате."""
+        return any(
+            task is not None and not task.done()
+            for task in (self.pending_reply, self.replying)
+        )
+
+
+class ChatStateStore:
+    """
+    Хранилище состояний чатов с доступом по chat_id за O(1).
+
+    Порядок словаря соответствует давности использования (LRU): в начале лежат
+    самые давно активные чаты. Чаты вытесняются при простое дольше idle_ttl,
+    при превышении max_chats и при превышении общего лимита памяти max_memory.
+    Чаты с незавершённой обработкой не вытесняются.
+    """
+
+    def __init__(self, history_size, max_chats, idle_ttl, max_memory, clock=time.time):
+        self.history_size = history_size
+        self.max_chats = max_chats
+        self.idle_ttl = idle_ttl
+        self.max_memory = max_memory
+        self.clock = clock
+        self.memory = 0  # Суммарный объём историй всех чатов в байтах
+        self._chats = OrderedDict()
+
+    def __len__(self):
+        return len(self._chats)
+
+    def __contains__(self, chat_id):
+        return chat_id in self._chats
+
+    def __iter__(self):
+        return iter(list(self._chats.values()))
+
+    def get(self, chat_id):
+        """Возвращает состояние чата или None, если чат неизвестен."""
+        state = self._chats.get(chat_id)
+        if state is not None:
+            self._touch(state)
+        return state
+
+    def get_or_create(self, chat_id):
+        """Возвращает состояние чата, создавая его при необходимости."""
+        state = self.get(chat_id)
+        if state is None:
+            state = ChatState(chat_id, self.clock(), self.history_size)
+            self._chats[chat_id] = state
+            self._enforce_limits()
+        return state
+
+    def add_message(self, state, user, message):
+        """Добавляет сообщение в историю чата с учётом лимитов."""
+        entry = Message(user, message)
+        size = message_size(entry)
+        evicted = state.conversation_history.append(entry)
+        if evicted is not None:
+            size -= message_size(evicted)
+        state.message_count += 1
+        self._add_memory(state, size)
+
+        self._touch(state)
+        self._enforce_limits()
+
+    def set_summary(self, state, summary, summarized):
+        """
+        Сохраняет сводку ранней беседы чата.
+
+        :param summarized: Число первых сообщений чата, учтённых в сводке.
+        """
+        if self._chats.get(state.chat_id) is not state:
+            # Сводка готова после вытеснения чата; её объём не учитывается
+            return
+        self._add_memory(state, len(summary) - len(state.summary))
+        state.summary = summary
+        state.summarized = summarized
+
+    def evict_idle(self):
+        """Вытесняет чаты, простаивающие дольше idle_ttl."""
+        deadline = self.clock() - self.idle_ttl
+        self._evict_while(lambda state: state.last_activity_time < deadline)
+
+    def _add_memory(self, state, size):
+        state.memory += size
+        self.memory += size
+
+    def _touch(self, state):
+        state.last_activity_time = self.clock()
+        self._chats.move_to_end(state.chat_id)
+
+    def _over_limits(self):
+        return len(self._chats) > self.max_chats or self.memory > self.max_memory
+
+    def _enforce_limits(self):
+        self.evict_idle()
+        if self._over_limits():
+            self._evict_while(lambda state: self._over_limits())
+
+    def _evict_while(self, predicate):
+        # Просматриваем чаты с начала (самые давние), пока выполняется условие;
+        # занятые чаты переносятся в конец, поэтому цикл ограничен числом чатов
+        for _ in range(len(self._chats)):
+            state = next(iter(self._chats.values()))
+            if not predicate(state):
+                break
+            if state.in_flight:
+                self._chats.move_to_end(state.chat_id)
+            else:
+                self._evict(state)
+
+    def _evict(self, state):
+        del self._chats[state.chat_id]
+        self.memory -= state.memory
+        logging.debug("Состояние чата %s вытеснено из памяти", state.chat_id)
@@ -0,0 +1,80 @@
+import re
+
+# Приблизительная токенизация: слова делятся на части до 4 символов (примерно
+# так subword-токенизаторы режут русский текст), знаки препинания - отдельные токены
+_TOKEN_RE = re.compile(r"\w{1,4}|[^\w\s]")
+ELLIPSIS = "…"
+SUMMARY_HEADER = "Краткое содержание более ранней беседы: "
+
+
+def count_tokens(text):
+    """Локальная оценка числа токенов текста без обращения к API модели."""
+    return len(_TOKEN_RE.findall(text))
+
+
+def truncate_tokens(text, limit):
+    """Обрезает текст до limit токенов (с учётом многоточия в конце)."""
+    if limit <= 0:
+        return ""
+    for index, match in enumerate(_TOKEN_RE.finditer(text)):
+        if index == limit - 1:
+            if _TOKEN_RE.search(text, match.end()) is None:
+                return text  # Последний токен текста, обрезать не нужно
+            return text[: match.start()].rstrip() + ELLIPSIS
+    return text
+
+
+class ContextAssembler:
+    """
+    Сборка контекста разговора для промпта в пределах бюджета токенов.
+
+    Последние сообщения передаются дословно, от новых к старым, пока хватает
+    бюджета; слишком длинные сообщения обрезаются. Более ранние сообщения
+    представлены сводкой, которая обновляется в фоне (см. DecisionMaker.summarize)
+    и тоже ограничена по размеру.
+    """
+
+    def __init__(self, budget, recent_messages, max_message_tokens, summary_max_tokens):
+        self.budget = budget  # Бюджет токенов всего промпта
+        self.recent_messages = recent_messages  # Сообщений, передаваемых дословно
+        self.max_message_tokens = max_message_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self._summary_header_tokens = count_tokens(SUMMARY_HEADER)
+
+    def render(self, history, summary="", reserved=0, recent=None):
+        """
+        Текст контекста: сводка ранней беседы и последние сообщения.
+
+        :param history: История разговора (MessageHistory).
+        :param summary: Сводка сообщений, вышедших из окна последних сообщений.
+        :param reserved: Токены, занятые остальной частью промпта.
+        :param recent: Размер окна последних сообщений (по умолчанию recent_messages).
+        """
+        budget = self.budget - reserved
+        if summary:
+            summary = truncate_tokens(
+                summary,
+                min(self.summary_max_tokens, budget // 3) - self._summary_header_tokens,
+            )
+        if summary:
+            budget -= self._summary_header_tokens + count_tokens(summary)
+
+        lines = []
+        for message in reversed(history.last(recent or self.recent_messages)):
+            line, tokens = message.line, message.tokens
+            if tokens > self.max_message_tokens:
+                line = truncate_tokens(line, self.max_message_tokens)
+                tokens = self.max_message_tokens
+            if tokens > budget:
+                if not lines:
+                    # Последнее сообщение передаётся всегда, хотя бы частично
+                    lines.append(truncate_tokens(line, budget))
+                break
+            budget -= tokens
+            lines.append(line)
+        lines.reverse()
+
+        text = "\n".join(lines)
+        if summary:
+            return f"{SUMMARY_HEADER}{summary}\n\n{text}"
+        return text
@@ -1,74 +1,195 @@
+import asyncio
 import logging
-from langchain_google_genai import ChatGoogleGenerativeAI
-from config import GEMINI_API_KEY
+from contextlib import aclosing
+from .context import ContextAssembler, count_tokens
+from .llm import create_llm
+from .llm_policy import LLMCallPolicy, LLMUnavailable
+from .metrics import (
+    DECISION_MAKER_SECONDS,
+    FALLBACKS,
+    timed,
+)
+from .prompts import (
+    DECIDE_AND_GENERATE,
+    GENERATE_RESPONSE,
+    INITIATE_CONVERSATION,
+    SHOULD_RESPOND,
+    SUMMARIZE,
+)
+from .pre_filter import is_question
+from .response_cache import ResponseCache, normalize_context
+from config import (
+    CONTEXT_MAX_MESSAGE_TOKENS,
+    CONTEXT_RECENT_MESSAGES,
+    CONTEXT_TOKEN_BUDGET,
+    DECISION_MODE,
+    GEMINI_API_KEY,
+    LLM_BREAKER_FAILURES,
+    LLM_BREAKER_RECOVERY,
+    LLM_DEADLINES,
+    LLM_FALLBACK_MODELS,
+    LLM_HEDGE_MIN_DELAY,
+    LLM_HEDGE_MIN_SAMPLES,
+    LLM_HEDGE_QUANTILE,
+    LLM_MAX_CONCURRENCY,
+    LLM_MODEL,
+    LLM_PROVIDER,
+    LLM_TIMEOUT,
+    RESPONSE_CACHE_CONTEXT,
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_PER_CHAT,
+    RESPONSE_CACHE_SIZE,
+    RESPONSE_CACHE_THRESHOLD,
+    RESPONSE_CACHE_TTL,
+    SUMMARY_MAX_TOKENS,
+)
 
 
 class DecisionMaker:
-    def __init__(self):
-        """Инициализация DecisionMaker с использованием LLM и параметров тайминга."""
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-1.0-pro", google_api_key=GEMINI_API_KEY
-        )
+    def __init__(self, llm=None, fallback_llms=None):
+        """
+        Инициализация DecisionMaker с использованием LLM и параметров тайминга.
+
+        :param llm: Клиент LLM с методом ainvoke; по умолчанию создаётся по LLM_PROVIDER.
+        :param fallback_llms: Резервные модели - список пар (название, клиент);
+            по умолчанию создаются по LLM_FALLBACK_MODELS, если не передан llm.
+        """
+        self.llm = llm or create_llm(LLM_PROVIDER, LLM_MODEL, GEMINI_API_KEY)
+        if fallback_llms is None:
+            fallback_llms = (
+                []
+                if llm is not None
+                else [
+                    (model, create_llm(LLM_PROVIDER, model, GEMINI_API_KEY))
+                    for model in LLM_FALLBACK_MODELS
+                ]
+            )
         self.proactive_threshold = (
             300  # Порог времени для проактивных сообщений (5 минут)
         )
         self.min_human_response_time = (
             60  # Минимальное время ответа от человека (1 минута)
         )
+        # Сроки, хеджирование, выключатели и резервные модели для запросов к LLM
+        self.policy = LLMCallPolicy(
+            [(LLM_MODEL, self.llm), *fallback_llms],
+            deadlines=LLM_DEADLINES,
+            default_deadline=LLM_TIMEOUT,
+            max_concurrency=LLM_MAX_CONCURRENCY,
+            hedge_quantile=LLM_HEDGE_QUANTILE,
+            hedge_min_samples=LLM_HEDGE_MIN_SAMPLES,
+            hedge_min_delay=LLM_HEDGE_MIN_DELAY,
+            failure_threshold=LLM_BREAKER_FAILURES,
+            recovery_time=LLM_BREAKER_RECOVERY,
+        )
+        # Режим принятия решения: "separate", "combined" или "speculative"
+        self.decision_mode = DECISION_MODE
+        # Сборка истории разговора для промптов в пределах бюджета токенов
+        self.context = ContextAssembler(
+            CONTEXT_TOKEN_BUDGET,
+            CONTEXT_RECENT_MESSAGES,
+            CONTEXT_MAX_MESSAGE_TOKENS,
+            SUMMARY_MAX_TOKENS,
+        )
+        # Кеш решений и ответов для повторяющихся вопросов (None - выключен)
+        self.cache = (
+            ResponseCache(
+                RESPONSE_CACHE_SIZE,
+                RESPONSE_CACHE_TTL,
+                threshold=RESPONSE_CACHE_THRESHOLD,
+                per_chat=RESPONSE_CACHE_PER_CHAT,
+            )
+            if RESPONSE_CACHE_ENABLED
+            else None
+        )
+
+    def _cache_text(self, conversation_history, target_user=None):
+        """Ключ кеша по последним сообщениям (None, если кеш выключен)."""
+        if self.cache is None:
+            return None
+        text = normalize_context(conversation_history.last(RESPONSE_CACHE_CONTEXT))
+        # Ответ обращается к конкретному пользователю, поэтому он входит в ключ
+        return f"@{target_user}\n{text}" if target_user else text
+
+    def _render(
+        self, template, conversation_history, summary="", recent=None, **fields
+    ):
+        """Промпт по шаблону с историей, уложенной в бюджет токенов."""
+        reserved = template.tokens + sum(
+            count_tokens(str(value)) for value in fields.values()
+        )
+        conversation_text = self.context.render(
+            conversation_history, summary, reserved=reserved, recent=recent
+        )
+        return template.render(conversation_text=conversation_text, **fields)
+
+    async def _invoke(self, method, prompt):
+        """Вызов LLM по политике метода (см. LLMCallPolicy)."""
+        return await self.policy.invoke(method, prompt)
 
+    async def close(self):
+        """Отмена всех незавершённых запросов к LLM при остановке бота."""
+        await self.policy.close()
+
+    @timed(DECISION_MAKER_SECONDS.labels("should_respond"))
     async def should_respond(
-        self, conversation_history, current_time, last_bot_message_time
+        self,
+        conversation_history,
+        current_time,
+        last_bot_message_time,
+        summary="",
+        chat_id=None,
     ):
         """Определяет, стоит ли боту отвечать на последнее сообщение в истории."""
         if not conversation_history:
             return False
 
         last_message = conversation_history[-1]
-        if last_message["user"] == "Bot":
+        if last_message.user == "Bot":
             logging.info("Последнее сообщение было от бота. Не отвечаем.")
             return False
 
+        cache_text = self._cache_text(conversation_history)
+        if cache_text is not None:
+            cached, _ = self.cache.get("decision", chat_id, cache_text)
+            if cached is not None:
+                return cached
+
+        if self.policy.degraded:
+            # Основная модель недоступна: решение принимается локально, а
+            # запросы к резервным моделям остаются для генерации ответов
+            FALLBACKS.labels("should_respond").inc()
+            return self._heuristic_decision(conversation_history)
+
         try:
-            conversation_text = "\n".join(
-                [
-                    f"{msg['user']}: {msg['message']}"
-                    for msg in conversation_history[-10:]
-                ]
-            )
-            time_since_last_bot = current_time - last_bot_message_time
             prompt = [
-                f"""
-                Вы - ИИ-ассистент в групповом чате Telegram. Ваша задача - анализировать контекст разговора и решать, нужно ли вам ответить.
-                Внимательно изучите историю беседы и определите, есть ли необходимость в вашем участии.
-                Проанализируйте следующую историю разговора и ответьте "Да" или "Нет" на вопрос, стоит ли вам вмешаться в беседу.
-                
-                Отвечайте "Да", если:
-                1) Кто-то задал вопрос группе, на который вы можете дать полезный ответ
-                2) В разговоре возникла пауза, и вы можете добавить что-то интересное по теме
-                3) Обсуждается тема, в которую вы можете внести ценную информацию или новый взгляд
-                4) Кто-то напрямую обратился к боту или упомянул его
-                5) Есть возможность уточнить или развить мысль, высказанную участником беседы
-                
-                Отвечайте "Нет", если:
-                1) Разговор идет активно и ваше вмешательство может быть неуместным
-                2) Тема разговора личная или деликатная
-                3) Ваш последний ответ был совсем недавно, и нет острой необходимости снова вступать в беседу, время с вашего последнего ответа: {time_since_last_bot}
-                4) Обсуждение касается тем, в которых у вас нет достаточной компетенции
-                
-                История разговора (последние сообщения):
-                
-                {conversation_text}
-                
-                Ответьте только "Да" или "Нет".
-                """
+                self._render(
+                    SHOULD_RESPOND,
+                    conversation_history,
+                    summary,
+                    time_since_last_bot=current_time - last_bot_message_time,
+                )
             ]
-            response = self.llm.invoke(prompt)
+            response = await self._invoke("should_respond", prompt)
             should_respond = response.content.lower().strip() == "да"
+            if cache_text is not None:
+                self.cache.put("decision", chat_id, cache_text, should_respond)
             return should_respond
+        except LLMUnavailable:
+            FALLBACKS.labels("should_respond").inc()
+            return self._heuristic_decision(conversation_history)
         except Exception as e:
             logging.error(f"Ошибка в should_respond: {str(e)}", exc_info=True)
+            FALLBACKS.labels("should_respond").inc()
             return False
 
+    @staticmethod
+    def _heuristic_decision(conversation_history):
+        # Локальное решение без LLM: отвечать только на вопросы
+        should_respond = is_question(conversation_history[-1].message)
+        logging.info(f"LLM недоступна, решение по эвристике: {should_respond}")
+        return should_respond
+
     async def should_initiate(
         self, current_time, last_human_message_time, last_bot_message_time
     ):
@@ -76,124 +197,296 @@ class DecisionMaker:
         time_since_last_human = current_time - last_human_message_time
         time_since_last_bot = current_time - last_bot_message_time
 
-        logging.info(
-            f"Время с последнего сообщения от человека: {time_since_last_human} секунд"
-        )
-        logging.info(
-            f"Время с последнего сообщения от бота: {time_since_last_bot} секунд"
+        logging.debug(
+            "Время с последнего сообщения от человека: %s секунд, от бота: %s секунд",
+            time_since_last_human,
+            time_since_last_bot,
         )
 
-        if time_since_last_human > self.min_human_response_time:
-            logging.info("Новое сообщение от человека")
+        if time_since_last_human >= self.min_human_response_time:
+            logging.debug("Новое сообщение от человека")
             return True
 
-        if time_since_last_bot > self.proactive_threshold:
-            logging.info("Прошло достаточно времени с последнего сообщения бота")
+        if time_since_last_bot >= self.proactive_threshold:
+            logging.debug("Прошло достаточно времени с последнего сообщения бота")
             return True
 
         return False
 
-    async def generate_response(self, conversation_history, target_user=None):
-        """Генерирует ответ на основе истории разговора."""
-        logging.info(f"Генерация ответа на основе истории разговора")
+    def next_initiation_time(self, last_human_message_time, last_bot_message_time):
+        """Момент, начиная с которого should_initiate вернёт True."""
+        return min(
+            last_human_message_time + self.min_human_response_time,
+            last_bot_message_time + self.proactive_threshold,
+        )
 
-        try:
-            conversation_text = "\n".join(
-                [
-                    f"{msg['user']}: {msg['message']}"
-                    for msg in conversation_history[-10:]
-                ]
+    @timed(DECISION_MAKER_SECONDS.labels("decide_and_generate"))
+    async def decide_and_generate(
+        self,
+        conversation_history,
+        current_time,
+        last_bot_message_time,
+        target_user=None,
+        summary="",
+        chat_id=None,
+    ):
+        """
+        Решает, стоит ли отвечать, и готовит ответ в соответствии с decision_mode.
+
+        - "separate": последовательные вызовы should_respond и generate_response;
+        - "combined": один запрос к LLM возвращает и решение, и текст ответа;
+        - "speculative": генерация ответа идёт параллельно с принятием решения
+          и отменяется, если решено не отвечать.
+
+        :return: Кортеж (нужно ли отвечать, текст ответа или None).
+        """
+        if self.decision_mode == "combined":
+            return await self._decide_and_generate_combined(
+                conversation_history,
+                current_time,
+                last_bot_message_time,
+                target_user,
+                summary,
+                chat_id,
+            )
+
+        if self.decision_mode == "speculative":
+            generation = asyncio.create_task(
+                self.generate_response(
+                    conversation_history,
+                    target_user=target_user,
+                    summary=summary,
+                    chat_id=chat_id,
+                )
             )
+            should_respond = False
+            try:
+                should_respond = await self.should_respond(
+                    conversation_history,
+                    current_time,
+                    last_bot_message_time,
+                    summary=summary,
+                    chat_id=chat_id,
+                )
+            finally:
+                if not should_respond:
+                    generation.cancel()
+            if not should_respond:
+                return False, None
+            response = await generation
+            return response is not None, response
+
+        should_respond = await self.should_respond(
+            conversation_history,
+            current_time,
+            last_bot_message_time,
+            summary=summary,
+            chat_id=chat_id,
+        )
+        if not should_respond:
+            return False, None
+        response = await self.generate_response(
+            conversation_history,
+            target_user=target_user,
+            summary=summary,
+            chat_id=chat_id,
+        )
+        return response is not None, response
+
+    async def _decide_and_generate_combined(
+        self,
+        conversation_history,
+        current_time,
+        last_bot_message_time,
+        target_user,
+        summary="",
+        chat_id=None,
+    ):
+        """Принимает решение и генерирует ответ одним запросом к LLM."""
+        if not conversation_history:
+            return False, None
+
+        last_message = conversation_history[-1]
+        if last_message.user == "Bot":
+            logging.info("Последнее сообщение было от бота. Не отвечаем.")
+            return False, None
+
+        cache_text = self._cache_text(conversation_history, target_user)
+        if cache_text is not None:
+            cached, _ = self.cache.get("combined", chat_id, cache_text)
+            if cached is not None:
+                return cached
+
+        try:
             target_instruction = (
-                f"Обратитесь к пользователю {target_user} в своем ответе."
+                f"Если отвечаете, обратитесь к пользователю {target_user}.\n\n"
                 if target_user
                 else ""
             )
             prompt = [
-                f"""
-                Вы - дружелюбный и умный ИИ-ассистент в групповом чате Telegram. Ваша задача - поддерживать 
-                интересную и содержательную беседу, отвечая уместно и по существу. Используйте формальный стиль речи, 
-                но будьте дружелюбны и открыты. Ваши ответы должны быть на русском языке.
-                
-                На основе предоставленной истории разговора, сгенерируйте релевантный и естественный ответ. 
-                
-                {target_instruction}
-                
-                Ваш ответ должен соответствовать следующим критериям:
-                1) Быть кратким и по существу (не более 2-3 предложений)
-                2) Соответствовать контексту и тону разговора
-                3) Добавлять ценность к обсуждению (новая информация, интересный факт, уточняющий вопрос)
-                4) Быть написанным на грамотном русском языке
-                5) Поощрять дальнейшее обсуждение, если это уместно
-                
-                Избегайте:
-                1) Повторения уже сказанного
-                2) Использования сленга или неформальной лексики
-                3) Высказывания категоричных суждений по спорным вопросам
-                
-                История разговора (последние сообщения):
-                
-                {conversation_text}
-                
-                Ваш ответ:
-                """
+                self._render(
+                    DECIDE_AND_GENERATE,
+                    conversation_history,
+                    summary,
+                    time_since_last_bot=current_time - last_bot_message_time,
+                    target_instruction=target_instruction,
+                )
             ]
-            response = self.llm.invoke(prompt)
+            response = await self._invoke("decide_and_generate", prompt)
+            first_line, _, reply = response.content.strip().partition("\n")
+            decision, _, inline_reply = first_line.strip().partition(" ")
+            if decision.strip(" .,!:").lower() != "да":
+                result = False, None
+            else:
+                reply = f"{inline_reply}\n{reply}".strip()
+                if not reply:
+                    # Модель согласилась ответить, но не прислала текст
+                    reply = await self.generate_response(
+                        conversation_history,
+                        target_user=target_user,
+                        summary=summary,
+                        chat_id=chat_id,
+                    )
+                    if reply is None:
+                        return False, None
+                logging.info(f"Сгенерированный ответ: {reply}")
+                result = True, reply
+            if cache_text is not None:
+                self.cache.put("combined", chat_id, cache_text, result)
+            return result
+        except Exception as e:
+            logging.error(
+                f"Ошибка в _decide_and_generate_combined: {str(e)}", exc_info=True
+            )
+            FALLBACKS.labels("decide_and_generate").inc()
+            return False, None
+
+    @timed(DECISION_MAKER_SECONDS.labels("generate_response"))
+    async def generate_response(
+        self, conversation_history, target_user=None, summary="", chat_id=None
+    ):
+        """
+        Генерирует ответ на основе истории разговора.
+
+        :return: Текст ответа или None, если LLM не ответила (бот промолчит).
+        """
+        logging.info(f"Генерация ответа на основе истории разговора")
+
+        cache_text = self._cache_text(conversation_history, target_user)
+        if cache_text is not None:
+            cached, _ = self.cache.get("response", chat_id, cache_text)
+            if cached is not None:
+                return cached
+
+        try:
+            prompt = self._response_prompt(conversation_history, target_user, summary)
+            response = await self._invoke("generate_response", prompt)
             generated_response = response.content.strip()
             logging.info(f"Сгенерированный ответ: {generated_response}")
+            if cache_text is not None:
+                self.cache.put("response", chat_id, cache_text, generated_response)
             return generated_response
         except Exception as e:
             logging.error(f"Ошибка в generate_response: {str(e)}", exc_info=True)
-            return "Извините, произошла ошибка при генерации ответа."
+            FALLBACKS.labels("generate_response").inc()
+            return None
+
+    async def stream_response(
+        self, conversation_history, target_user=None, summary="", chat_id=None
+    ):
+        """
+        Генерирует ответ по мере поступления фрагментов от LLM.
+
+        Асинхронный генератор фрагментов текста; при закрытии генератора до
+        конца ответа запрос к LLM прерывается. Если LLM не ответила, фрагментов
+        нет и бот промолчит. Ответ из кеша возвращается одним фрагментом.
+        """
+        logging.info(f"Потоковая генерация ответа на основе истории разговора")
 
-    async def initiate_conversation(self, conversation_history):
+        cache_text = self._cache_text(conversation_history, target_user)
+        if cache_text is not None:
+            cached, _ = self.cache.get("response", chat_id, cache_text)
+            if cached is not None:
+                yield cached
+                return
+
+        chunks = []
+        try:
+            prompt = self._response_prompt(conversation_history, target_user, summary)
+            stream = self.policy.stream("generate_response", prompt)
+            async with aclosing(stream):
+                async for chunk in stream:
+                    chunks.append(chunk)
+                    yield chunk
+            # Сюда доходят только полностью полученные ответы
+            if cache_text is not None and chunks:
+                self.cache.put("response", chat_id, cache_text, "".join(chunks).strip())
+        except Exception as e:
+            logging.error(f"Ошибка в stream_response: {str(e)}", exc_info=True)
+            FALLBACKS.labels("generate_response").inc()
+
+    def _response_prompt(self, conversation_history, target_user, summary):
+        target_instruction = (
+            f"Обратитесь к пользователю {target_user} в своем ответе.\n\n"
+            if target_user
+            else ""
+        )
+        return [
+            self._render(
+                GENERATE_RESPONSE,
+                conversation_history,
+                summary,
+                target_instruction=target_instruction,
+            )
+        ]
+
+    @timed(DECISION_MAKER_SECONDS.labels("initiate_conversation"))
+    async def initiate_conversation(self, conversation_history, summary=""):
         """Инициирует новое сообщение на основе истории разговора."""
         logging.info(f"Инициация разговора на основе истории")
 
         last_message = conversation_history[-1]
-        if last_message["user"] == "Bot":
+        if last_message.user == "Bot":
             logging.info("Последнее сообщение было от бота.")
             return False
 
         try:
-            conversation_text = "\n".join(
-                [
-                    f"{msg['user']}: {msg['message']}"
-                    for msg in conversation_history[-5:]
-                ]
-            )
             prompt = [
-                f"""
-                Вы - инициативный ИИ-ассистент в групповом чате Telegram. Ваша задача - начать новую тему разговора 
-                или продолжить существующую, основываясь на последних сообщениях. Ваше сообщение должно быть на русском языке.
-                
-                На основе предоставленной истории разговора, придумайте интересное сообщение, которое может 
-                оживить беседу или начать новую увлекательную тему.
-                
-                Ваше сообщение должно соответствовать следующим критериям:
-                1) Быть релевантным контексту предыдущего разговора или плавно переходить к новой теме
-                2) Быть интригующим и способным вызвать отклик у участников чата
-                3) Содержать открытый вопрос или утверждение, которое побуждает к обсуждению
-                4) Быть написанным на грамотном русском языке
-                5) Не превышать 2-3 предложения
-                
-                Возможные варианты начала сообщения:
-                - "Кстати, я недавно узнал интересный факт о..."
-                - "А что вы думаете о..."
-                - "Интересно, как бы вы поступили, если бы..."
-                - "Мне кажется, или в последнее время все чаще говорят о..."
-                
-                Последние сообщения в чате:
-                
-                {conversation_text}
-                
-                Ваше новое сообщение:
-                """
+                self._render(
+                    INITIATE_CONVERSATION, conversation_history, summary, recent=5
+                )
             ]
-            response = self.llm.invoke(prompt)
+            response = await self._invoke("initiate_conversation", prompt)
             initiated_message = response.content.strip()
             logging.info(f"Инициировано сообщение: {initiated_message}")
             return initiated_message
         except Exception as e:
             logging.error(f"Ошибка в initiate_conversation: {str(e)}", exc_info=True)
-            return "Извините, у меня возникли проблемы с генерацией новой темы. Возможно, кто-то из вас хочет предложить интересную тему для обсуждения?"
+            FALLBACKS.labels("initiate_conversation").inc()
+            return False
+
+    @timed(DECISION_MAKER_SECONDS.labels("summarize"))
+    async def summarize(self, summary, messages):
+        """
+        Дополняет сводку ранней беседы сообщениями, вышедшими из окна истории.
+
+        Вызывается в фоне, а не при подготовке ответа.
+
+        :param summary: Текущая сводка (пустая строка, если её ещё нет).
+        :param messages: Сообщения для добавления в сводку, от старых к новым.
+        :return: Обновлённая сводка или None при ошибке.
+        """
+        try:
+            conversation_text = "\n".join([message.line for message in messages])
+            prompt = [
+                SUMMARIZE.render(
+                    summary=summary or "(пока нет)",
+                    conversation_text=conversation_text,
+                )
+            ]
+            response = await self._invoke("summarize", prompt)
+            return response.content.strip()
+        except Exception as e:
+            logging.error(f"Ошибка в summarize: {str(e)}", exc_info=True)
+            FALLBACKS.labels("summarize").inc()
+            return None
@@ -0,0 +1,268 @@
+import asyncio
+import heapq
+import logging
+import time
+from collections import deque
+from telegram.error import RetryAfter
+from .metrics import (
+    OUTBOUND_DROPPED,
+    OUTBOUND_QUEUE_DEPTH,
+    OUTBOUND_QUEUE_SECONDS,
+    OUTBOUND_RETRIES,
+)
+
+# Приоритеты исходящих сообщений: меньшее значение отправляется раньше
+REPLY = 0
+PROACTIVE = 1
+PRIORITY_NAMES = {REPLY: "reply", PROACTIVE: "proactive"}
+# Допустимое опережение токена в секундах. Цикл событий просыпается с
+# опозданием около 1 мс, и при корзине на один токен это время терялось бы на
+# каждом запросе, поэтому цикл просыпается на TOLERANCE раньше. Взятый раньше
+# срока токен уходит в долг, так что средняя частота не превышает заданную
+TOLERANCE = 0.002
+
+
+class TokenBucket:
+    """
+    Корзина токенов: не более capacity запросов подряд и rate запросов в
+    секунду в среднем. За любой интервал T проходит не больше capacity + rate * T
+    запросов.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """Время до появления токена (0, если токен есть)."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Request:
+    __slots__ = ("send", "priority", "number", "enqueued", "future", "attempts")
+
+    def __init__(self, send, priority, number, enqueued, future):
+        self.send = send  # Функция без аргументов, возвращающая корутину запроса
+        self.priority = priority
+        self.number = number
+        self.enqueued = enqueued
+        self.future = future
+        self.attempts = 0
+
+
+class _ChatQueue:
+    __slots__ = ("requests", "bucket", "blocked_until", "busy")
+
+    def __init__(self, bucket):
+        self.requests = deque()
+        self.bucket = bucket
+        self.blocked_until = 0.0  # Время окончания паузы после ответа 429
+        self.busy = False  # Выполняется ли запрос или ожидает ли чат в очереди
+
+
+class OutboundDispatcher:
+    """
+    Очередь исходящих запросов к Telegram с ограничением частоты.
+
+    Частота ограничивается корзинами токенов для каждого чата и для бота в
+    целом. Запросы одного чата выполняются строго по порядку и по одному,
+    поэтому правка сообщения не обгонит его отправку. Из чатов, готовых к
+    отправке, первым обслуживается запрос с более высоким приоритетом (ответы
+    раньше проактивных сообщений). При ответе 429 (RetryAfter) чат
+    приостанавливается на указанное время, и запрос повторяется. Общее число
+    ожидающих запросов ограничено queue_size: при переполнении send
+    выбрасывает asyncio.QueueFull.
+    """
+
+    def __init__(
+        self,
+        global_rate,
+        global_burst,
+        chat_rate,
+        chat_burst,
+        queue_size,
+        max_retries=3,
+        clock=time.monotonic,
+    ):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.clock = clock
+        self._global = TokenBucket(global_rate, global_burst, clock())
+        self._chats = {}  # chat_id -> _ChatQueue
+        self._ready = []  # Куча (приоритет, номер, chat_id) готовых чатов
+        self._waiting = []  # Куча (время готовности, номер, chat_id) ожидающих чатов
+        self._size = 0  # Число ожидающих запросов
+        self._counter = 0
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._sending = set()
+        self._last_sweep = clock()
+        OUTBOUND_QUEUE_DEPTH.set_function(lambda: self._size)
+
+    def __len__(self):
+        return self._size
+
+    async def send(self, chat_id, send, priority=REPLY):
+        """
+        Ставит запрос в очередь чата и ожидает его выполнения.
+
+        :param send: Функция без аргументов, возвращающая корутину запроса,
+            например lambda: bot.send_message(chat_id, text).
+        :return: Результат запроса.
+        """
+        if self._size >= self.queue_size:
+            OUTBOUND_DROPPED.labels(PRIORITY_NAMES[priority]).inc()
+            raise asyncio.QueueFull("Очередь исходящих сообщений переполнена")
+
+        now = self.clock()
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst, now)
+            chat = self._chats[chat_id] = _ChatQueue(bucket)
+        self._counter += 1
+        future = asyncio.get_running_loop().create_future()
+        chat.requests.append(_Request(send, priority, self._counter, now, future))
+        self._size += 1
+        if not chat.busy:
+            self._enqueue(chat_id, chat, now)
+        return await future
+
+    def start(self):
+        """Запуск цикла отправки."""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановка цикла отправки с отменой ожидающих запросов."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for task in list(self._sending):
+            task.cancel()
+        await asyncio.gather(*self._sending, return_exceptions=True)
+        for chat in self._chats.values():
+            for request in chat.requests:
+                request.future.cancel()
+        self._chats.clear()
+        self._ready.clear()
+        self._waiting.clear()
+        self._size = 0
+
+    def _enqueue(self, chat_id, chat, now):
+        # Постановка чата с ожидающими запросами в очередь готовых или ожидающих
+        chat.busy = True
+        head = chat.requests[0]
+        ready_at = max(now + chat.bucket.delay(now), chat.blocked_until)
+        if ready_at <= now + TOLERANCE:
+            heapq.heappush(self._ready, (head.priority, head.number, chat_id))
+        else:
+            heapq.heappush(self._waiting, (ready_at, head.number, chat_id))
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            now = self.clock()
+            if now - self._last_sweep > 60:
+                self._sweep(now)
+            while self._waiting and self._waiting[0][0] <= now + TOLERANCE:
+                _, _, chat_id = heapq.heappop(self._waiting)
+                head = self._chats[chat_id].requests[0]
+                heapq.heappush(self._ready, (head.priority, head.number, chat_id))
+
+            if self._ready:
+                delay = self._global.delay(now)
+                if delay <= TOLERANCE:
+                    _, _, chat_id = heapq.heappop(self._ready)
+                    self._dispatch(chat_id, now)
+                    continue
+            else:
+                delay = self._waiting[0][0] - now if self._waiting else None
+
+            self._wakeup.clear()
+            if delay is not None:
+                delay = max(delay - TOLERANCE, 0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _dispatch(self, chat_id, now):
+        chat = self._chats[chat_id]
+        request = chat.requests.popleft()
+        self._size -= 1
+        if request.future.done():
+            # Отправитель перестал ждать (например, ответ отменён) до отправки
+            chat.busy = False
+            if chat.requests:
+                self._enqueue(chat_id, chat, now)
+            return
+        self._global.take(now)
+        chat.bucket.take(now)
+        if request.attempts == 0:
+            OUTBOUND_QUEUE_SECONDS.labels(PRIORITY_NAMES[request.priority]).observe(
+                now - request.enqueued
+            )
+        task = asyncio.create_task(self._execute(chat_id, chat, request))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _execute(self, chat_id, chat, request):
+        request.attempts += 1
+        try:
+            result = await request.send()
+        except RetryAfter as e:
+            if request.attempts > self.max_retries or request.future.done():
+                self._finish(request, exception=e)
+            else:
+                OUTBOUND_RETRIES.inc()
+                logging.debug(
+                    "Ограничение частоты в чате %s, повтор через %s с",
+                    chat_id,
+                    e.retry_after,
+                )
+                chat.blocked_until = self.clock() + float(e.retry_after)
+                chat.requests.appendleft(request)
+                self._size += 1
+        except Exception as e:
+            self._finish(request, exception=e)
+        else:
+            self._finish(request, result=result)
+
+        chat.busy = False
+        if chat.requests:
+            self._enqueue(chat_id, chat, self.clock())
+
+    @staticmethod
+    def _finish(request, result=None, exception=None):
+        if request.future.done():
+            return  # Отправитель больше не ждёт результата
+        if exception is not None:
+            request.future.set_exception(exception)
+        else:
+            request.future.set_result(result)
+
+    def _sweep(self, now):
+        # Удаление простаивающих чатов с полной корзиной токенов
+        self._last_sweep = now
+        for chat_id, chat in list(self._chats.items()):
+            if not chat.busy and not chat.requests and chat.bucket.full(now):
+                del self._chats[chat_id]
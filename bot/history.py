@@ -0,0 +1,83 @@
+from .context import count_tokens
+
+
+class Message:
+    """Сообщение в истории разговора."""
+
+    __slots__ = ("user", "message", "line", "tokens")
+
+    def __init__(self, user, message):
+        self.user = user  # Имя автора ("Bot" для сообщений бота)
+        self.message = message  # Обработанный текст сообщения
+        # Строка сообщения для промптов, форматируется один раз
+        self.line = f"{user}: {message}"
+        self.tokens = count_tokens(self.line)  # Оценка числа токенов строки
+
+
+class MessageHistory:
+    """
+    История разговора фиксированного размера на кольцевом буфере.
+
+    Добавление выполняется за O(1) без перевыделения памяти: при заполнении
+    буфера новое сообщение замещает самое старое. Буфер хранит каждое
+    сообщение дважды - в позициях i и i + capacity, поэтому любые последние
+    сообщения лежат в нём подряд и выбираются одним срезом.
+    """
+
+    __slots__ = ("_buffer", "_capacity", "_start", "_size")
+
+    def __init__(self, capacity):
+        self._buffer = [None] * (2 * capacity)
+        self._capacity = capacity
+        self._start = 0  # Индекс самого старого сообщения, меньше capacity
+        self._size = 0
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return iter(self.last(self._size))
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("Индекс истории вне диапазона")
+        return self._buffer[self._start + index]
+
+    def append(self, message):
+        """
+        Добавляет сообщение в историю.
+
+        :param message: Добавляемое сообщение.
+        :return: Вытесненное сообщение или None, если буфер не был заполнен.
+        """
+        capacity = self._capacity
+        buffer = self._buffer
+        if self._size < capacity:
+            index = self._start + self._size
+            buffer[index] = buffer[index + capacity] = message
+            self._size += 1
+            return None
+        start = self._start
+        evicted = buffer[start]
+        buffer[start] = buffer[start + capacity] = message
+        self._start = start + 1 if start + 1 < capacity else 0
+        return evicted
+
+    def last(self, count):
+        """
+        Возвращает список последних count сообщений.
+
+        Копируются только ссылки на сообщения одним срезом буфера; для
+        коротких историй это дешевле, чем создавать объект-представление и
+        обходить его.
+        """
+        end = self._start + self._size
+        if count >= self._size:
+            return self._buffer[self._start : end]
+        return self._buffer[end - count : end]
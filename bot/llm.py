@@ -0,0 +1,98 @@
+import asyncio
+import random
+
+
+class StubResponse:
+    """Ответ заглушки LLM с тем же атрибутом content, что и у сообщений LangChain."""
+
+    __slots__ = ("content",)
+
+    def __init__(self, content):
+        self.content = content
+
+
+class StubLLM:
+    """
+    Детерминированная заглушка LLM для офлайн-тестов и бенчмарков.
+
+    Поддерживает тот же асинхронный интерфейс, что и модели LangChain
+    (ainvoke и astream). Тип запроса определяется по тексту промпта
+    DecisionMaker: на запрос решения отвечает "Да" с вероятностью yes_ratio,
+    на объединённый запрос - решением и текстом, на остальные - текстом reply.
+    Первый фрагмент ответа приходит через latency плюс равномерный разброс
+    jitter, каждый следующий (по chunk_words слов) - ещё через chunk_delay;
+    ainvoke возвращает весь ответ через суммарное время генерации.
+    """
+
+    def __init__(
+        self,
+        latency=0.1,
+        jitter=0.0,
+        yes_ratio=0.5,
+        reply=None,
+        seed=0,
+        chunk_words=3,
+        chunk_delay=0.0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.yes_ratio = yes_ratio
+        self.reply = reply or "Интересный вопрос! А что вы сами об этом думаете?"
+        self.chunk_words = chunk_words
+        self.chunk_delay = chunk_delay
+        self.calls = 0  # Число выполненных запросов
+        self._random = random.Random(seed)
+
+    def _delay(self):
+        return self.latency + self._random.uniform(0, self.jitter)
+
+    def _answer(self, prompt):
+        text = prompt[-1] if isinstance(prompt, list) else prompt
+        if 'Ответьте только "Да" или "Нет"' in text:
+            return "Да" if self._random.random() < self.yes_ratio else "Нет"
+        if "Формат ответа" in text:
+            if self._random.random() < self.yes_ratio:
+                return f"Да\n{self.reply}"
+            return "Нет"
+        return self.reply
+
+    def _chunks(self, answer):
+        words = answer.split(" ")
+        return [
+            " ".join(words[index : index + self.chunk_words])
+            for index in range(0, len(words), self.chunk_words)
+        ]
+
+    async def ainvoke(self, prompt):
+        self.calls += 1
+        answer = self._answer(prompt)
+        chunks = len(self._chunks(answer))
+        await asyncio.sleep(self._delay() + (chunks - 1) * self.chunk_delay)
+        return StubResponse(answer)
+
+    async def astream(self, prompt):
+        self.calls += 1
+        chunks = self._chunks(self._answer(prompt))
+        await asyncio.sleep(self._delay())
+        for index, chunk in enumerate(chunks):
+            if index:
+                await asyncio.sleep(self.chunk_delay)
+                chunk = " " + chunk
+            yield StubResponse(chunk)
+
+
+def create_llm(provider, model, api_key=None):
+    """
+    Создание клиента LLM по названию провайдера.
+
+    :param provider: "gemini" (Google Gemini через LangChain) или "stub" (заглушка).
+    :param model: Название модели провайдера.
+    :param api_key: Ключ API провайдера.
+    """
+    if provider == "stub":
+        return StubLLM()
+    if provider == "gemini":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        return ChatGoogleGenerativeAI(model=model, google_api_key=api_key)
+    raise ValueError(f"Неизвестный провайдер LLM: {provider}")
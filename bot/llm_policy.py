@@ -0,0 +1,320 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from .metrics import (
+    LLM_CALLS,
+    LLM_CIRCUIT_OPEN,
+    LLM_ERRORS,
+    LLM_HEDGES,
+    LLM_IN_FLIGHT,
+    LLM_UNAVAILABLE,
+)
+
+# Состояния автоматического выключателя
+CLOSED = "closed"  # Запросы идут к модели
+OPEN = "open"  # Модель пропускается до истечения recovery_time
+HALF_OPEN = "half_open"  # Пропускается один пробный запрос
+
+
+class LLMUnavailable(Exception):
+    """Ни одна модель не ответила: выключатели разомкнуты или запросы не удались."""
+
+
+class CircuitBreaker:
+    """
+    Автоматический выключатель модели.
+
+    После failure_threshold ошибок подряд выключатель размыкается, и запросы к
+    модели не отправляются recovery_time секунд. Затем пропускается один
+    пробный запрос: при успехе выключатель замыкается, при ошибке снова
+    размыкается.
+    """
+
+    def __init__(self, failure_threshold, recovery_time, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0  # Ошибок подряд
+        self._opened_at = 0.0
+        self._probing = False  # Выполняется ли пробный запрос
+
+    def allow(self):
+        """Можно ли отправить запрос; в полуоткрытом состоянии - только один."""
+        if self.state == OPEN and self.clock() >= self._opened_at + self.recovery_time:
+            self.state = HALF_OPEN
+            logging.info("Выключатель модели полуоткрыт, пробный запрос")
+        if self.state == HALF_OPEN:
+            if self._probing:
+                return False
+            self._probing = True
+        return self.state != OPEN
+
+    def record_success(self):
+        if self.state != CLOSED:
+            logging.info("Модель снова отвечает, выключатель замкнут")
+        self.state = CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                logging.warning(
+                    f"Выключатель модели разомкнут после {self.failures} ошибок подряд"
+                )
+            self.state = OPEN
+            self._opened_at = self.clock()
+
+    def record_cancel(self):
+        # Запрос отменён (проигравший хедж или остановка): результата нет
+        self._probing = False
+
+
+class LatencyWindow:
+    """Задержки последних успешных запросов для оценки квантилей."""
+
+    def __init__(self, size=200):
+        self.values = deque(maxlen=size)
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, value):
+        self.values.append(value)
+
+    def quantile(self, q):
+        values = sorted(self.values)
+        return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class _Model:
+    __slots__ = ("name", "client", "breaker")
+
+    def __init__(self, name, client, breaker):
+        self.name = name
+        self.client = client
+        self.breaker = breaker
+
+
+class LLMCallPolicy:
+    """
+    Политика вызова LLM: сроки, хеджирование, выключатели и резервные модели.
+
+    - Каждый метод DecisionMaker получает свой срок (deadlines, по умолчанию
+      default_deadline); он общий для всех попыток и моделей.
+    - Если ответа нет дольше квантили hedge_quantile задержек метода (после
+      hedge_min_samples замеров), к той же модели уходит второй запрос, и
+      используется первый успешный ответ. Если первый запрос завершился
+      ошибкой раньше, второй отправляется сразу. Хедж не отправляется, когда
+      все слоты параллельности заняты.
+    - У каждой модели свой выключатель (CircuitBreaker); модели с разомкнутым
+      выключателем пропускаются.
+    - Модели перебираются по порядку, пока не истёк срок; если ни одна не
+      ответила, выбрасывается LLMUnavailable.
+
+    :param models: Список пар (название, клиент LangChain или заглушка),
+        первой идёт основная модель.
+    """
+
+    def __init__(
+        self,
+        models,
+        deadlines,
+        default_deadline,
+        max_concurrency,
+        hedge_quantile=0.95,
+        hedge_min_samples=20,
+        hedge_min_delay=0.2,
+        failure_threshold=5,
+        recovery_time=30,
+        clock=time.monotonic,
+    ):
+        self.models = [
+            _Model(
+                name, client, CircuitBreaker(failure_threshold, recovery_time, clock)
+            )
+            for name, client in models
+        ]
+        self.deadlines = deadlines
+        self.default_deadline = default_deadline
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._latency = {}  # Метод -> LatencyWindow
+        self._tasks = set()  # Незавершённые запросы к LLM
+        for model in self.models:
+            LLM_CIRCUIT_OPEN.set_function(
+                lambda breaker=model.breaker: int(breaker.state != CLOSED), model.name
+            )
+
+    @property
+    def degraded(self):
+        """Основная модель недоступна или проверяется пробным запросом."""
+        return self.models[0].breaker.state != CLOSED
+
+    def hedge_delay(self, method):
+        """Задержка перед хеджирующим запросом (None - хеджирование выключено)."""
+        window = self._latency.get(method)
+        if window is None or len(window) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, window.quantile(self.hedge_quantile))
+
+    async def invoke(self, method, prompt):
+        """Ответ LLM на промпт с учётом срока метода; LLMUnavailable при неудаче."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadlines.get(method, self.default_deadline)
+        error = None
+        for model in self.models:
+            if loop.time() >= deadline:
+                break
+            if not model.breaker.allow():
+                continue
+            try:
+                return await self._hedged(method, model, prompt, deadline)
+            except Exception as e:
+                logging.warning(f"Модель {model.name} не ответила в {method}: {e!r}")
+                error = e
+        LLM_UNAVAILABLE.labels(method).inc()
+        raise LLMUnavailable(f"LLM недоступна для {method}") from error
+
+    async def _hedged(self, method, model, prompt, deadline):
+        # Запрос к модели с не более чем одним хеджирующим запросом
+        loop = asyncio.get_running_loop()
+        sent = set()  # Попытки, получившие слот параллельности и ушедшие к модели
+        attempts = {self._start(method, model, prompt, sent)}
+        delay = self.hedge_delay(method)
+        hedge_at = loop.time() + delay if delay is not None else None
+        hedged = False
+        error = None
+        try:
+            while attempts:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    if attempts & sent:
+                        # Модель не ответила в срок. Попытки, не дождавшиеся
+                        # слота параллельности, на модель не списываются
+                        LLM_ERRORS.inc()
+                        model.breaker.record_failure()
+                    raise asyncio.TimeoutError(f"Истёк срок {method}")
+                if not hedged and hedge_at is not None:
+                    timeout = min(timeout, max(hedge_at - loop.time(), 0))
+                done, _ = await asyncio.wait(
+                    attempts, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                for attempt in done:
+                    attempts.discard(attempt)
+                    if attempt.exception() is None:
+                        return attempt.result()
+                    error = attempt.exception()
+                late = hedge_at is not None and loop.time() >= hedge_at
+                if not hedged and (not attempts or late):
+                    hedged = True
+                    if not self._semaphore.locked() and model.breaker.allow():
+                        LLM_HEDGES.labels(method).inc()
+                        attempts.add(self._start(method, model, prompt, sent))
+            raise error
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+
+    def _start(self, method, model, prompt, sent):
+        task = asyncio.ensure_future(self._attempt(method, model, prompt, sent))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _attempt(self, method, model, prompt, sent):
+        # Один запрос к модели; результат учитывается выключателем. Получив
+        # слот параллельности, попытка добавляет себя в sent
+        loop = asyncio.get_running_loop()
+        try:
+            async with self._semaphore:
+                sent.add(asyncio.current_task())
+                LLM_CALLS.inc()
+                LLM_IN_FLIGHT.inc()
+                started = loop.time()
+                try:
+                    response = await model.client.ainvoke(prompt)
+                except Exception:
+                    LLM_ERRORS.inc()
+                    model.breaker.record_failure()
+                    raise
+                finally:
+                    LLM_IN_FLIGHT.dec()
+        except asyncio.CancelledError:
+            # Отмена во время запроса или ожидания слота: результата нет
+            model.breaker.record_cancel()
+            raise
+        model.breaker.record_success()
+        self._latency.setdefault(method, LatencyWindow()).add(loop.time() - started)
+        return response
+
+    async def stream(self, method, prompt):
+        """
+        Фрагменты ответа LLM по мере генерации.
+
+        Срок и выключатели работают так же, как в invoke, но без
+        хеджирования. К следующей модели переходит только запрос, по которому
+        ещё не получено ни одного фрагмента. Если срок истёк, пока фрагмент
+        обрабатывал получатель (например, ждал очереди отправки), а не модель,
+        ошибка модели не засчитывается.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadlines.get(method, self.default_deadline)
+        error = None
+        for model in self.models:
+            if loop.time() >= deadline:
+                break
+            if not model.breaker.allow():
+                continue
+            streamed = False
+            try:
+                async with self._semaphore:
+                    LLM_CALLS.inc()
+                    LLM_IN_FLIGHT.inc()
+                    stream = model.client.astream(prompt)
+                    try:
+                        while True:
+                            timeout = deadline - loop.time()
+                            if timeout <= 0:
+                                model.breaker.record_cancel()
+                                raise asyncio.TimeoutError(f"Истёк срок {method}")
+                            try:
+                                chunk = await asyncio.wait_for(anext(stream), timeout)
+                            except StopAsyncIteration:
+                                break
+                            except Exception:
+                                LLM_ERRORS.inc()
+                                model.breaker.record_failure()
+                                raise
+                            if chunk.content:
+                                streamed = True
+                                yield chunk.content
+                    finally:
+                        LLM_IN_FLIGHT.dec()
+                        await stream.aclose()
+                model.breaker.record_success()
+                return
+            except (asyncio.CancelledError, GeneratorExit):
+                # Отмена во время запроса или ожидания слота: результата нет
+                model.breaker.record_cancel()
+                raise
+            except Exception as e:
+                if streamed:
+                    raise
+                logging.warning(f"Модель {model.name} не ответила в {method}: {e!r}")
+                error = e
+        LLM_UNAVAILABLE.labels(method).inc()
+        raise LLMUnavailable(f"LLM недоступна для {method}") from error
+
+    async def close(self):
+        """Отмена всех незавершённых запросов к LLM."""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,363 @@
+import functools
+import logging
+import time
+from bisect import bisect_left
+from aiohttp import web
+
+# Границы корзин гистограмм задержек в секундах
+LATENCY_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+
+def _format_labels(labelnames, values, extra=""):
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """Базовый класс метрики с необязательными метками."""
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+
+    def labels(self, *values):
+        """Возвращает метрику для заданных значений меток."""
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for values, child in sorted(self._children.items()):
+            lines.extend(child.render(self.name, self.labelnames, values))
+        return lines
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+    def render(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {self.value}"]
+
+
+class Counter(_Metric):
+    """Монотонно растущий счётчик."""
+
+    type = "counter"
+    _new_child = _Value
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    """Значение, которое может расти и уменьшаться."""
+
+    type = "gauge"
+    _new_child = _Value
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class _CallbackValue:
+    __slots__ = ("callback",)
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def render(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {self.callback()}"]
+
+
+class CallbackGauge(_Metric):
+    """Значение, вычисляемое функцией в момент чтения метрик."""
+
+    type = "gauge"
+
+    def set_function(self, callback, *values):
+        self._children[values] = _CallbackValue(callback)
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        """Контекстный менеджер, замеряющий длительность блока."""
+        return _Timer(self)
+
+    def render(self, name, labelnames, values):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            labels = _format_labels(labelnames, values, f'le="{bound}"')
+            lines.append(f"{name}_bucket{labels} {cumulative}")
+        labels = _format_labels(labelnames, values, 'le="+Inf"')
+        lines.append(f"{name}_bucket{labels} {self.count}")
+        labels = _format_labels(labelnames, values)
+        lines.append(f"{name}_sum{labels} {self.sum}")
+        lines.append(f"{name}_count{labels} {self.count}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными корзинами."""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+
+class _Timer:
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+def timed(histogram):
+    """Декоратор корутины, записывающий её длительность в гистограмму."""
+
+    def decorator(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+
+        return wrapper
+
+    return decorator
+
+
+class Registry:
+    """Набор метрик, отображаемый в текстовом формате Prometheus."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(
+    Histogram(
+        "bot_stage_seconds",
+        "Длительность стадий обработки сообщения",
+        ["stage"],
+    )
+)
+DECISION_MAKER_SECONDS = REGISTRY.register(
+    Histogram(
+        "bot_decision_maker_seconds",
+        "Длительность методов DecisionMaker",
+        ["method"],
+    )
+)
+LLM_CALLS = REGISTRY.register(Counter("bot_llm_calls_total", "Запросы к LLM"))
+LLM_ERRORS = REGISTRY.register(
+    Counter("bot_llm_errors_total", "Ошибки и таймауты запросов к LLM")
+)
+LLM_IN_FLIGHT = REGISTRY.register(
+    Gauge("bot_llm_in_flight", "Выполняющиеся запросы к LLM")
+)
+FALLBACKS = REGISTRY.register(
+    Counter(
+        "bot_fallbacks_total",
+        "Ответы по умолчанию после ошибок DecisionMaker",
+        ["method"],
+    )
+)
+LLM_HEDGES = REGISTRY.register(
+    Counter(
+        "bot_llm_hedged_total",
+        "Хеджирующие и повторные запросы к LLM",
+        ["method"],
+    )
+)
+LLM_UNAVAILABLE = REGISTRY.register(
+    Counter(
+        "bot_llm_unavailable_total",
+        "Вызовы, на которые не ответила ни одна модель",
+        ["method"],
+    )
+)
+LLM_CIRCUIT_OPEN = REGISTRY.register(
+    CallbackGauge(
+        "bot_llm_circuit_open",
+        "Разомкнут ли выключатель модели (1 - модель пропускается или проверяется)",
+        ["model"],
+    )
+)
+PREFILTER_VERDICTS = REGISTRY.register(
+    Counter(
+        "bot_prefilter_verdicts_total",
+        "Вердикты предварительного фильтра",
+        ["verdict"],
+    )
+)
+CHATS = REGISTRY.register(CallbackGauge("bot_chats", "Чаты в памяти"))
+HISTORY_BYTES = REGISTRY.register(
+    CallbackGauge("bot_history_bytes", "Приблизительный объём историй чатов")
+)
+CACHE_REQUESTS = REGISTRY.register(
+    Counter(
+        "bot_cache_requests_total",
+        "Обращения к кешу решений и ответов по результату",
+        ["kind", "result"],
+    )
+)
+CACHE_LOOKUP_SECONDS = REGISTRY.register(
+    Histogram(
+        "bot_cache_lookup_seconds",
+        "Длительность поиска в кеше решений и ответов",
+        buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01),
+    )
+)
+CACHE_ENTRIES = REGISTRY.register(
+    CallbackGauge("bot_cache_entries", "Записи в кеше решений и ответов")
+)
+SHARD_UPDATES = REGISTRY.register(
+    Counter("bot_shard_updates_total", "Обновления, переданные шардам", ["shard"])
+)
+SHARD_DROPPED = REGISTRY.register(
+    Counter(
+        "bot_shard_dropped_total",
+        "Обновления, отброшенные из-за заполненной очереди шарда",
+    )
+)
+SHARD_QUEUE_DEPTH = REGISTRY.register(
+    CallbackGauge("bot_shard_queue_depth", "Обновления в очереди шарда", ["shard"])
+)
+OUTBOUND_QUEUE_SECONDS = REGISTRY.register(
+    Histogram(
+        "bot_outbound_queue_seconds",
+        "Ожидание исходящих сообщений в очереди до отправки",
+        ["priority"],
+    )
+)
+OUTBOUND_QUEUE_DEPTH = REGISTRY.register(
+    CallbackGauge("bot_outbound_queue_depth", "Исходящие сообщения в очереди")
+)
+OUTBOUND_RETRIES = REGISTRY.register(
+    Counter("bot_outbound_retries_total", "Повторы отправки после ответа 429")
+)
+OUTBOUND_DROPPED = REGISTRY.register(
+    Counter(
+        "bot_outbound_dropped_total",
+        "Исходящие сообщения, отклонённые при переполненной очереди",
+        ["priority"],
+    )
+)
+
+
+class MetricsServer:
+    """Локальный HTTP-сервер с метриками в формате Prometheus на /metrics."""
+
+    def __init__(self, listen, port, registry=REGISTRY):
+        self.listen = listen
+        self.port = port
+        self.registry = registry
+        self._runner = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.listen, self.port).start()
+        logging.info(f"Метрики доступны на {self.listen}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def handle(self, request):
+        return web.Response(
+            body=self.registry.render().encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
@@ -0,0 +1,125 @@
+import json
+import logging
+import math
+from collections import Counter
+
+# Вердикты предварительного фильтра
+RESPOND = "respond"  # Ответить без запроса к LLM
+SKIP = "skip"  # Не отвечать без запроса к LLM
+ASK_LLM = "ask_llm"  # Решение принимает LLM
+
+# Слова, с которых обычно начинается вопрос
+QUESTION_WORDS = frozenset(
+    [
+        "кто",
+        "что",
+        "где",
+        "куда",
+        "откуда",
+        "когда",
+        "почему",
+        "зачем",
+        "как",
+        "какой",
+        "какая",
+        "какое",
+        "какие",
+        "сколько",
+        "чей",
+        "чья",
+        "чьё",
+        "чьи",
+        "ли",
+        "разве",
+        "неужели",
+    ]
+)
+
+
+def is_question(processed_text):
+    """Похоже ли сообщение (результат RussianProcessor.process) на вопрос."""
+    tokens = processed_text.split()
+    return "?" in tokens or bool(tokens and tokens[0] in QUESTION_WORDS)
+
+
+class PreFilter:
+    """
+    Быстрый локальный фильтр перед запросом к LLM в should_respond.
+
+    Работает на результате RussianProcessor.process (текст в нижнем регистре,
+    токены разделены пробелами) и отсекает сообщения, для которых решение
+    очевидно. Неоднозначные сообщения передаются LLM.
+    """
+
+    def __init__(
+        self, min_bot_interval, min_tokens, model_path=None, thresholds=(0.2, 0.8)
+    ):
+        self.min_bot_interval = min_bot_interval
+        self.min_tokens = min_tokens
+        self.low_threshold, self.high_threshold = thresholds
+        self.bias = 0.0
+        self.weights = None  # Веса линейного классификатора по токенам
+        if model_path:
+            self.load_model(model_path)
+        self.stats = Counter()  # Число вердиктов каждого вида
+
+    @property
+    def avoided_calls(self):
+        """Число запросов к LLM, которых удалось избежать."""
+        return self.stats[RESPOND] + self.stats[SKIP]
+
+    def load_model(self, path):
+        """Загрузка весов классификатора из JSON-файла {"bias": ..., "weights": {...}}."""
+        with open(path, encoding="utf-8") as f:
+            model = json.load(f)
+        self.bias = model.get("bias", 0.0)
+        self.weights = model["weights"]
+        logging.info("Загружена модель предварительного фильтра: %s", path)
+
+    def score(self, tokens):
+        """Вероятность того, что на сообщение стоит ответить, по мнению классификатора."""
+        weights = self.weights
+        z = self.bias + sum(weights.get(token, 0.0) for token in set(tokens))
+        return 1.0 / (1.0 + math.exp(-z))
+
+    def check(self, messages, addressed, current_time, last_bot_message_time):
+        """
+        Определяет, можно ли принять решение об ответе без LLM.
+
+        :param messages: Сообщения серии (результаты RussianProcessor.process);
+            серия оценивается целиком, как одно сообщение.
+        :param addressed: Обратились ли к боту напрямую (упоминание или ответ боту).
+        :param current_time: Текущее время.
+        :param last_bot_message_time: Время последнего сообщения бота или None,
+            если бот ещё не писал в чат.
+        :return: RESPOND, SKIP или ASK_LLM.
+        """
+        verdict = self._check(messages, addressed, current_time, last_bot_message_time)
+        self.stats[verdict] += 1
+        return verdict
+
+    def _check(self, messages, addressed, current_time, last_bot_message_time):
+        if addressed:
+            return RESPOND
+
+        if (
+            last_bot_message_time is not None
+            and current_time - last_bot_message_time < self.min_bot_interval
+        ):
+            return SKIP
+
+        tokens = [token for message in messages for token in message.split()]
+        question = any(map(is_question, messages))
+
+        if self.weights is not None:
+            probability = self.score(tokens)
+            if probability >= self.high_threshold:
+                return RESPOND
+            if probability <= self.low_threshold and not question:
+                return SKIP
+            return ASK_LLM
+
+        if not question and len(tokens) < self.min_tokens:
+            return SKIP
+
+        return ASK_LLM
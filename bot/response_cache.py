@@ -0,0 +1,171 @@
+import functools
+import hashlib
+import re
+import struct
+import time
+from collections import OrderedDict
+from operator import eq
+from .metrics import CACHE_ENTRIES, CACHE_LOOKUP_SECONDS, CACHE_REQUESTS
+
+# Слова нормализованного текста (знаки препинания в ключ не входят)
+_WORD_RE = re.compile(r"\w+")
+
+# Уровни кеша в метриках
+EXACT = "exact"
+APPROXIMATE = "approximate"
+MISS = "miss"
+
+
+def normalize_context(messages):
+    """
+    Ключ кеша по последним сообщениям истории.
+
+    Сообщения уже обработаны RussianProcessor.process (нижний регистр,
+    токены через пробел); из них остаются только слова. Имена участников в
+    ключ не входят, а сообщения бота помечаются, чтобы ответ на вопрос не
+    совпадал с ответом на собственную реплику бота.
+    """
+    lines = []
+    for message in messages:
+        words = " ".join(_WORD_RE.findall(message.message))
+        lines.append(f"bot: {words}" if message.user == "Bot" else words)
+    return "\n".join(lines)
+
+
+class _Entry:
+    __slots__ = ("key", "signature", "value", "expires")
+
+    def __init__(self, key, signature, value, expires):
+        self.key = key
+        self.signature = signature
+        self.value = value
+        self.expires = expires
+
+
+class ResponseCache:
+    """
+    Кеш решений и ответов LLM для повторяющихся вопросов.
+
+    Два уровня: точное совпадение нормализованного контекста и приближённое -
+    по оценке сходства Жаккара символьных n-грамм через MinHash. Вместо
+    num_perm независимых хеш-функций каждая n-грамма хешируется один раз
+    BLAKE2b, и дайджест делится на num_perm 16-битных значений (поэтому
+    num_perm не больше 32). Кандидаты для приближённого поиска отбираются LSH:
+    подпись делится на bands полос, и записи с совпадающей полосой попадают в
+    одну корзину. Записи разделены по виду (решение, ответ) и области (чат или
+    весь бот), живут не дольше ttl и вытесняются по LRU при превышении
+    max_entries.
+    """
+
+    def __init__(
+        self,
+        max_entries,
+        ttl,
+        threshold=0.8,
+        per_chat=True,
+        ngram=3,
+        num_perm=32,
+        bands=8,
+        seed=0,
+        clock=time.time,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold  # Минимальное сходство для приближённого совпадения
+        self.per_chat = per_chat  # Разделять ли записи разных чатов
+        self.ngram = ngram
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.clock = clock
+        self._hasher = hashlib.blake2b(
+            digest_size=2 * num_perm, salt=seed.to_bytes(8, "little")
+        )
+        self._unpack = struct.Struct(f"<{num_perm}H").unpack
+        # Набор n-грамм языка невелик, поэтому их хеши кешируются
+        self._gram_hashes = functools.lru_cache(maxsize=1 << 16)(self._gram_hash)
+        self._entries = OrderedDict()  # (вид, область, текст) -> _Entry, в порядке LRU
+        self._buckets = {}  # (вид, область, номер полосы, полоса) -> множество ключей
+        CACHE_ENTRIES.set_function(lambda: len(self._entries))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _key(self, kind, chat_id, text):
+        return kind, chat_id if self.per_chat else None, text
+
+    def _gram_hash(self, gram):
+        hasher = self._hasher.copy()
+        hasher.update(gram.encode("utf-8"))
+        return self._unpack(hasher.digest())
+
+    def signature(self, text):
+        """MinHash-подпись множества символьных n-грамм текста."""
+        n = self.ngram
+        grams = {text[i : i + n] for i in range(max(len(text) - n + 1, 1))}
+        return tuple(map(min, zip(*map(self._gram_hashes, grams))))
+
+    def _bands(self, key, signature):
+        kind, scope, _ = key
+        rows = self.rows
+        for band in range(self.bands):
+            yield kind, scope, band, signature[band * rows : (band + 1) * rows]
+
+    def get(self, kind, chat_id, text):
+        """
+        Поиск значения для контекста.
+
+        :return: Пара (значение или None, уровень: EXACT, APPROXIMATE или MISS).
+        """
+        started = time.perf_counter()
+        value, tier = self._get(self._key(kind, chat_id, text))
+        CACHE_LOOKUP_SECONDS.observe(time.perf_counter() - started)
+        CACHE_REQUESTS.labels(kind, tier).inc()
+        return value, tier
+
+    def _get(self, key):
+        now = self.clock()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.expires > now:
+                self._entries.move_to_end(key)
+                return entry.value, EXACT
+            self._remove(entry)
+
+        signature = self.signature(key[2])
+        candidates = set()
+        for band in self._bands(key, signature):
+            candidates.update(self._buckets.get(band, ()))
+        best, best_similarity = None, self.threshold
+        for candidate in candidates:
+            entry = self._entries[candidate]
+            if entry.expires <= now:
+                self._remove(entry)
+                continue
+            similarity = sum(map(eq, signature, entry.signature)) / len(signature)
+            if similarity >= best_similarity:
+                best, best_similarity = entry, similarity
+        if best is None:
+            return None, MISS
+        self._entries.move_to_end(best.key)
+        return best.value, APPROXIMATE
+
+    def put(self, kind, chat_id, text, value):
+        """Сохраняет значение для контекста."""
+        key = self._key(kind, chat_id, text)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._remove(entry)
+        entry = _Entry(key, self.signature(text), value, self.clock() + self.ttl)
+        self._entries[key] = entry
+        for band in self._bands(key, entry.signature):
+            self._buckets.setdefault(band, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries.values())))
+
+    def _remove(self, entry):
+        del self._entries[entry.key]
+        for band in self._bands(entry.key, entry.signature):
+            bucket = self._buckets[band]
+            bucket.discard(entry.key)
+            if not bucket:
+                del self._buckets[band]
@@ -0,0 +1,98 @@
+import asyncio
+import heapq
+import logging
+import time
+
+
+class ProactiveScheduler:
+    """
+    Планировщик проактивных сообщений на min-куче дедлайнов чатов.
+
+    Для каждого чата хранится один актуальный дедлайн; при переносе дедлайна
+    старая запись в куче не удаляется, а пропускается при извлечении. Цикл
+    спит ровно до ближайшего дедлайна или до появления более раннего, а
+    наступившие чаты передаются ограниченному пулу обработчиков.
+    """
+
+    def __init__(self, callback, workers, clock=time.time):
+        self.callback = callback  # Корутина, вызываемая с chat_id наступившего чата
+        self.workers = workers
+        self.clock = clock
+        self._heap = []  # Записи (дедлайн, номер, chat_id)
+        self._entries = {}  # chat_id -> номер актуальной записи в куче
+        self._counter = 0
+        self._wakeup = asyncio.Event()
+        self._due = asyncio.Queue(maxsize=workers)
+        self._tasks = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def schedule(self, chat_id, deadline):
+        """Назначает (или переносит) дедлайн чата."""
+        self._counter += 1
+        self._entries[chat_id] = self._counter
+        if not self._heap or deadline < self._heap[0][0]:
+            self._wakeup.set()
+        heapq.heappush(self._heap, (deadline, self._counter, chat_id))
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._compact()
+
+    def cancel(self, chat_id):
+        """Отменяет дедлайн чата."""
+        self._entries.pop(chat_id, None)
+
+    def start(self):
+        """Запуск цикла планировщика и обработчиков."""
+        self._tasks = [asyncio.create_task(self._run())]
+        self._tasks += [
+            asyncio.create_task(self._worker()) for _ in range(self.workers)
+        ]
+
+    async def stop(self):
+        """Остановка цикла планировщика и обработчиков."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _compact(self):
+        # Удаление из кучи устаревших записей
+        self._heap = [
+            entry for entry in self._heap if self._entries.get(entry[2]) == entry[1]
+        ]
+        heapq.heapify(self._heap)
+
+    async def _run(self):
+        while True:
+            now = self.clock()
+            while self._heap and self._heap[0][0] <= now:
+                _, number, chat_id = heapq.heappop(self._heap)
+                if self._entries.get(chat_id) != number:
+                    continue  # Запись устарела: дедлайн перенесён или отменён
+                del self._entries[chat_id]
+                await self._due.put(chat_id)
+
+            # Устаревшие записи на вершине кучи не должны будить цикл
+            while (
+                self._heap and self._entries.get(self._heap[0][2]) != self._heap[0][1]
+            ):
+                heapq.heappop(self._heap)
+            self._wakeup.clear()
+            timeout = self._heap[0][0] - self.clock() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self):
+        while True:
+            chat_id = await self._due.get()
+            try:
+                await self.callback(chat_id)
+            except Exception as e:
+                logging.error(
+                    f"Ошибка в проактивных сообщениях: {str(e)}", exc_info=True
+                )
+            finally:
+                self._due.task_done()
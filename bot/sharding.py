@@ -0,0 +1,248 @@
+import asyncio
+import logging
+import multiprocessing
+import queue
+import signal
+import zlib
+from functools import partial
+from telegram import Update
+from telegram.ext import Application, CommandHandler, MessageHandler, filters
+from .metrics import SHARD_DROPPED, SHARD_QUEUE_DEPTH, SHARD_UPDATES, MetricsServer
+from .telegram_handler import TelegramHandler
+from .webhook import WebhookServer
+from config import (
+    METRICS_LISTEN,
+    METRICS_PORT,
+    SHUTDOWN_DRAIN_TIMEOUT,
+    UPDATE_MODE,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_QUEUE_SIZE,
+    WEBHOOK_SECRET,
+    WEBHOOK_URL,
+    WEBHOOK_WORKERS,
+)
+
+# Максимальное ожидание запуска шардов в секундах
+START_TIMEOUT = 60
+# Запас времени на остановку шарда сверх ожидания готовящихся ответов
+STOP_MARGIN = 10
+
+
+def shard_for(chat_id, shards):
+    """Номер шарда чата; не зависит от процесса и запуска, в отличие от hash()."""
+    return zlib.crc32(str(chat_id).encode("ascii")) % shards
+
+
+def _create_handler(token, shard):
+    return TelegramHandler(token, shard=shard)
+
+
+def run_worker(token, index, shards, updates, ready, factory=None):
+    """
+    Точка входа процесса-шарда.
+
+    SIGINT игнорируется: при Ctrl+C сигнал получает вся группа процессов, а
+    остановкой шардов управляет фронтенд. SIGTERM, отправленный шарду напрямую,
+    останавливает его так же, как сигнал от фронтенда.
+
+    :param factory: Функция (token, shard), создающая TelegramHandler; должна
+        передаваться между процессами (функция уровня модуля).
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    handler = (factory or _create_handler)(token, (index, shards))
+
+    async def serve():
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGTERM, handler.request_stop
+        )
+        await handler.serve(updates, ready)
+
+    asyncio.run(serve())
+
+
+class ShardPool:
+    """
+    Процессы-шарды с очередями обновлений.
+
+    Обновление попадает в очередь шарда shard_for(chat_id), поэтому сообщения
+    одного чата обрабатываются одним процессом в порядке поступления. Очереди
+    ограничены queue_size: при переполнении submit возвращает False.
+    """
+
+    def __init__(self, token, shards, queue_size, factory=None):
+        context = multiprocessing.get_context("spawn")
+        self.shards = shards
+        self.queues = [context.Queue(queue_size) for _ in range(shards)]
+        self.ready = [context.Event() for _ in range(shards)]
+        self.processes = [
+            context.Process(
+                target=run_worker,
+                args=(token, index, shards, self.queues[index], self.ready[index]),
+                kwargs={"factory": factory},
+                name=f"shard-{index}",
+            )
+            for index in range(shards)
+        ]
+        for index, updates in enumerate(self.queues):
+            SHARD_QUEUE_DEPTH.set_function(updates.qsize, str(index))
+
+    def start(self):
+        """Запуск процессов-шардов."""
+        for process in self.processes:
+            process.start()
+
+    async def wait_ready(self, timeout=None):
+        """Ожидание готовности всех шардов; False, если не дождались."""
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *(loop.run_in_executor(None, event.wait, timeout) for event in self.ready)
+        )
+        return all(results)
+
+    def submit(self, chat_id, kind, data):
+        """
+        Передача обновления шарду чата.
+
+        :param kind: "start" для команды /start, "message" для сообщения.
+        :param data: Обновление в виде словаря (Update.to_dict()).
+        :return: False, если очередь шарда заполнена и обновление отброшено.
+        """
+        index = shard_for(chat_id, self.shards)
+        try:
+            self.queues[index].put_nowait((kind, data))
+        except queue.Full:
+            SHARD_DROPPED.inc()
+            return False
+        SHARD_UPDATES.labels(str(index)).inc()
+        return True
+
+    async def stop(self, timeout):
+        """
+        Остановка шардов: после уже переданных обновлений в очередь ставится
+        None, и шард завершается, дождавшись готовящихся ответов. Шарды, не
+        завершившиеся за timeout секунд, останавливаются принудительно.
+        """
+        loop = asyncio.get_running_loop()
+        running = [process for process in self.processes if process.is_alive()]
+        for index, process in enumerate(self.processes):
+            if process.is_alive():
+                try:
+                    await loop.run_in_executor(
+                        None, partial(self.queues[index].put, None, timeout=timeout)
+                    )
+                except queue.Full:
+                    pass  # Шард не разбирает очередь и будет остановлен ниже
+        await asyncio.gather(
+            *(loop.run_in_executor(None, process.join, timeout) for process in running)
+        )
+        for process in running:
+            if process.is_alive():
+                logging.warning(f"Шард {process.name} не остановился, завершение")
+                process.terminate()
+                await loop.run_in_executor(None, process.join)
+
+
+class ShardedRunner:
+    """
+    Фронтенд многопроцессного режима.
+
+    Принимает обновления (long polling или вебхук) и передаёт их процессам-
+    шардам по chat_id; каждый шард работает со своим TelegramHandler и
+    DecisionMaker. Обновления фронтенд обрабатывает последовательно, чтобы не
+    нарушить их порядок. Интерфейс запуска и остановки такой же, как у
+    TelegramHandler.
+    """
+
+    def __init__(self, token, shards, queue_size, factory=None):
+        self.application = Application.builder().token(token).build()
+        self.bot = self.application.bot
+        self.pool = ShardPool(token, shards, queue_size, factory)
+        self.webhook = (
+            WebhookServer(
+                self.application,
+                WEBHOOK_LISTEN,
+                WEBHOOK_PORT,
+                WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                queue_size=WEBHOOK_QUEUE_SIZE,
+                workers=WEBHOOK_WORKERS,
+            )
+            if UPDATE_MODE == "webhook"
+            else None
+        )
+        self.metrics_server = (
+            MetricsServer(METRICS_LISTEN, METRICS_PORT) if METRICS_PORT else None
+        )
+        self._is_running = False
+        self._stop_event = asyncio.Event()
+
+    async def route_start(self, update: Update, context):
+        self._submit(update, "start")
+
+    async def route_message(self, update: Update, context):
+        self._submit(update, "message")
+
+    def _submit(self, update, kind):
+        if not self.pool.submit(update.effective_chat.id, kind, update.to_dict()):
+            logging.warning(
+                f"Очередь шарда чата {update.effective_chat.id} заполнена, "
+                "обновление отброшено"
+            )
+
+    async def start(self):
+        # Запуск шардов, затем приёма обновлений
+        self.application.add_handler(CommandHandler("start", self.route_start))
+        self.application.add_handler(
+            MessageHandler(filters.TEXT & ~filters.COMMAND, self.route_message)
+        )
+
+        logging.info(f"Запуск {self.pool.shards} шардов...")
+        self.pool.start()
+        self._is_running = True
+        try:
+            if not await self.pool.wait_ready(START_TIMEOUT):
+                raise RuntimeError("Шарды не запустились")
+            await self.application.initialize()
+            await self.application.start()
+            if self.metrics_server is not None:
+                await self.metrics_server.start()
+
+            if UPDATE_MODE == "webhook":
+                await self.webhook.start()
+                await self.bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
+            else:
+                await self.application.updater.start_polling()
+            logging.info("Бот работает. Нажмите Ctrl+C для остановки.")
+
+            await self._stop_event.wait()
+        finally:
+            await self.stop()
+
+    def request_stop(self):
+        # Запрос остановки (например, из обработчика сигнала)
+        self._stop_event.set()
+
+    async def stop(self):
+        # Остановка приёма обновлений, затем шардов
+        if not self._is_running:
+            logging.info("Бот не работает.")
+            return
+        logging.info("Остановка бота...")
+        self._is_running = False
+        self._stop_event.set()
+
+        if self.webhook is not None:
+            await self.webhook.stop()
+        if self.application.updater.running:
+            await self.application.updater.stop()
+
+        await self.pool.stop(SHUTDOWN_DRAIN_TIMEOUT + STOP_MARGIN)
+
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        if self.application.running:
+            await self.application.stop()
+        await self.application.shutdown()
+        logging.info("Бот остановлен.")
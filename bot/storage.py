@@ -0,0 +1,302 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+from collections import OrderedDict, deque
+
+
+class Storage:
+    """
+    Базовый класс постоянного хранилища истории чатов.
+
+    Запись не блокирует цикл событий: append только добавляет сообщение в буфер,
+    а фоновая задача периодически сбрасывает накопленные сообщения пачкой в
+    отдельном потоке. Наследники реализуют методы _open, _write_batch,
+    _load_recent и _close, которые выполняются вне цикла событий.
+    """
+
+    def __init__(self, path, batch_size=100, flush_interval=1.0):
+        self.path = path
+        # Размер пачки, при котором запись начинается сразу
+        self.batch_size = batch_size
+        # Максимальная задержка записи в секундах
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._flush_requested = asyncio.Event()
+        self._writer_task = None
+        self._closing = False
+
+    async def open(self):
+        """Открытие хранилища и запуск фоновой записи."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        await asyncio.to_thread(self._open)
+        self._writer_task = asyncio.create_task(self._writer())
+
+    async def load_recent(self, limit):
+        """
+        Восстановление последних сообщений каждого чата.
+
+        :param limit: Максимальное число сообщений на чат.
+        :return: Словарь chat_id -> список (user, message, timestamp) по времени.
+        """
+        return await asyncio.to_thread(self._load_recent, limit)
+
+    def append(self, chat_id, user, message, timestamp):
+        """Добавление сообщения в очередь на запись."""
+        self._buffer.append((chat_id, user, message, timestamp))
+        if len(self._buffer) >= self.batch_size:
+            self._flush_requested.set()
+
+    async def flush(self):
+        """Запись всех накопленных сообщений."""
+        while self._buffer:
+            batch, self._buffer = self._buffer, []
+            await asyncio.to_thread(self._write_batch, batch)
+
+    async def close(self):
+        """Остановка фоновой записи, сброс буфера и закрытие хранилища."""
+        if self._writer_task is not None:
+            # Дожидаемся текущей записи, чтобы пачки не писались параллельно
+            self._closing = True
+            self._flush_requested.set()
+            await self._writer_task
+            self._writer_task = None
+        await self.flush()
+        await asyncio.to_thread(self._close)
+
+    async def _writer(self):
+        # Фоновая запись: по заполнении пачки или не реже flush_interval
+        while not self._closing:
+            try:
+                await asyncio.wait_for(
+                    self._flush_requested.wait(), timeout=self.flush_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Ошибка записи истории: {str(e)}", exc_info=True)
+
+    def _open(self):
+        raise NotImplementedError
+
+    def _write_batch(self, batch):
+        raise NotImplementedError
+
+    def _load_recent(self, limit):
+        raise NotImplementedError
+
+    def _close(self):
+        raise NotImplementedError
+
+
+class AppendLogStorage(Storage):
+    """
+    Хранилище в виде журнала JSON Lines, в который только дописываются записи.
+
+    Каждая пачка записывается с fsync. При закрытии и периодически рядом с
+    журналом атомарно сохраняется снимок последних сообщений каждого чата
+    вместе со смещением в журнале. При запуске читается снимок и только хвост
+    журнала после него, а не весь журнал. Последняя строка без перевода строки
+    (сбой во время записи) отрезается, повреждённые полные строки
+    пропускаются.
+
+    В памяти хранятся последние сообщения не более max_chats чатов, давно не
+    писавшие чаты вытесняются. Снимок пишется не чаще раза в snapshot_interval
+    записей и не чаще, чем раз в столько записей, сколько сообщений он может
+    содержать, поэтому на каждую запись в журнал приходится не больше одного
+    повторно сохранённого сообщения.
+    """
+
+    def __init__(
+        self, path, recent_limit, max_chats=None, snapshot_interval=10000, **kwargs
+    ):
+        super().__init__(path, **kwargs)
+        self.snapshot_path = f"{path}.snapshot"
+        self.recent_limit = recent_limit
+        self.max_chats = max_chats
+        self.snapshot_interval = snapshot_interval
+        self._file = None
+        # Последние сообщения чатов, от давно не писавших к недавним
+        self._recent = OrderedDict()
+        self._since_snapshot = 0
+
+    def _remember(self, chat_id, record):
+        records = self._recent.get(chat_id)
+        if records is None:
+            records = self._recent[chat_id] = deque(maxlen=self.recent_limit)
+            if self.max_chats is not None and len(self._recent) > self.max_chats:
+                self._recent.popitem(last=False)
+        else:
+            self._recent.move_to_end(chat_id)
+        records.append(record)
+
+    def _open(self):
+        offset = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+            offset = snapshot["offset"]
+            for chat_id, records in snapshot["chats"]:
+                for record in records:
+                    self._remember(chat_id, tuple(record))
+
+        valid_end = offset
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        logging.warning("Отрезана неполная запись в конце журнала")
+                        break
+                    valid_end += len(line)
+                    try:
+                        chat_id, user, message, timestamp = json.loads(line)
+                    except ValueError:
+                        logging.warning("Пропущена повреждённая запись в журнале")
+                        continue
+                    self._remember(chat_id, (user, message, timestamp))
+                    self._since_snapshot += 1
+
+        self._file = open(self.path, "ab")
+        if self._file.tell() > valid_end:
+            # Обрезаем неполную запись, оставшуюся после сбоя; полные строки
+            # до неё уже прочитаны. truncate не сдвигает позицию файла, а по
+            # ней снимок запоминает смещение журнала
+            self._file.truncate(valid_end)
+            self._file.seek(valid_end)
+
+    def _write_batch(self, batch):
+        lines = []
+        for chat_id, user, message, timestamp in batch:
+            lines.append(
+                json.dumps([chat_id, user, message, timestamp], ensure_ascii=False)
+            )
+            self._remember(chat_id, (user, message, timestamp))
+        self._file.write(("\n".join(lines) + "\n").encode("utf-8"))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+        self._since_snapshot += len(batch)
+        capacity = len(self._recent) * self.recent_limit
+        if self._since_snapshot >= max(self.snapshot_interval, capacity):
+            self._write_snapshot()
+
+    def _write_snapshot(self):
+        snapshot = {
+            "offset": self._file.tell(),
+            "chats": [
+                [chat_id, list(records)] for chat_id, records in self._recent.items()
+            ],
+        }
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        self._since_snapshot = 0
+
+    def _load_recent(self, limit):
+        return {
+            chat_id: list(records)[-limit:] for chat_id, records in self._recent.items()
+        }
+
+    def _close(self):
+        if self._file is not None:
+            self._write_snapshot()
+            self._file.close()
+            self._file = None
+
+
+class SQLiteStorage(Storage):
+    """
+    Хранилище в SQLite в режиме WAL.
+
+    Пачка сообщений записывается одной транзакцией. Последние сообщения каждого
+    чата восстанавливаются по индексу (chat_id, id) без чтения всей таблицы.
+    """
+
+    def __init__(self, path, **kwargs):
+        super().__init__(path, **kwargs)
+        self._connection = None
+
+    def _open(self):
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "id INTEGER PRIMARY KEY, chat_id INTEGER NOT NULL, "
+                "user TEXT NOT NULL, message TEXT NOT NULL, timestamp REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS messages_chat_id "
+                "ON messages (chat_id, id)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS chats (chat_id INTEGER PRIMARY KEY)"
+            )
+
+    def _write_batch(self, batch):
+        with self._connection:
+            self._connection.executemany(
+                "INSERT INTO messages (chat_id, user, message, timestamp) "
+                "VALUES (?, ?, ?, ?)",
+                batch,
+            )
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO chats (chat_id) VALUES (?)",
+                {(record[0],) for record in batch},
+            )
+
+    def _load_recent(self, limit):
+        recent = {}
+        chat_ids = [
+            row[0] for row in self._connection.execute("SELECT chat_id FROM chats")
+        ]
+        for chat_id in chat_ids:
+            rows = self._connection.execute(
+                "SELECT user, message, timestamp FROM messages "
+                "WHERE chat_id = ? ORDER BY id DESC LIMIT ?",
+                (chat_id, limit),
+            ).fetchall()
+            rows.reverse()
+            recent[chat_id] = rows
+        return recent
+
+    def _close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def create_storage(
+    backend, path, recent_limit, batch_size, flush_interval, max_chats=None
+):
+    """
+    Создание хранилища по названию бэкенда.
+
+    :param backend: "log", "sqlite" или None (без хранения).
+    :param max_chats: Максимальное число чатов в памяти журнала ("log").
+    :return: Экземпляр Storage или None.
+    """
+    if not backend:
+        return None
+    if backend == "log":
+        return AppendLogStorage(
+            path,
+            recent_limit,
+            max_chats=max_chats,
+            batch_size=batch_size,
+            flush_interval=flush_interval,
+        )
+    if backend == "sqlite":
+        return SQLiteStorage(path, batch_size=batch_size, flush_interval=flush_interval)
+    raise ValueError(f"Неизвестный бэкенд хранилища: {backend}")
@@ -1,38 +1,200 @@
 import logging
 import asyncio
+import os
+import queue
 import time
+from contextlib import aclosing
+from functools import partial
 from regex import B
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters
+from .chat_state import ChatStateStore
 from .decision_maker import DecisionMaker
-from config import RESPONSE_DELAY
+from .dispatcher import PROACTIVE, OutboundDispatcher
+from .metrics import (
+    CHATS,
+    HISTORY_BYTES,
+    PREFILTER_VERDICTS,
+    STAGE_SECONDS,
+    MetricsServer,
+)
+from .pre_filter import ASK_LLM, RESPOND, SKIP, PreFilter
+from .scheduler import ProactiveScheduler
+from .storage import create_storage
+from .webhook import WebhookServer
+from config import (
+    CHAT_IDLE_TTL,
+    HISTORY_SIZE,
+    MAX_CHATS,
+    MAX_MESSAGE_LENGTH,
+    MAX_STATE_MEMORY,
+    METRICS_LISTEN,
+    METRICS_PORT,
+    OUTBOUND_CHAT_BURST,
+    OUTBOUND_CHAT_RATE,
+    OUTBOUND_GLOBAL_BURST,
+    OUTBOUND_GLOBAL_RATE,
+    OUTBOUND_MAX_RETRIES,
+    OUTBOUND_QUEUE_SIZE,
+    PREFILTER_ENABLED,
+    PREFILTER_MIN_BOT_INTERVAL,
+    PREFILTER_MIN_TOKENS,
+    PREFILTER_MODEL_PATH,
+    PREFILTER_THRESHOLDS,
+    PROACTIVE_WORKERS,
+    SHARD_POLL_INTERVAL,
+    SHUTDOWN_DRAIN_TIMEOUT,
+    COALESCE_MAX_DELAY,
+    COALESCE_WINDOW,
+    CONTEXT_RECENT_MESSAGES,
+    RESPONSE_DELAY,
+    STORAGE_BACKEND,
+    STORAGE_BATCH_SIZE,
+    STORAGE_FLUSH_INTERVAL,
+    STORAGE_PATH,
+    STREAM_EDIT_INTERVAL,
+    STREAMING_REPLIES,
+    SUMMARY_BATCH,
+    UPDATE_MODE,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_QUEUE_SIZE,
+    WEBHOOK_SECRET,
+    WEBHOOK_URL,
+    WEBHOOK_WORKERS,
+)
 from language.russian_processor import RussianProcessor
 
 
+def limit_length(text, max_length=MAX_MESSAGE_LENGTH):
+    """Обрезает текст до max_length символов, по возможности по границе слова."""
+    if len(text) <= max_length:
+        return text
+    cut = text[: max_length - 1]
+    space = cut.rfind(" ")
+    if space > max_length // 2:
+        cut = cut[:space]
+    return cut.rstrip(" ,;:-") + "…"
+
+
+def _next_updates(updates, timeout, limit=100):
+    # Чтение из очереди фронтенда: ожидание первого обновления не дольше timeout
+    # и все уже поступившие следом, но не больше limit
+    try:
+        batch = [updates.get(timeout=timeout)]
+    except queue.Empty:
+        return []
+    try:
+        while len(batch) < limit and batch[-1] is not None:
+            batch.append(updates.get_nowait())
+    except queue.Empty:
+        pass
+    return batch
+
+
 class TelegramHandler:
-    def __init__(self, token):
-        # Инициализация приложения Telegram с помощью предоставленного токена
-        self.application = Application.builder().token(token).build()
-        self.decision_maker = DecisionMaker()
+    def __init__(self, token, decision_maker=None, bot=None, shard=None):
+        # Инициализация приложения Telegram с помощью предоставленного токена.
+        # Обновления обрабатываются параллельно, чтобы ожидание LLM в одном чате
+        # не задерживало остальные. shard - пара (номер, число шардов) в
+        # многопроцессном режиме (см. bot/sharding.py)
+        self.application = (
+            Application.builder().token(token).concurrent_updates(True).build()
+        )
+        # decision_maker и bot можно подменить, например, для офлайн-бенчмарков
+        self.bot = bot or self.application.bot
+        self.decision_maker = decision_maker or DecisionMaker()
         self.russian_processor = RussianProcessor()
+        # Локальный фильтр, отсекающий очевидные случаи до запроса к LLM
+        self.pre_filter = (
+            PreFilter(
+                min_bot_interval=PREFILTER_MIN_BOT_INTERVAL,
+                min_tokens=PREFILTER_MIN_TOKENS,
+                model_path=PREFILTER_MODEL_PATH,
+                thresholds=PREFILTER_THRESHOLDS,
+            )
+            if PREFILTER_ENABLED
+            else None
+        )
+        self.shard = shard
+        index, shards = shard or (None, 1)
         self._is_running = False
         self._stop_event = asyncio.Event()
-        self.conversation_history = []  # История сообщений
-        self.last_human_message_time = (
-            time.time()
-        )  # Время последнего сообщения от человека
-        self.last_bot_message_time = time.time()  # Время последнего сообщения от бота
-        self.current_time = time.time()
-        self.group_chat_id = None
-        self.proactive_messaging_task = None
+        # Состояния групповых чатов (история и таймеры) по chat_id
+        self.chat_states = ChatStateStore(
+            history_size=HISTORY_SIZE,
+            max_chats=MAX_CHATS,
+            idle_ttl=CHAT_IDLE_TTL,
+            max_memory=MAX_STATE_MEMORY,
+        )
+        # Постоянное хранилище истории (None - история хранится только в памяти)
+        storage_path = STORAGE_PATH
+        if shard is not None:
+            root, ext = os.path.splitext(STORAGE_PATH)
+            storage_path = f"{root}.{index}{ext}"
+        self.storage = create_storage(
+            STORAGE_BACKEND,
+            storage_path,
+            recent_limit=HISTORY_SIZE,
+            batch_size=STORAGE_BATCH_SIZE,
+            flush_interval=STORAGE_FLUSH_INTERVAL,
+            max_chats=MAX_CHATS,
+        )
+        # Приём обновлений через вебхук (в режиме polling не используется)
+        self.webhook = (
+            WebhookServer(
+                self.application,
+                WEBHOOK_LISTEN,
+                WEBHOOK_PORT,
+                WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                queue_size=WEBHOOK_QUEUE_SIZE,
+                workers=WEBHOOK_WORKERS,
+            )
+            if UPDATE_MODE == "webhook" and shard is None
+            else None
+        )
+        # Метрики в формате Prometheus (None - эндпоинт отключён); порт
+        # METRICS_PORT занимает фронтенд многопроцессного режима
+        self.metrics_server = (
+            MetricsServer(
+                METRICS_LISTEN,
+                METRICS_PORT if shard is None else METRICS_PORT + 1 + index,
+            )
+            if METRICS_PORT
+            else None
+        )
+        CHATS.set_function(lambda: len(self.chat_states))
+        HISTORY_BYTES.set_function(lambda: self.chat_states.memory)
+        # Планировщик проактивных сообщений по дедлайнам чатов
+        self.scheduler = ProactiveScheduler(
+            self.proactive_messaging, workers=PROACTIVE_WORKERS
+        )
+        # Очередь исходящих сообщений с ограничением частоты. Лимит на бота
+        # делится поровну между шардами, лимиты чатов - нет: чат всегда
+        # обслуживается одним шардом
+        self.outbound = OutboundDispatcher(
+            global_rate=OUTBOUND_GLOBAL_RATE / shards,
+            global_burst=OUTBOUND_GLOBAL_BURST,
+            chat_rate=OUTBOUND_CHAT_RATE,
+            chat_burst=OUTBOUND_CHAT_BURST,
+            queue_size=OUTBOUND_QUEUE_SIZE,
+            max_retries=OUTBOUND_MAX_RETRIES,
+        )
 
     async def start_command(self, update: Update, context):
         # Обработка команды /start
-        self.group_chat_id = update.effective_chat.id
-        await update.message.reply_text(
-            "Бот запущен и готов к работе в групповом чате!"
+        chat_id = update.effective_chat.id
+        self.chat_states.get_or_create(chat_id)
+        await self.outbound.send(
+            chat_id,
+            partial(
+                update.message.reply_text,
+                "Бот запущен и готов к работе в групповом чате!",
+            ),
         )
-        logging.info(f"Bot started in chat ID: {self.group_chat_id}")
+        logging.info(f"Bot started in chat ID: {chat_id}")
 
     async def handle_message(self, update: Update, context):
         # Обработка текстовых сообщений
@@ -52,73 +214,341 @@ class TelegramHandler:
             )
             return
 
-        self.group_chat_id = update.effective_chat.id
+        state = self.chat_states.get_or_create(update.effective_chat.id)
+
+        with STAGE_SECONDS.labels("process").time():
+            processed_message = self.russian_processor.process(message)
 
-        processed_message = self.russian_processor.process(message)
+        # Добавление сообщения в историю чата
+        self._add_message(state, user, processed_message, time.time())
+        state.burst_messages += 1
+        state.addressed = state.addressed or self._is_addressed(update)
 
-        # Добавление сообщения в историю
-        self.conversation_history.append({"user": user, "message": processed_message})
-        # Хранить только последние 20 сообщений
-        self.conversation_history = self.conversation_history[-20:]
+        self._schedule_reply(state, update, user)
 
-        # Обновление времени последнего сообщения от человека
-        self.last_human_message_time = time.time()
+    def _add_message(self, state, user, message, timestamp, persist=True):
+        # Добавление сообщения в историю чата с обновлением таймеров и сохранением
+        self.chat_states.add_message(state, user, message)
+        if user == "Bot":
+            state.last_bot_message_time = timestamp
+            state.bot_spoke = True
+            # Бот уже ответил; проактивное сообщение не нужно до новых сообщений
+            self.scheduler.cancel(state.chat_id)
+        else:
+            state.last_human_message_time = timestamp
+            self._schedule_initiation(state)
+        if persist:
+            self._schedule_summary(state)
+            if self.storage is not None:
+                self.storage.append(state.chat_id, user, message, timestamp)
+
+    def _schedule_summary(self, state):
+        # Фоновое обновление сводки, когда из окна последних сообщений вышло
+        # SUMMARY_BATCH сообщений; подготовка ответов его не ждёт
+        if state.summarizing is not None and not state.summarizing.done():
+            return
+        outside = state.message_count - CONTEXT_RECENT_MESSAGES - state.summarized
+        if outside >= SUMMARY_BATCH:
+            state.summarizing = asyncio.create_task(self._update_summary(state))
+
+    async def _update_summary(self, state):
+        # Добавление в сводку сообщений, вышедших из окна последних сообщений
+        history = state.conversation_history
+        first = state.message_count - len(history)  # Номер самого старого сообщения
+        end = state.message_count - CONTEXT_RECENT_MESSAGES
+        start = max(state.summarized, first)
+        if start > state.summarized:
+            logging.debug(
+                "В чате %s %s сообщений вытеснены из истории до обновления сводки",
+                state.chat_id,
+                start - state.summarized,
+            )
+        messages = [history[index - first] for index in range(start, end)]
+        if not messages:
+            self.chat_states.set_summary(state, state.summary, end)
+            return
+        summary = await self.decision_maker.summarize(state.summary, messages)
+        if summary is not None:
+            self.chat_states.set_summary(state, summary, end)
 
-        should_respond = await self.decision_maker.should_respond(
-            self.conversation_history, self.current_time, self.last_bot_message_time
+    async def restore_history(self):
+        # Восстановление последних сообщений чатов из хранилища после перезапуска
+        recent = await self.storage.load_recent(HISTORY_SIZE)
+        for chat_id, records in recent.items():
+            state = self.chat_states.get_or_create(chat_id)
+            for user, message, timestamp in records:
+                self._add_message(state, user, message, timestamp, persist=False)
+        logging.info(f"Восстановлена история {len(recent)} чатов")
+
+    def _is_addressed(self, update: Update):
+        # Обращение к боту: упоминание @username или ответ на сообщение бота
+        bot = self.bot
+        reply_to = update.message.reply_to_message
+        if reply_to and reply_to.from_user and reply_to.from_user.id == bot.id:
+            return True
+        return f"@{bot.username}".lower() in update.message.text.lower()
+
+    def _schedule_reply(self, state, update, user):
+        # Откладывает решение об ответе до паузы в сообщениях чата. Каждое новое
+        # сообщение отменяет ожидающий ответ и перезапускает окно ожидания, но не
+        # дольше COALESCE_MAX_DELAY с начала серии сообщений. После этого срока
+        # решение по серии больше не отменяется, а новые сообщения начинают
+        # следующую серию, ответ на которую готовится после текущего.
+        now = time.time()
+        pending = state.pending_reply
+        if pending is not None and not pending.done():
+            if now < state.burst_started + COALESCE_MAX_DELAY:
+                pending.cancel()
+            else:
+                self._commit_reply(state, pending)
+                state.burst_started = now
+        else:
+            state.burst_started = now
+
+        delay = min(COALESCE_WINDOW, state.burst_started + COALESCE_MAX_DELAY - now)
+        state.pending_reply = asyncio.create_task(
+            self._reply_after_quiet(state, update, user, max(delay, 0))
         )
 
-        logging.info(f"Решение ответить: {should_respond}")
+    def _commit_reply(self, state, task=None):
+        # Задача ответа (по умолчанию текущая) больше не отменяется новыми
+        # сообщениями; в чате есть не больше одной такой задачи и одной
+        # ожидающей, которая начнёт решение после неё
+        task = task or asyncio.current_task()
+        if state.pending_reply is task:
+            state.pending_reply = None
+        state.replying = task
+
+    async def _reply_after_quiet(self, state, update, user, delay):
+        # Принятие решения и ответ на всю накопленную серию сообщений
+        burst_messages, addressed = 0, False
+        try:
+            await asyncio.sleep(delay)
+            previous = state.replying
+            if previous is not None and previous is not asyncio.current_task():
+                # asyncio.wait, в отличие от gather, не отменяет previous при
+                # отмене этой задачи
+                await asyncio.wait([previous])
+
+            # _decide сбрасывает серию; при отмене она вернётся в состояние
+            burst_messages, addressed = state.burst_messages, state.addressed
+            with STAGE_SECONDS.labels("decide").time():
+                should_respond, response = await self._decide(state, user)
+
+            logging.info(f"Решение ответить: {should_respond}")
+
+            if should_respond:
+                if response is None:
+                    # Потоковый режим: текст генерируется во время отправки
+                    with STAGE_SECONDS.labels("reply").time():
+                        response = await self._stream_reply(state, update, user)
+                else:
+                    with STAGE_SECONDS.labels("delay").time():
+                        # Небольшая задержка перед ответом
+                        await asyncio.sleep(RESPONSE_DELAY)
+                    # С этого момента ответ не отменяется новыми сообщениями
+                    self._commit_reply(state)
+                    response = limit_length(response)
+                    with STAGE_SECONDS.labels("reply").time():
+                        await self.outbound.send(
+                            state.chat_id,
+                            partial(update.message.reply_text, response),
+                        )
+                if response:
+                    logging.info(f"Бот ответил в групповом чате")
+                    # Добавление ответа бота в историю
+                    self._add_message(state, "Bot", response, time.time())
+        except asyncio.CancelledError:
+            logging.debug("Ответ в чате %s отменён новыми сообщениями", state.chat_id)
+            if state.replying is not asyncio.current_task():
+                # Следующее решение учтёт и сообщения отменённой серии
+                state.burst_messages += burst_messages
+                state.addressed = state.addressed or addressed
+        except Exception as e:
+            logging.error(f"Ошибка при ответе в чате: {str(e)}", exc_info=True)
+        finally:
+            if state.replying is asyncio.current_task():
+                state.replying = None
+
+    async def _stream_reply(self, state, update, user):
+        # Потоковый ответ. Генерация начинается сразу и идёт во время задержки
+        # RESPONSE_DELAY; первый фрагмент отправляется по её окончании, затем
+        # сообщение редактируется не чаще раза в STREAM_EDIT_INTERVAL секунд.
+        # Текст сверх MAX_MESSAGE_LENGTH не показывается, поэтому генерация
+        # на нём прерывается.
+        started = time.monotonic()
+        text = shown = ""
+        sent = None
+        last_edit = 0.0
+        chunks = self.decision_maker.stream_response(
+            state.conversation_history,
+            target_user=user,
+            summary=state.summary,
+            chat_id=state.chat_id,
+        )
+        async with aclosing(chunks):
+            async for chunk in chunks:
+                text += chunk
+                if len(text) > MAX_MESSAGE_LENGTH:
+                    break
+                if sent is None:
+                    if not text.strip():
+                        continue
+                    await asyncio.sleep(started + RESPONSE_DELAY - time.monotonic())
+                    # С этого момента ответ не отменяется новыми сообщениями
+                    self._commit_reply(state)
+                    shown = text.strip()
+                    sent = await self.outbound.send(
+                        state.chat_id, partial(update.message.reply_text, shown)
+                    )
+                    last_edit = time.monotonic()
+                    STAGE_SECONDS.labels("first_text").observe(last_edit - started)
+                elif time.monotonic() - last_edit >= STREAM_EDIT_INTERVAL:
+                    if text.strip() != shown:
+                        shown = text.strip()
+                        await self.outbound.send(
+                            state.chat_id, partial(sent.edit_text, shown)
+                        )
+                        last_edit = time.monotonic()
+
+        final = limit_length(text.strip())
+        if not final:
+            return None
+        if sent is None:
+            await asyncio.sleep(started + RESPONSE_DELAY - time.monotonic())
+            self._commit_reply(state)
+            await self.outbound.send(
+                state.chat_id, partial(update.message.reply_text, final)
+            )
+            STAGE_SECONDS.labels("first_text").observe(time.monotonic() - started)
+        elif final != shown:
+            await asyncio.sleep(last_edit + STREAM_EDIT_INTERVAL - time.monotonic())
+            await self.outbound.send(state.chat_id, partial(sent.edit_text, final))
+        return final
+
+    async def _decide(self, state, user):
+        # Решение об ответе: сначала локальный фильтр, затем при необходимости LLM
+        history = state.conversation_history
+        if not history or history[-1].user == "Bot":
+            return False, None
+
+        current_time = time.time()
+        verdict = ASK_LLM
+        if self.pre_filter is not None:
+            # Фильтр оценивает всю серию сообщений, накопленную до решения
+            burst = [
+                message.message
+                for message in history.last(max(state.burst_messages, 1))
+                if message.user != "Bot"
+            ]
+            verdict = self.pre_filter.check(
+                burst,
+                state.addressed,
+                current_time,
+                state.last_bot_message_time if state.bot_spoke else None,
+            )
+            state.addressed = False
+            PREFILTER_VERDICTS.labels(verdict).inc()
+            logging.debug("Вердикт предварительного фильтра: %s", verdict)
+        state.burst_messages = 0
 
-        if should_respond:
-            await asyncio.sleep(RESPONSE_DELAY)  # Небольшая задержка перед ответом
+        if verdict == SKIP:
+            return False, None
+        if STREAMING_REPLIES:
+            # Текст ответа будет сгенерирован потоково при отправке
+            if verdict == RESPOND:
+                return True, None
+            should_respond = await self.decision_maker.should_respond(
+                history,
+                current_time,
+                state.last_bot_message_time,
+                summary=state.summary,
+                chat_id=state.chat_id,
+            )
+            return should_respond, None
+        if verdict == RESPOND:
             response = await self.decision_maker.generate_response(
-                self.conversation_history, target_user=user
+                history, target_user=user, summary=state.summary, chat_id=state.chat_id
+            )
+            return response is not None, response
+        return await self.decision_maker.decide_and_generate(
+            history,
+            current_time,
+            state.last_bot_message_time,
+            target_user=user,
+            summary=state.summary,
+            chat_id=state.chat_id,
+        )
+
+    async def proactive_messaging(self, chat_id):
+        # Обработка наступившего дедлайна проактивного сообщения в чате
+        state = self.chat_states.get(chat_id)
+        if state is None:
+            return  # Чат вытеснен из памяти
+        if state.in_flight:
+            # В чате идёт обработка сообщений; проверим позже
+            self.scheduler.schedule(
+                chat_id, time.time() + self.decision_maker.min_human_response_time
             )
-            await update.message.reply_text(response)
-            logging.info(f"Бот ответил в групповом чате")
-            # Добавление ответа бота в историю
-            self.conversation_history.append({"user": "Bot", "message": response})
-            # Обновление времени последнего сообщения от бота
-            self.last_bot_message_time = time.time()
-
-    async def proactive_messaging(self):
-        # Цикл проактивных сообщений
-        logging.info("Запущен цикл проактивных сообщений")
-        while self._is_running:
+            return
+        await self.proactive_message(state)
+
+    async def proactive_message(self, state):
+        # Проверка и отправка проактивного сообщения в один чат
+        current_time = time.time()
+        should_initiate = await self.decision_maker.should_initiate(
+            current_time,
+            state.last_human_message_time,
+            state.last_bot_message_time,
+        )
+        logging.debug(
+            "Нужно ли инициировать проактивное сообщение в чате %s: %s",
+            state.chat_id,
+            should_initiate,
+        )
+
+        if not should_initiate:
+            self._schedule_initiation(state)
+            return
+
+        message = await self.decision_maker.initiate_conversation(
+            state.conversation_history, summary=state.summary
+        )
+        if not isinstance(message, bool):
+            message = limit_length(message)
             try:
-                current_time = time.time()
-                should_initiate = await self.decision_maker.should_initiate(
-                    current_time,
-                    self.last_human_message_time,
-                    self.last_bot_message_time,
+                await self.outbound.send(
+                    state.chat_id,
+                    partial(self.bot.send_message, chat_id=state.chat_id, text=message),
+                    PROACTIVE,
                 )
-                logging.info(
-                    f"Нужно ли инициировать проактивное сообщение: {should_initiate}"
+            except asyncio.QueueFull:
+                logging.warning(
+                    "Очередь исходящих переполнена, проактивное сообщение в чат %s "
+                    "отложено",
+                    state.chat_id,
                 )
+            else:
+                self._add_message(state, "Bot", message, current_time)
+                logging.info(f"Бот инициировал разговор: {message}")
+                return
+        else:
+            logging.info("Бот не ответил в групповом чате")
+        # Повторная попытка позже, иначе чат выпадет из планировщика до
+        # нового сообщения
+        self.scheduler.schedule(
+            state.chat_id,
+            current_time + self.decision_maker.min_human_response_time,
+        )
 
-                if should_initiate and self.group_chat_id:
-                    message = await self.decision_maker.initiate_conversation(
-                        self.conversation_history
-                    )
-                    if not isinstance(message, bool):
-                        await self.application.bot.send_message(
-                            chat_id=self.group_chat_id, text=message
-                        )
-                        self.conversation_history.append(
-                            {"user": "Bot", "message": message}
-                        )
-                        self.last_bot_message_time = current_time
-                    else:
-                        logging.info("Бот не ответил в групповом чате")
-                    logging.info(f"Бот инициировал разговор: {message}")
-                else:
-                    logging.info("Условия не выполнены для проактивного сообщения")
-            except Exception as e:
-                logging.error(
-                    f"Ошибка в проактивных сообщениях: {str(e)}", exc_info=True
-                )
-            await asyncio.sleep(60)  # Проверка каждую минуту
+    def _schedule_initiation(self, state):
+        # Назначение дедлайна проактивного сообщения по таймерам чата
+        self.scheduler.schedule(
+            state.chat_id,
+            self.decision_maker.next_initiation_time(
+                state.last_human_message_time, state.last_bot_message_time
+            ),
+        )
 
     async def start(self):
         # Запуск обработки команд и сообщений
@@ -131,20 +561,74 @@ class TelegramHandler:
         await self.application.initialize()
         await self.application.start()
         self._is_running = True
+        await self._start_services()
 
         try:
-            await self.application.updater.start_polling()
+            if UPDATE_MODE == "webhook":
+                await self.webhook.start()
+                await self.bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
+            else:
+                await self.application.updater.start_polling()
             logging.info("Бот работает. Нажмите Ctrl+C для остановки.")
 
             # Запуск проактивных сообщений
-            self.proactive_messaging_task = asyncio.create_task(
-                self.proactive_messaging()
-            )
+            self.scheduler.start()
 
             await self._stop_event.wait()  # Ожидание установки stop_event
         finally:
             await self.stop()
 
+    async def serve(self, updates, ready=None):
+        # Работа процесса-шарда: пары (вид, обновление в виде словаря) приходят
+        # из очереди фронтенда по порядку; None в очереди - сигнал к остановке
+        await self.bot.initialize()
+        self._is_running = True
+        await self._start_services()
+        self.scheduler.start()
+        if ready is not None:
+            ready.set()
+        logging.info(f"Шард {self.shard[0]} из {self.shard[1]} работает.")
+
+        loop = asyncio.get_running_loop()
+        try:
+            while not self._stop_event.is_set():
+                batch = await loop.run_in_executor(
+                    None, _next_updates, updates, SHARD_POLL_INTERVAL
+                )
+                for item in batch:
+                    if item is None:
+                        self._stop_event.set()
+                        break
+                    kind, data = item
+                    handle = (
+                        self.start_command if kind == "start" else self.handle_message
+                    )
+                    try:
+                        await handle(Update.de_json(data, self.bot), None)
+                    except Exception as e:
+                        logging.error(
+                            f"Ошибка при обработке обновления: {str(e)}", exc_info=True
+                        )
+        finally:
+            await self.stop()
+
+    async def _start_services(self):
+        # Запуск хранилища, метрик и очереди исходящих сообщений
+        if self.storage is not None:
+            await self.storage.open()
+            await self.restore_history()
+
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+
+        # Запуск отправки исходящих сообщений
+        self.outbound.start()
+
+    def request_stop(self):
+        # Запрос остановки (например, из обработчика сигнала): start и serve
+        # завершаются, дождавшись готовящихся ответов
+        self._stop_event.set()
+
     async def stop(self):
         # Остановка бота
         if self._is_running:
@@ -152,18 +636,57 @@ class TelegramHandler:
             self._is_running = False
             self._stop_event.set()  # Сигнал к остановке опроса
 
-            if self.proactive_messaging_task:
-                self.proactive_messaging_task.cancel()
-                try:
-                    await self.proactive_messaging_task
-                except asyncio.CancelledError:
-                    pass
+            # Прекращение приёма обновлений; уже принятые вебхуком обрабатываются
+            if self.webhook is not None:
+                await self.webhook.stop()
 
             if self.application.updater.running:
                 await self.application.updater.stop()
 
-            await self.application.stop()
+            await self.scheduler.stop()
+
+            # Ожидание ответов, которые уже готовятся, не дольше
+            # SHUTDOWN_DRAIN_TIMEOUT; оставшиеся ответы отменяются
+            replies = [
+                task
+                for state in self.chat_states
+                for task in (state.replying, state.pending_reply)
+                if task is not None and not task.done()
+            ]
+            if replies:
+                logging.info(f"Ожидание {len(replies)} ответов перед остановкой...")
+                _, unfinished = await asyncio.wait(
+                    replies, timeout=SHUTDOWN_DRAIN_TIMEOUT
+                )
+                if unfinished:
+                    logging.warning(f"Не дождались {len(unfinished)} ответов")
+
+            # Отмена ожидающих ответов и обновлений сводок
+            pending = [
+                task
+                for state in self.chat_states
+                for task in (state.replying, state.pending_reply, state.summarizing)
+                if task is not None
+            ]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+            await self.outbound.stop()
+
+            await self.decision_maker.close()
+
+            if self.storage is not None:
+                await self.storage.close()
+
+            if self.metrics_server is not None:
+                await self.metrics_server.stop()
+
+            if self.application.running:
+                await self.application.stop()
             await self.application.shutdown()
+            if self.shard is not None:
+                await self.bot.shutdown()
             logging.info("Бот остановлен.")
         else:
             logging.info("Бот не работает.")
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from aiohttp import web
+from telegram import Update
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """
+    Приём обновлений Telegram через вебхук на локальном HTTP-сервере.
+
+    Обновления с уже принятым update_id отбрасываются (Telegram повторяет
+    доставку при ошибках). Принятые обновления попадают в ограниченную очередь,
+    которую разбирают обработчики; при заполненной очереди сервер отвечает
+    503, и Telegram повторит доставку позже.
+    """
+
+    def __init__(
+        self,
+        application,
+        listen,
+        port,
+        path,
+        secret_token=None,
+        queue_size=1000,
+        workers=16,
+        dedup_size=10000,
+    ):
+        self.application = application
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token
+        self.workers = workers
+        self.dedup_size = dedup_size
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self._seen = OrderedDict()  # Недавние update_id
+        self._runner = None
+        self._tasks = []
+
+    async def start(self):
+        """Запуск HTTP-сервера и обработчиков очереди."""
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.listen, self.port).start()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logging.info(f"Вебхук слушает {self.listen}:{self.port}{self.path}")
+
+    async def stop(self):
+        """Остановка приёма, обработка уже принятых обновлений и остановка обработчиков."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        await self.queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def handle(self, request):
+        """Обработка POST-запроса с обновлением от Telegram."""
+        if (
+            self.secret_token
+            and request.headers.get(SECRET_HEADER) != self.secret_token
+        ):
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+            update_id = data["update_id"]
+        except (ValueError, KeyError, TypeError):
+            return web.Response(status=400)
+
+        if update_id in self._seen:
+            return web.Response()  # Повторная доставка
+
+        try:
+            self.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            logging.debug("Очередь обновлений переполнена, доставка будет повторена")
+            return web.Response(status=503)
+
+        self._seen[update_id] = None
+        if len(self._seen) > self.dedup_size:
+            self._seen.popitem(last=False)
+        return web.Response()
+
+    async def _worker(self):
+        while True:
+            data = await self.queue.get()
+            try:
+                update = Update.de_json(data, self.application.bot)
+                await self.application.process_update(update)
+            except Exception as e:
+                logging.error(f"Ошибка обработки обновления: {str(e)}", exc_info=True)
+            finally:
+                self.queue.task_done()
@@ -8,15 +8,122 @@ load_dotenv()
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
+# Провайдер LLM: "gemini" или "stub" (детерминированная заглушка для бенчмарков)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+LLM_MODEL = os.getenv("LLM_MODEL", "gemini-1.0-pro")  # Основная модель Gemini
+# Резервные модели по порядку, через запятую; используются, когда основная не
+# отвечает или её выключатель разомкнут
+LLM_FALLBACK_MODELS = [
+    model.strip()
+    for model in os.getenv("LLM_FALLBACK_MODELS", "gemini-1.5-flash").split(",")
+    if model.strip()
+]
+
+# Получение обновлений: "polling" (long polling) или "webhook"
+UPDATE_MODE = os.getenv("UPDATE_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # Публичный URL вебхука для Telegram
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # Секрет для проверки запросов
+WEBHOOK_LISTEN = "0.0.0.0"  # Адрес локального HTTP-сервера
+WEBHOOK_PORT = 8443  # Порт локального HTTP-сервера
+WEBHOOK_PATH = "/telegram"  # Путь, на который Telegram отправляет обновления
+WEBHOOK_QUEUE_SIZE = 1000  # Размер очереди принятых, но не обработанных обновлений
+WEBHOOK_WORKERS = 16  # Число одновременно обрабатываемых обновлений
+
+# Метрики в формате Prometheus
+METRICS_LISTEN = "127.0.0.1"  # Адрес эндпоинта /metrics
+METRICS_PORT = 9464  # Порт эндпоинта /metrics (None - отключить)
+
+# Многопроцессный режим: обновления распределяются между процессами-шардами по
+# chat_id, поэтому сообщения одного чата обрабатываются по порядку в одном
+# процессе. Шард с номером i отдаёт метрики на METRICS_PORT + 1 + i и хранит
+# историю в отдельном файле (STORAGE_PATH с номером шарда); при изменении
+# SHARD_WORKERS чаты переходят в другие шарды без восстановленной истории
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", "1"))  # Число шардов (1 - один процесс)
+SHARD_QUEUE_SIZE = 1000  # Размер очереди обновлений одного шарда
+SHARD_POLL_INTERVAL = 0.5  # Период проверки остановки при пустой очереди в секундах
+SHUTDOWN_DRAIN_TIMEOUT = 20  # Максимальное ожидание готовящихся ответов при остановке
+
 # Конфигурация бота
 MAX_MESSAGE_LENGTH = 280  # Максимальная длина ответа бота
 RESPONSE_DELAY = 2  # Задержка в секундах перед ответом бота
+STREAMING_REPLIES = False  # Отправлять ответ по мере генерации, редактируя сообщение
+STREAM_EDIT_INTERVAL = 1.0  # Минимальный интервал между правками сообщения в секундах
+COALESCE_WINDOW = 3  # Пауза в секундах, после которой серия сообщений обрабатывается
+COALESCE_MAX_DELAY = 15  # Максимальное ожидание в секундах с начала серии сообщений
+PROACTIVE_WORKERS = 4  # Число одновременно обрабатываемых проактивных сообщений
+# Ограничение частоты исходящих запросов к Telegram (сообщения и правки). За любой
+# интервал T корзина пропускает не больше BURST + RATE * T запросов; значения
+# выбраны с запасом в одно сообщение от лимитов Telegram: 30 в секунду на бота
+# и 20 в минуту на группу
+OUTBOUND_GLOBAL_RATE = 28  # Запросов в секунду на бота
+OUTBOUND_GLOBAL_BURST = 1
+OUTBOUND_CHAT_RATE = 16 / 60  # Запросов в секунду на чат
+OUTBOUND_CHAT_BURST = 3
+OUTBOUND_QUEUE_SIZE = 1000  # Максимальное число ожидающих исходящих запросов
+OUTBOUND_MAX_RETRIES = 3  # Число повторов после ответа 429
+LLM_MAX_CONCURRENCY = 8  # Максимальное число одновременных запросов к LLM
+LLM_TIMEOUT = 30  # Срок вызова LLM в секундах для методов без LLM_DEADLINES
+# Сроки методов DecisionMaker в секундах, общие для всех попыток и моделей
+# (для остальных методов - LLM_TIMEOUT)
+LLM_DEADLINES = {
+    "should_respond": 10,
+    "decide_and_generate": 25,
+    "generate_response": 25,
+    "initiate_conversation": 30,
+    "summarize": 60,
+}
+LLM_HEDGE_QUANTILE = 0.95  # Второй запрос, если ответ дольше этой квантили задержек
+LLM_HEDGE_MIN_SAMPLES = 20  # Хеджирование включается после стольких ответов метода
+LLM_HEDGE_MIN_DELAY = 0.2  # Минимальная задержка хеджирующего запроса в секундах
+LLM_BREAKER_FAILURES = 5  # Ошибок подряд, после которых модель пропускается
+LLM_BREAKER_RECOVERY = 30  # Через столько секунд к модели уходит пробный запрос
+# Режим принятия решения об ответе: "separate" (решение и генерация отдельными
+# запросами), "combined" (один запрос) или "speculative" (параллельно)
+DECISION_MODE = "separate"
+
+# Предварительный фильтр перед запросом к LLM
+PREFILTER_ENABLED = True  # Включить локальный фильтр перед should_respond
+PREFILTER_MIN_BOT_INTERVAL = 30  # Не отвечать чаще, чем раз в столько секунд
+PREFILTER_MIN_TOKENS = 3  # Короткие сообщения без вопроса не передаются LLM
+PREFILTER_MODEL_PATH = None  # Путь к JSON с весами классификатора (необязательно)
+PREFILTER_THRESHOLDS = (0.2, 0.8)  # Пороги вероятности для "нет" и "да"
+
+# Хранилище состояний чатов
+HISTORY_SIZE = 20  # Число сообщений, хранимых в истории одного чата
+MAX_CHATS = 10000  # Максимальное число чатов, хранимых в памяти
+CHAT_IDLE_TTL = 24 * 60 * 60  # Время простоя в секундах, после которого чат вытесняется
+MAX_STATE_MEMORY = 256 * 1024 * 1024  # Общий лимит памяти на истории чатов в байтах
+
+# Кеш решений и ответов LLM для повторяющихся вопросов
+RESPONSE_CACHE_ENABLED = False  # Включить кеш (по умолчанию выключен)
+RESPONSE_CACHE_SIZE = 10000  # Максимальное число записей
+RESPONSE_CACHE_TTL = 60 * 60  # Время жизни записи в секундах
+RESPONSE_CACHE_THRESHOLD = 0.8  # Минимальное сходство для приближённого совпадения
+RESPONSE_CACHE_PER_CHAT = True  # Разделять записи разных чатов
+RESPONSE_CACHE_CONTEXT = 2  # Число последних сообщений, входящих в ключ
+
+# Контекст разговора в промптах
+CONTEXT_TOKEN_BUDGET = 1500  # Бюджет токенов одного промпта вместе с инструкцией
+CONTEXT_RECENT_MESSAGES = 10  # Число последних сообщений, передаваемых дословно
+CONTEXT_MAX_MESSAGE_TOKENS = 150  # Длинные сообщения обрезаются до стольких токенов
+SUMMARY_BATCH = 5  # Сводка обновляется, когда из окна вышло столько сообщений
+SUMMARY_MAX_TOKENS = 250  # Максимальный размер сводки ранней беседы в токенах
+
+# Постоянное хранилище истории чатов
+STORAGE_BACKEND = None  # "log" (журнал JSON Lines), "sqlite" или None (только память)
+STORAGE_PATH = "data/history.db"  # Путь к файлу хранилища
+STORAGE_BATCH_SIZE = 100  # Число сообщений, при котором запись начинается сразу
+STORAGE_FLUSH_INTERVAL = 1.0  # Максимальная задержка записи в секундах
 
 # Обеспечение настройки переменных окружения
 if (
     not TELEGRAM_TOKEN
-    or not GEMINI_API_KEY
+    or LLM_PROVIDER == "gemini" and not GEMINI_API_KEY
 ):
     raise ValueError(
         "Установите переменные окружения TELEGRAM_TOKEN, OPENAI_API_KEY, GIGACHAT_PASSWORD и GEMINI_API_KEY в файле .env."
     )
+if UPDATE_MODE == "webhook" and not WEBHOOK_URL:
+    raise ValueError(
+        "Установите переменную окружения WEBHOOK_URL для режима UPDATE_MODE=webhook."
+    )
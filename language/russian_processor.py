@@ -1,21 +1,57 @@
-import nltk
-from nltk.tokenize import word_tokenize
 import logging
+import re
+
+# Тексты, для которых быстрый токенизатор даёт тот же результат, что и
+# nltk.word_tokenize: буквы, цифры, пробелы, дефисы и знаки ,;:!?() внутри
+# текста и не более одной точки в самом конце. Остальные тексты (кавычки,
+# многоточия, точки внутри, числа вида "1,5" и т.п.) обрабатываются NLTK.
+_SIMPLE_TEXT_RE = re.compile(r"[\w\s,;:!?()\-]*(?:\.\s*)?")
+# Случаи внутри простых текстов, которые NLTK обрабатывает особым образом
+_SPECIAL_CASES_RE = re.compile(
+    r"--|[,:][\d,:]|\b(?:cannot|gimme|gonna|gotta|lemme|wanna)\b"
+)
+# Знаки препинания, которые NLTK всегда отделяет от слов
+_PUNCTUATION_RE = re.compile(r"([,;:!?()])")
+# Точка в конце текста
+_FINAL_PERIOD_RE = re.compile(r"\.\s*$")
 
 
 class RussianProcessor:
     def __init__(self):
         """Инициализация класса RussianProcessor."""
-        self.ensure_nltk_data()
+        self._word_tokenize = None  # Токенизатор NLTK, загружается при первой нужде
 
     def ensure_nltk_data(self):
         """Проверка наличия необходимых данных NLTK и их загрузка при необходимости."""
+        import nltk
+
         try:
             nltk.data.find("tokenizers/punkt")
         except LookupError:
             logging.info("Загрузка необходимых данных NLTK...")
             nltk.download("punkt")
 
+    def _nltk_tokenize(self, text):
+        """Токенизация с помощью NLTK; библиотека загружается при первом вызове."""
+        if self._word_tokenize is None:
+            self.ensure_nltk_data()
+            from nltk.tokenize import word_tokenize
+
+            self._word_tokenize = word_tokenize
+        return self._word_tokenize(text, language="russian")
+
+    def tokenize(self, text):
+        """
+        Токенизация текста в нижнем регистре.
+
+        Простые тексты разбираются предкомпилированными регулярными выражениями,
+        остальные передаются NLTK; результат совпадает с nltk.word_tokenize.
+        """
+        if _SIMPLE_TEXT_RE.fullmatch(text) and not _SPECIAL_CASES_RE.search(text):
+            text = _FINAL_PERIOD_RE.sub(" .", text)
+            return _PUNCTUATION_RE.sub(r" \1 ", text).split()
+        return self._nltk_tokenize(text)
+
     def process(self, text):
         """
         Обработка текста: преобразование в нижний регистр, токенизация и сборка обратно в строку.
@@ -23,18 +59,16 @@ class RussianProcessor:
         :param text: Входной текст для обработки.
         :return: Обработанный текст.
         """
-        logging.info(f"Обработка текста: {text}")
-
-        # Преобразование в нижний регистр
-        text = text.lower()
-        logging.info(f"Текст в нижнем регистре: {text}")
-
-        # Токенизация текста
-        tokens = word_tokenize(text, language="russian")
-        logging.info(f"Токенизированный текст: {tokens}")
+        processed_text = " ".join(self.tokenize(text.lower()))
+        logging.debug("Обработанный текст: %s", processed_text)
+        return processed_text
 
-        # Сборка токенов обратно в строку
-        processed_text = " ".join(tokens)
-        logging.info(f"Итоговый обработанный текст: {processed_text}")
+    def process_many(self, texts):
+        """
+        Пакетная обработка текстов.
 
-        return processed_text
+        :param texts: Итерируемый набор входных текстов.
+        :return: Список обработанных текстов в том же порядке.
+        """
+        tokenize = self.tokenize
+        return [" ".join(tokenize(text.lower())) for text in texts]
@@ -2,8 +2,9 @@ import asyncio
 import logging
 import signal
 import traceback
+from bot.sharding import ShardedRunner
 from bot.telegram_handler import TelegramHandler
-from config import TELEGRAM_TOKEN
+from config import SHARD_QUEUE_SIZE, SHARD_WORKERS, TELEGRAM_TOKEN
 
 # Установка логирования
 logging.basicConfig(
@@ -13,15 +14,18 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def signal_handler(sig, frame):
+def signal_handler(sig, handler):
     """
     Обработчик сигналов.
 
+    Запрашивает остановку бота; бот прекращает приём обновлений и завершается,
+    дождавшись уже готовящихся ответов.
+
     :param sig: Полученный сигнал
-    :param frame: Текущий фрейм
+    :param handler: Работающий бот (TelegramHandler или ShardedRunner)
     """
-    logger.info(f"Получен сигнал {sig}. Остановка бота...")
-    asyncio.get_event_loop().stop()
+    logger.info(f"Получен сигнал {sig.name}. Остановка бота...")
+    handler.request_stop()
 
 
 async def main():
@@ -30,12 +34,17 @@ async def main():
 
     """
     logger.info("Запуск Telegram бота...")
-    handler = TelegramHandler(TELEGRAM_TOKEN)
+    if SHARD_WORKERS > 1:
+        # Многопроцессный режим: обновления распределяются по шардам по chat_id
+        handler = ShardedRunner(TELEGRAM_TOKEN, SHARD_WORKERS, SHARD_QUEUE_SIZE)
+    else:
+        handler = TelegramHandler(TELEGRAM_TOKEN)
 
     try:
         # Регистрация обработчика сигналов
+        loop = asyncio.get_running_loop()
         for sig in (signal.SIGINT, signal.SIGTERM):
-            signal.signal(sig, signal_handler)
+            loop.add_signal_handler(sig, signal_handler, sig, handler)
 
         # Запуск бота
         await handler.start()
@@ -0,0 +1,165 @@
+"""
+Пропускная способность и память ChatStateStore на синтетических чатах.
+
+В хранилище добавляются сообщения chats чатов вперемешку (по умолчанию 10k
+чатов по 20 сообщений). Отчёт: сообщений и обращений по chat_id в секунду,
+оценка объёма историй (ChatStateStore.memory) и фактический прирост памяти по
+tracemalloc. Затем тот же поток сообщений подаётся в хранилище с лимитом
+памяти в четверть полученного объёма и с лимитом числа чатов, а вытеснение
+по простою проверяется на поддельных часах, в том числе что сводка,
+готовая после вытеснения чата, не увеличивает оценку памяти.
+
+Если лимит нарушен или вытеснены не самые давние чаты, скрипт завершается с
+кодом 1.
+
+Пример запуска:
+
+    python scripts/chat_state_benchmark.py --chats 10000 --messages 20
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_TOKEN", "0:offline")
+os.environ.setdefault("LLM_PROVIDER", "stub")
+
+from bot.chat_state import ChatStateStore  # noqa: E402
+from config import HISTORY_SIZE  # noqa: E402
+
+WORDS = (
+    "привет как дела сегодня вчера матч обновление приложение версия думаю "
+    "согласен почему интересно новости планы выходные погода работа проект"
+).split()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def synthetic_messages(chats, messages, seed):
+    """Пары (chat_id, текст): messages сообщений в каждом чате вперемешку."""
+    rng = random.Random(seed)
+    order = [chat for chat in range(chats) for _ in range(messages)]
+    rng.shuffle(order)
+    return [
+        (-100 - chat, " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 15))))
+        for chat in order
+    ]
+
+
+def fill(store, messages):
+    for chat_id, text in messages:
+        store.add_message(store.get_or_create(chat_id), "Участник", text)
+
+
+def measure(messages, chats):
+    store = ChatStateStore(HISTORY_SIZE, chats, 24 * 60 * 60, 1 << 40)
+    tracemalloc.start()
+    started = time.perf_counter()
+    fill(store, messages)
+    elapsed = time.perf_counter() - started
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    chat_ids = [chat_id for chat_id, _ in messages]
+    started = time.perf_counter()
+    for chat_id in chat_ids:
+        store.get(chat_id)
+    lookups = time.perf_counter() - started
+    return store, elapsed, lookups, allocated
+
+
+def run(args):
+    failures = []
+
+    def check(condition, description):
+        if not condition:
+            failures.append(description)
+            print(f"  НЕ ПРОЙДЕНО: {description}")
+
+    messages = synthetic_messages(args.chats, args.messages, args.seed)
+    print(f"Сообщений: {len(messages)} в {args.chats} чатах")
+
+    store, elapsed, lookups, allocated = measure(messages, args.chats)
+    print(
+        f"Добавление: {len(messages) / elapsed:.0f} сообщ/с; "
+        f"поиск по chat_id: {len(messages) / lookups:.0f} обращ/с"
+    )
+    print(
+        f"Объём историй: оценка {store.memory / 2**20:.1f} МБ, "
+        f"tracemalloc {allocated / 2**20:.1f} МБ "
+        f"({allocated / len(store):.0f} байт на чат)"
+    )
+    check(len(store) == args.chats, "без лимитов вытесняться чаты не должны")
+
+    # Лимит памяти: вытесняются самые давние чаты, оценка не превышает лимит
+    max_memory = store.memory // 4
+    limited = ChatStateStore(HISTORY_SIZE, args.chats, 24 * 60 * 60, max_memory)
+    peak = 0
+    for chat_id, text in messages:
+        limited.add_message(limited.get_or_create(chat_id), "Участник", text)
+        peak = max(peak, limited.memory)
+    print(
+        f"Лимит памяти {max_memory / 2**20:.1f} МБ: пик {peak / 2**20:.1f} МБ, "
+        f"чатов в памяти {len(limited)}"
+    )
+    check(peak <= max_memory, "оценка памяти не должна превышать лимит")
+    recent = set()
+    for chat_id, _ in reversed(messages):
+        if len(recent) == len(limited):
+            break
+        recent.add(chat_id)
+    check(
+        {state.chat_id for state in limited} == recent,
+        "в памяти должны остаться последние активные чаты",
+    )
+
+    # Лимит числа чатов
+    max_chats = args.chats // 10
+    capped = ChatStateStore(HISTORY_SIZE, max_chats, 24 * 60 * 60, 1 << 40)
+    fill(capped, messages)
+    print(f"Лимит {max_chats} чатов: чатов в памяти {len(capped)}")
+    check(len(capped) == max_chats, "число чатов не должно превышать лимит")
+
+    # Вытеснение по простою на поддельных часах
+    clock = FakeClock()
+    idle = ChatStateStore(HISTORY_SIZE, args.chats, 60, 1 << 40, clock=clock)
+    first = idle.get_or_create(0)
+    for chat in range(100):
+        idle.get_or_create(chat)
+        clock.now += 1
+    clock.now = 100 + 30
+    idle.evict_idle()
+    print(f"Простой 60 с: из 100 чатов осталось {len(idle)}")
+    check(len(idle) == 30, "должны вытесняться только чаты, простаивающие дольше TTL")
+    idle.set_summary(first, "сводка вытесненного чата", 10)
+    check(
+        idle.memory == sum(state.memory for state in idle),
+        "сводка вытесненного чата не должна учитываться в памяти",
+    )
+
+    if failures:
+        print(f"Не пройдено проверок: {len(failures)}")
+        sys.exit(1)
+    print("Все проверки пройдены")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chats", type=int, default=10000)
+    parser.add_argument("--messages", type=int, default=20, help="Сообщений на чат")
+    parser.add_argument("--seed", type=int, default=0)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
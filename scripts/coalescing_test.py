@@ -0,0 +1,231 @@
+"""
+Проверка объединения серий сообщений в TelegramHandler на виртуальных часах.
+
+Сообщения подаются в handle_message по расписанию виртуального времени
+(см. virtual_clock.py), вместо DecisionMaker работает заглушка с задержкой
+решения, ответы уходят в поддельного бота. Сценарии:
+
+- burst: серия быстрых сообщений - одно решение и один ответ;
+- during-decision: сообщение во время решения отменяет его, ответ один;
+- during-reply: сообщения во время отправки ответа и после неё - не больше
+  одного ответа на каждую серию, повторов нет;
+- chatter: непрерывная переписка дольше COALESCE_MAX_DELAY - решения не
+  отменяются бесконечно, ответ приходит до конца переписки;
+- pre-filter: первая серия в новом чате - вопрос и короткая реплика после
+  него - доходит до решения, хотя бот в чате ещё не писал; то же, если
+  реплика пришла во время решения и отменила его.
+
+Если проверка не пройдена, скрипт завершается с кодом 1.
+
+Пример запуска:
+
+    python scripts/coalescing_test.py
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_TOKEN", "0:offline")
+os.environ.setdefault("LLM_PROVIDER", "stub")
+
+import bot.telegram_handler as telegram_handler  # noqa: E402
+import virtual_clock  # noqa: E402
+from bot.decision_maker import DecisionMaker  # noqa: E402
+from bot.dispatcher import OutboundDispatcher  # noqa: E402
+from bot.llm import StubLLM  # noqa: E402
+from replay_benchmark import FakeBot, make_update  # noqa: E402
+
+CHAT_ID = -100
+
+
+class StubDecisionMaker(DecisionMaker):
+    """DecisionMaker, который решает latency секунд и всегда отвечает."""
+
+    def __init__(self, latency):
+        super().__init__(llm=StubLLM())
+        self.latency = latency
+        self.decisions = []  # Время начала и последнее сообщение каждого решения
+
+    async def decide_and_generate(
+        self, history, current_time, last_bot_message_time, **kwargs
+    ):
+        self.decisions.append((asyncio.get_running_loop().time(), history[-1].message))
+        await asyncio.sleep(self.latency)
+        return True, f"ответ на {history[-1].message}"
+
+    async def summarize(self, summary, messages):
+        return None
+
+
+async def replay(args, schedule, pre_filter=False):
+    """
+    Воспроизведение сообщений schedule - пар (время, текст).
+
+    :param pre_filter: Оставить предварительный фильтр перед решением.
+
+    :return: Заглушка DecisionMaker и список пар (время ответа, текст ответа).
+    """
+    loop = asyncio.get_running_loop()
+    virtual_clock.patch_time(telegram_handler)
+    telegram_handler.COALESCE_WINDOW = args.window
+    telegram_handler.COALESCE_MAX_DELAY = args.max_delay
+    telegram_handler.RESPONSE_DELAY = args.response_delay
+    telegram_handler.STREAMING_REPLIES = False
+
+    decision_maker = StubDecisionMaker(args.decision_latency)
+    fake_bot = FakeBot()
+    handler = telegram_handler.TelegramHandler(
+        os.environ["TELEGRAM_TOKEN"], decision_maker=decision_maker, bot=fake_bot
+    )
+    if not pre_filter:
+        handler.pre_filter = None
+    handler.storage = None
+    handler.outbound = OutboundDispatcher(1e9, 1, 1e9, 1, queue_size=1000)
+    handler.outbound.start()
+
+    replies = []
+    started = loop.time()
+    for at, text in schedule:
+        await asyncio.sleep(started + at - loop.time())
+        update = make_update(fake_bot, CHAT_ID, "Участник", text)
+        reply_text = update.message.reply_text
+
+        async def record(text, reply_text=reply_text):
+            # Отправка в Telegram занимает send_latency секунд
+            replies.append((loop.time() - started, text))
+            await asyncio.sleep(args.send_latency)
+            return await reply_text(text)
+
+        update.message.reply_text = record
+        await handler.handle_message(update, None)
+    state = handler.chat_states.get(CHAT_ID)
+    while state.in_flight:
+        await asyncio.sleep(1)
+    await handler.outbound.stop()
+    return decision_maker, replies
+
+
+def report(name, decision_maker, replies):
+    print(
+        f"{name}: решений {len(decision_maker.decisions)}, "
+        f"ответов {len(replies)}: "
+        + ", ".join(f"{at:.1f} с {text!r}" for at, text in replies)
+    )
+
+
+async def run(args, check):
+    # Пять сообщений с интервалом 0.5 с
+    schedule = [(index * 0.5, f"сообщение {index}") for index in range(5)]
+    decision_maker, replies = await replay(args, schedule)
+    report("burst", decision_maker, replies)
+    check(len(decision_maker.decisions) == 1, "burst: одно решение на серию")
+    check(
+        [text for _, text in replies] == ["ответ на сообщение 4"],
+        "burst: один ответ на последнее сообщение",
+    )
+    quiet = schedule[-1][0] + args.window
+    check(
+        replies
+        and replies[0][0] == quiet + args.decision_latency + args.response_delay,
+        "burst: ответ после паузы, решения и RESPONSE_DELAY",
+    )
+
+    # Сообщение во время решения: решение отменяется, ответ один
+    during = args.window + args.decision_latency / 2
+    schedule = [(0, "а ?"), (during, "б ?")]
+    decision_maker, replies = await replay(args, schedule)
+    report("during-decision", decision_maker, replies)
+    check(len(decision_maker.decisions) == 2, "during-decision: решение перезапущено")
+    check(
+        [text for _, text in replies] == ["ответ на б ?"],
+        "during-decision: ответ только на последнее сообщение",
+    )
+
+    # Сообщения во время отправки ответа и после неё
+    sending = args.window + args.decision_latency + args.response_delay
+    sent = sending + args.send_latency
+    schedule = [
+        (0, "а ?"),
+        (sending + args.send_latency / 3, "б ?"),
+        (sending + args.send_latency * 2 / 3, "в ?"),
+        (sent + 0.5, "г ?"),
+    ]
+    decision_maker, replies = await replay(args, schedule)
+    report("during-reply", decision_maker, replies)
+    texts = [text for _, text in replies]
+    check(len(texts) == len(set(texts)), "during-reply: повторных ответов нет")
+    check(
+        texts == ["ответ на а ?", "ответ на г ?"],
+        "during-reply: по одному ответу на каждую серию",
+    )
+
+    # Непрерывная переписка дольше COALESCE_MAX_DELAY
+    duration = 2 * args.max_delay
+    schedule = [
+        (index * args.chatter_interval, f"реплика {index}")
+        for index in range(int(duration / args.chatter_interval))
+    ]
+    decision_maker, replies = await replay(args, schedule)
+    report("chatter", decision_maker, replies)
+    check(
+        bool(replies) and replies[0][0] < duration,
+        "chatter: ответ должен прийти до конца переписки",
+    )
+    bursts = duration / args.max_delay + 1
+    check(
+        len(decision_maker.decisions) <= bursts + 1,
+        f"chatter: не больше одного решения на COALESCE_MAX_DELAY ({bursts:.0f})",
+    )
+    texts = [text for _, text in replies]
+    check(len(texts) == len(set(texts)), "chatter: повторных ответов нет")
+
+    # Предварительный фильтр оценивает всю серию в новом чате
+    schedule = [(0, "Кто знает, как настроить nginx?"), (0.5, "ну")]
+    decision_maker, replies = await replay(args, schedule, pre_filter=True)
+    report("pre-filter", decision_maker, replies)
+    check(
+        len(decision_maker.decisions) == 1,
+        "pre-filter: вопрос в серии не должен отсекаться фильтром",
+    )
+
+    # Реплика во время решения: повторное решение видит и отменённую серию
+    schedule = [(0, "Кто знает, как настроить nginx?"), (during, "ну")]
+    decision_maker, replies = await replay(args, schedule, pre_filter=True)
+    report("pre-filter during-decision", decision_maker, replies)
+    check(
+        len(replies) == 1,
+        "pre-filter: отменённая серия учитывается при повторном решении",
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--window", type=float, default=3.0)
+    parser.add_argument("--max-delay", type=float, default=15.0)
+    parser.add_argument("--response-delay", type=float, default=2.0)
+    parser.add_argument("--decision-latency", type=float, default=1.0)
+    parser.add_argument("--send-latency", type=float, default=1.0)
+    parser.add_argument("--chatter-interval", type=float, default=0.2)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    failures = []
+
+    def check(condition, description):
+        if not condition:
+            failures.append(description)
+            print(f"  НЕ ПРОЙДЕНО: {description}")
+
+    virtual_clock.run(run(args, check))
+    if failures:
+        print(f"Не пройдено проверок: {len(failures)}")
+        sys.exit(1)
+    print("Все проверки пройдены")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Проверка неблокирующих запросов DecisionMaker к LLM.
+
+Вызовы should_respond для N чатов запускаются одновременно со StubLLM с
+задержкой latency. Пока N не больше LLM_MAX_CONCURRENCY, все решения должны
+быть готовы примерно за одну задержку LLM, а не за N; при большем N - за
+ceil(N / LLM_MAX_CONCURRENCY) задержек. Для сравнения та же нагрузка
+прогоняется с заглушкой, блокирующей цикл событий (как синхронный
+llm.invoke до перехода на ainvoke). Отдельно проверяется, что
+DecisionMaker.close отменяет незавершённые запросы сразу.
+
+Если проверка не пройдена, скрипт завершается с кодом 1.
+
+Пример запуска:
+
+    python scripts/concurrency_test.py --chats 8 --latency 0.2
+"""
+
+import argparse
+import asyncio
+import logging
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_TOKEN", "0:offline")
+os.environ.setdefault("LLM_PROVIDER", "stub")
+
+from bot.decision_maker import DecisionMaker  # noqa: E402
+from bot.history import Message, MessageHistory  # noqa: E402
+from bot.llm import StubLLM, StubResponse  # noqa: E402
+from config import LLM_MAX_CONCURRENCY  # noqa: E402
+
+
+class BlockingLLM(StubLLM):
+    """Заглушка, которая ждёт ответа синхронно и блокирует цикл событий."""
+
+    async def ainvoke(self, prompt):
+        self.calls += 1
+        time.sleep(self._delay())
+        return StubResponse(self._answer(prompt))
+
+
+def make_history(chat):
+    history = MessageHistory(20)
+    history.append(Message(f"Участник{chat}", "кто знает , как настроить nginx ?"))
+    return history
+
+
+async def decide_all(llm, chats):
+    """Время, за которое готовы решения для всех чатов."""
+    decision_maker = DecisionMaker(llm=llm)
+    decision_maker.cache = None
+    now = time.time()
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(
+            decision_maker.should_respond(make_history(chat), now, 0, chat_id=chat)
+            for chat in range(chats)
+        )
+    )
+    elapsed = time.perf_counter() - started
+    await decision_maker.close()
+    return elapsed
+
+
+async def close_pending(latency, chats):
+    """Время от DecisionMaker.close до отмены всех незавершённых запросов."""
+    decision_maker = DecisionMaker(llm=StubLLM(latency=latency))
+    decision_maker.cache = None
+    now = time.time()
+    calls = asyncio.gather(
+        *(
+            decision_maker.should_respond(make_history(chat), now, 0, chat_id=chat)
+            for chat in range(chats)
+        ),
+        return_exceptions=True,
+    )
+    await asyncio.sleep(latency / 10)
+    started = time.perf_counter()
+    await decision_maker.close()
+    await calls
+    return time.perf_counter() - started
+
+
+async def run(args):
+    failures = []
+
+    def check(condition, description):
+        if not condition:
+            failures.append(description)
+            print(f"  НЕ ПРОЙДЕНО: {description}")
+
+    latency = args.latency
+    print(
+        f"Задержка LLM {latency * 1000:.0f} мс, LLM_MAX_CONCURRENCY={LLM_MAX_CONCURRENCY}"
+    )
+    for chats in (args.chats, 2 * args.chats):
+        expected = math.ceil(chats / LLM_MAX_CONCURRENCY) * latency
+        elapsed = await decide_all(StubLLM(latency=latency), chats)
+        blocking = await decide_all(BlockingLLM(latency=latency), chats)
+        print(
+            f"Чатов: {chats}: неблокирующий вызов {elapsed * 1000:.0f} мс "
+            f"(ожидается ~{expected * 1000:.0f}), "
+            f"блокирующий {blocking * 1000:.0f} мс"
+        )
+        check(
+            elapsed < expected + latency / 2,
+            f"{chats} решений должны уложиться в ~{expected * 1000:.0f} мс",
+        )
+        check(
+            blocking > chats * latency * 0.9,
+            "блокирующий вызов должен занять N задержек",
+        )
+
+    cancelled = await close_pending(latency * 50, args.chats)
+    print(f"Отмена {args.chats} незавершённых запросов: {cancelled * 1000:.1f} мс")
+    check(cancelled < latency, "close должен отменять запросы, не дожидаясь LLM")
+
+    if failures:
+        print(f"Не пройдено проверок: {len(failures)}")
+        sys.exit(1)
+    print("Все проверки пройдены")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--chats", type=int, default=LLM_MAX_CONCURRENCY, help="Одновременных чатов"
+    )
+    parser.add_argument("--latency", type=float, default=0.2)
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
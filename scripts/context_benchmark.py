@@ -0,0 +1,151 @@
+"""
+Размеры промптов DecisionMaker с бюджетом токенов и без него.
+
+Синтетические чаты с короткими и длинными сообщениями (и длинной сводкой
+ранней беседы) прогоняются через все методы DecisionMaker с заглушкой LLM,
+которая только запоминает промпты. Для каждого метода выводятся перцентили
+размера промпта в оценочных токенах и байтах при бюджете CONTEXT_TOKEN_BUDGET
+и без ограничения (как до введения бюджета), а также время сборки промпта.
+Если хотя бы один промпт превышает бюджет, скрипт завершается с кодом 1.
+
+Пример запуска:
+
+    python scripts/context_benchmark.py --chats 200 --long-ratio 0.2
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_TOKEN", "0:offline")
+os.environ.setdefault("LLM_PROVIDER", "stub")
+
+from bot.context import count_tokens  # noqa: E402
+from bot.decision_maker import DecisionMaker  # noqa: E402
+from bot.history import Message, MessageHistory  # noqa: E402
+from bot.llm import StubResponse  # noqa: E402
+from config import CONTEXT_TOKEN_BUDGET, HISTORY_SIZE  # noqa: E402
+
+WORDS = (
+    "привет как дела сегодня вчера матч обновление приложение версия думаю "
+    "согласен почему интересно новости планы выходные погода работа проект"
+).split()
+
+
+class CapturingLLM:
+    """Заглушка LLM, запоминающая промпты и отвечающая "Да"."""
+
+    def __init__(self):
+        self.prompts = []
+
+    async def ainvoke(self, prompt):
+        self.prompts.append(prompt[0])
+        return StubResponse("Да\nХорошо")
+
+
+def random_text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "?"
+
+
+def make_history(rng, messages, long_ratio, long_words):
+    history = MessageHistory(HISTORY_SIZE)
+    for _ in range(messages):
+        words = long_words if rng.random() < long_ratio else rng.randint(3, 15)
+        history.append(Message(f"Участник{rng.randrange(5)}", random_text(rng, words)))
+    return history
+
+
+async def collect(decision_maker, histories, summaries):
+    """Промпты всех методов DecisionMaker для каждого чата."""
+    llm = decision_maker.llm
+    prompts = {}
+    elapsed = 0.0
+    calls = (
+        ("should_respond", lambda h, s: decision_maker.should_respond(h, 100, 0, s)),
+        (
+            "combined",
+            lambda h, s: decision_maker._decide_and_generate_combined(
+                h, 100, 0, "Участник1", s
+            ),
+        ),
+        (
+            "generate_response",
+            lambda h, s: decision_maker.generate_response(h, "Участник1", s),
+        ),
+        ("initiate_conversation", decision_maker.initiate_conversation),
+    )
+    for name, call in calls:
+        llm.prompts = []
+        started = time.perf_counter()
+        for history, summary in zip(histories, summaries):
+            await call(history, summary)
+        elapsed += time.perf_counter() - started
+        prompts[name] = llm.prompts
+    return prompts, elapsed / (len(histories) * len(calls))
+
+
+def describe(values):
+    values = sorted(values)
+    return " ".join(
+        f"p{q}={values[min(len(values) - 1, len(values) * q // 100)]}"
+        for q in (50, 95, 100)
+    )
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    histories = [
+        make_history(rng, args.messages, args.long_ratio, args.long_words)
+        for _ in range(args.chats)
+    ]
+    summaries = [
+        random_text(rng, args.summary_words) if rng.random() < 0.5 else ""
+        for _ in histories
+    ]
+
+    results = {}
+    for label, budget in (("без бюджета", None), ("с бюджетом", args.budget)):
+        decision_maker = DecisionMaker(llm=CapturingLLM())
+        if budget is None:
+            # Все сообщения окна и сводка целиком, без обрезки
+            decision_maker.context.budget = 10**9
+            decision_maker.context.max_message_tokens = 10**9
+            decision_maker.context.summary_max_tokens = 10**9
+        else:
+            decision_maker.context.budget = budget
+        results[label] = await collect(decision_maker, histories, summaries)
+
+    violations = 0
+    for name in results["с бюджетом"][0]:
+        print(name)
+        for label, (prompts, _) in results.items():
+            tokens = [count_tokens(prompt) for prompt in prompts[name]]
+            sizes = [len(prompt.encode("utf-8")) for prompt in prompts[name]]
+            print(f"  {label}: токены {describe(tokens)}; байты {describe(sizes)}")
+            if label == "с бюджетом":
+                violations += sum(value > args.budget for value in tokens)
+    for label, (_, per_call) in results.items():
+        print(f"Время на вызов {label}: {per_call * 1e6:.1f} мкс")
+    print(f"Промптов с превышением бюджета {args.budget}: {violations}")
+    return violations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=HISTORY_SIZE)
+    parser.add_argument("--long-ratio", type=float, default=0.2)
+    parser.add_argument("--long-words", type=int, default=400)
+    parser.add_argument("--summary-words", type=int, default=300)
+    parser.add_argument("--budget", type=int, default=CONTEXT_TOKEN_BUDGET)
+    parser.add_argument("--seed", type=int, default=0)
+    violations = asyncio.run(run(parser.parse_args()))
+    sys.exit(1 if violations else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Офлайн-оценка кеша решений и ответов LLM на записанной переписке.
+
+Журнал (JSON Lines, как в replay_benchmark.py) или синтетическая переписка с
+повторяющимися вопросами воспроизводится через TelegramHandler дважды: без
+кеша и с кешем (RESPONSE_CACHE_* из config.py). Синтетические вопросы
+повторяются с небольшими изменениями (регистр, знаки препинания, слова-
+паразиты, опечатки), чтобы проверить приближённый уровень кеша. Отчёт: число
+запросов к LLM в обоих прогонах и сэкономленная доля, попадания по уровням и
+время поиска в кеше.
+
+Пример запуска:
+
+    python scripts/evaluate_cache.py --chats 50 --messages 40
+    python scripts/evaluate_cache.py --log chat.jsonl --global-scope
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_TOKEN", "0:offline")
+os.environ.setdefault("LLM_PROVIDER", "stub")
+
+import bot.decision_maker as decision_maker_module  # noqa: E402
+import bot.telegram_handler as telegram_handler  # noqa: E402
+from bot.decision_maker import DecisionMaker  # noqa: E402
+from bot.dispatcher import OutboundDispatcher  # noqa: E402
+from bot.llm import StubLLM  # noqa: E402
+from bot.response_cache import APPROXIMATE, EXACT, MISS  # noqa: E402
+from replay_benchmark import (  # noqa: E402
+    FakeBot,
+    load_log,
+    make_update,
+    percentiles,
+    synthetic_log as replay_log,
+)
+
+QUESTIONS = [
+    "Кто-нибудь смотрел вчерашний матч?",
+    "Как вам новая версия приложения?",
+    "Почему так долго не выходит обновление?",
+    "Где можно почитать подробнее?",
+    "Какая завтра будет погода?",
+    "Во сколько начинается встреча?",
+]
+FILLERS = ["ну", "кстати", "слушайте", "а"]
+
+
+def perturb(rng, text):
+    """Вариант вопроса: регистр, знаки препинания, слово-паразит или опечатка."""
+    variant = rng.randrange(4)
+    if variant == 1:
+        text = text.rstrip("?!.") + rng.choice(["??", "?!", ""])
+    elif variant == 2:
+        text = f"{rng.choice(FILLERS)}, {text[0].lower()}{text[1:]}"
+    elif variant == 3:
+        index = rng.randrange(1, len(text) - 2)
+        text = text[:index] + text[index + 1] + text[index] + text[index + 2 :]
+    return text.upper() if rng.random() < 0.1 else text
+
+
+def synthetic_log(chats, messages, repeat_ratio, seed):
+    """Переписка, где доля repeat_ratio сообщений - повторы частых вопросов."""
+    rng = random.Random(seed)
+    records = replay_log(chats, messages, 1.0, seed)
+    for record in records:
+        if rng.random() < repeat_ratio:
+            record["text"] = perturb(rng, rng.choice(QUESTIONS))
+    return records
+
+
+class LookupStats:
+    """Обёртка ResponseCache.get, считающая попадания и время поиска."""
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.tiers = {EXACT: 0, APPROXIMATE: 0, MISS: 0}
+        self.seconds = []
+        self._get = cache.get
+        cache.get = self.get
+
+    def get(self, kind, chat_id, text):
+        started = time.perf_counter()
+        value, tier = self._get(kind, chat_id, text)
+        self.seconds.append(time.perf_counter() - started)
+        self.tiers[tier] += 1
+        return value, tier
+
+
+class PromptSeededLLM(StubLLM):
+    """
+    Заглушка LLM, решение которой зависит только от промпта.
+
+    У StubLLM решения берутся из общей последовательности случайных чисел, и
+    пропуск запросов из-за кеша менял бы решения по остальным сообщениям.
+    """
+
+    def _answer(self, prompt):
+        text = prompt[-1] if isinstance(prompt, list) else prompt
+        self._random.seed(zlib.crc32(text.encode("utf-8")))
+        return super()._answer(prompt)
+
+
+async def replay(records, args, enabled):
+    """Последовательное воспроизведение: каждое сообщение обрабатывается до конца."""
+    decision_maker_module.RESPONSE_CACHE_ENABLED = enabled
+    decision_maker_module.RESPONSE_CACHE_PER_CHAT = not args.global_scope
+    decision_maker_module.RESPONSE_CACHE_THRESHOLD = args.threshold
+    telegram_handler.RESPONSE_DELAY = 0.0
+    telegram_handler.COALESCE_WINDOW = 0.0
+
+    llm = PromptSeededLLM(latency=0.0, yes_ratio=args.yes_ratio)
+    decision_maker = DecisionMaker(llm=llm)
+    decision_maker.decision_mode = args.mode
+    stats = LookupStats(decision_maker.cache) if enabled else None
+    fake_bot = FakeBot()
+    handler = telegram_handler.TelegramHandler(
+        os.environ["TELEGRAM_TOKEN"], decision_maker=decision_maker, bot=fake_bot
+    )
+    # Повторы разнесены во времени, а воспроизведение идёт без пауз, поэтому
+    # ограничения частоты ответов отключены
+    handler.pre_filter.min_bot_interval = 0.0
+    handler.outbound = OutboundDispatcher(1e9, 1, 1e9, 1, queue_size=len(records))
+    handler.outbound.start()
+    for record in records:
+        update = make_update(
+            fake_bot, record["chat_id"], record["user"], record["text"]
+        )
+        await handler.handle_message(update, None)
+        state = handler.chat_states.get(record["chat_id"])
+        while state.in_flight or (
+            state.summarizing is not None and not state.summarizing.done()
+        ):
+            await asyncio.sleep(0)
+    await handler.outbound.stop()
+    await decision_maker.close()
+    return llm.calls, fake_bot.replies, stats
+
+
+async def run(args):
+    if args.log:
+        records = load_log(args.log)
+    else:
+        records = synthetic_log(args.chats, args.messages, args.repeat_ratio, args.seed)
+
+    baseline_calls, baseline_replies, _ = await replay(records, args, False)
+    cached_calls, cached_replies, stats = await replay(records, args, True)
+
+    saved = baseline_calls - cached_calls
+    chats = len({record["chat_id"] for record in records})
+    print(f"Сообщений: {len(records)} в {chats} чатах")
+    print(f"Запросов к LLM без кеша: {baseline_calls} (ответов {baseline_replies})")
+    print(
+        f"Запросов к LLM с кешем: {cached_calls} (ответов {cached_replies}); "
+        f"сэкономлено {saved}, {saved / max(baseline_calls, 1):.1%}"
+    )
+    lookups = sum(stats.tiers.values())
+    print(
+        f"Обращений к кешу: {lookups}; точных попаданий {stats.tiers[EXACT]}, "
+        f"приближённых {stats.tiers[APPROXIMATE]}, промахов {stats.tiers[MISS]}"
+    )
+    if stats.seconds:
+        formatted = " ".join(
+            f"{key}={value * 1000:.1f}"
+            for key, value in percentiles(stats.seconds).items()
+        )
+        print(f"Время поиска в кеше, мкс: {formatted}")
+    print(f"Записей в кеше: {len(stats.cache)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--log", help="Записанная переписка в формате JSON Lines")
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=40, help="Сообщений на чат")
+    parser.add_argument(
+        "--repeat-ratio",
+        type=float,
+        default=0.5,
+        help="Доля повторяющихся вопросов в синтетической переписке",
+    )
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument(
+        "--global-scope", action="store_true", help="Общий кеш для всех чатов"
+    )
+    parser.add_argument("--yes-ratio", type=float, default=0.5)
+    parser.add_argument(
+        "--mode", choices=["separate", "combined", "speculative"], default="separate"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
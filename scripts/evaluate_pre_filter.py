@@ -0,0 +1,138 @@
+"""
+Офлайн-оценка предварительного фильтра на размеченном наборе сообщений.
+
+Формат входного файла - JSON Lines, по одному сообщению в строке:
+
+    {"text": "Кто знает, когда релиз?", "label": true, "addressed": false, "since_bot": 600}
+
+label - нужно ли было боту ответить; addressed и since_bot (секунды с последнего
+сообщения бота) необязательны.
+
+С --train классификатор обучается на случайной части выборки, а качество
+оценивается на отложенной части (--test-ratio), которую он не видел.
+
+Пример запуска:
+
+    python scripts/evaluate_pre_filter.py messages.jsonl
+    python scripts/evaluate_pre_filter.py messages.jsonl --train model.json
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.pre_filter import ASK_LLM, RESPOND, SKIP, PreFilter  # noqa: E402
+from language.russian_processor import RussianProcessor  # noqa: E402
+
+
+def load_samples(path, processor):
+    """Чтение размеченных сообщений и их обработка RussianProcessor."""
+    samples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            samples.append(
+                {
+                    "text": processor.process(record["text"]),
+                    "label": bool(record["label"]),
+                    "addressed": bool(record.get("addressed", False)),
+                    "since_bot": float(record.get("since_bot", math.inf)),
+                }
+            )
+    return samples
+
+
+def train(samples, epochs=20, learning_rate=0.1, seed=0):
+    """Обучение логистической регрессии на мешке слов стохастическим градиентом."""
+    rng = random.Random(seed)
+    order = list(samples)
+    bias = 0.0
+    weights = {}
+    for _ in range(epochs):
+        rng.shuffle(order)
+        for sample in order:
+            tokens = set(sample["text"].split())
+            z = bias + sum(weights.get(token, 0.0) for token in tokens)
+            error = float(sample["label"]) - 1.0 / (1.0 + math.exp(-z))
+            bias += learning_rate * error
+            for token in tokens:
+                weights[token] = weights.get(token, 0.0) + learning_rate * error
+    return {"bias": bias, "weights": weights}
+
+
+def evaluate(pre_filter, samples):
+    """Прогон фильтра по выборке и подсчёт качества однозначных решений."""
+    outcomes = {
+        (verdict, label): 0
+        for verdict in (RESPOND, SKIP, ASK_LLM)
+        for label in (True, False)
+    }
+    for sample in samples:
+        verdict = pre_filter.check(
+            [sample["text"]], sample["addressed"], sample["since_bot"], 0.0
+        )
+        outcomes[verdict, sample["label"]] += 1
+    return outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path", help="Размеченный файл JSON Lines")
+    parser.add_argument("--model", help="JSON с весами классификатора")
+    parser.add_argument(
+        "--train", metavar="OUT", help="Обучить классификатор и сохранить веса"
+    )
+    parser.add_argument(
+        "--test-ratio",
+        type=float,
+        default=0.2,
+        help="Доля выборки, отложенная для оценки при --train",
+    )
+    parser.add_argument("--min-bot-interval", type=float, default=30)
+    parser.add_argument("--min-tokens", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    samples = load_samples(args.path, RussianProcessor())
+    model_path = args.model
+    if args.train:
+        random.Random(args.seed).shuffle(samples)
+        split = round(len(samples) * (1 - args.test_ratio))
+        training, samples = samples[:split], samples[split:]
+        with open(args.train, "w", encoding="utf-8") as f:
+            json.dump(train(training, seed=args.seed), f, ensure_ascii=False)
+        model_path = args.train
+        print(f"Веса классификатора сохранены в {args.train}")
+        print(
+            f"Обучение на {len(training)} сообщениях, "
+            f"оценка на {len(samples)} отложенных"
+        )
+
+    pre_filter = PreFilter(
+        args.min_bot_interval, args.min_tokens, model_path=model_path
+    )
+    outcomes = evaluate(pre_filter, samples)
+
+    total = len(samples)
+    print(f"Сообщений: {total}")
+    for verdict in (RESPOND, SKIP, ASK_LLM):
+        correct = outcomes[verdict, verdict != SKIP]
+        count = correct + outcomes[verdict, verdict == SKIP]
+        line = f"{verdict:>8}: {count}"
+        if verdict != ASK_LLM and count:
+            line += f" (верно: {correct / count:.1%})"
+        print(line)
+    if total:
+        print(f"Избежано запросов к LLM: {pre_filter.avoided_calls / total:.1%}")
+        print(f"Пропущено нужных ответов: {outcomes[SKIP, True]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+"""
+Проверка LLMCallPolicy и DecisionMaker при отказах LLM.
+
+Вместо Gemini работают заглушки FaultyLLM, в которые внедряются отказы:
+медленный хвост задержек, ошибки, зависшие запросы. Сценарии:
+
+- hedge: часть ответов приходит с большой задержкой; сравниваются перцентили
+  задержки без хеджирования и с ним;
+- failover: основная модель возвращает ошибки, выключатель размыкается, и
+  запросы уходят к резервной модели, не дожидаясь ошибок основной;
+- recovery: основная модель восстанавливается, и через recovery_time
+  пробный запрос замыкает выключатель;
+- deadline: модели зависают, а запрос завершается по сроку метода;
+- outage: недоступны все модели; DecisionMaker решает по эвристике и молчит
+  вместо ответа-извинения, потоковый ответ переходит к резервной модели;
+- overload: запросы не дожидаются слота параллельности (локальная перегрузка
+  или поток, занявший слот, пока его получатель ждёт очереди отправки) -
+  исправная модель не считается отказавшей, а пробный запрос, отменённый в
+  ожидании слота, не блокирует следующие пробы.
+
+Если проверка не пройдена, скрипт завершается с кодом 1.
+
+Пример запуска:
+
+    python scripts/fault_injection.py --requests 400 --slow-ratio 0.02
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_TOKEN", "0:offline")
+os.environ.setdefault("LLM_PROVIDER", "stub")
+
+from bot.decision_maker import DecisionMaker  # noqa: E402
+from bot.history import Message, MessageHistory  # noqa: E402
+from bot.llm import StubLLM  # noqa: E402
+from bot.llm_policy import CLOSED, OPEN, LLMCallPolicy, LLMUnavailable  # noqa: E402
+from replay_benchmark import percentiles  # noqa: E402
+
+PROMPT = ["Ответьте на сообщение участника"]
+
+
+class InjectedError(Exception):
+    """Ошибка, внедрённая в заглушку LLM."""
+
+
+class FaultyLLM(StubLLM):
+    """
+    Заглушка LLM с внедряемыми отказами.
+
+    Доля slow_ratio запросов отвечает через slow_latency секунд, доля
+    error_ratio завершается InjectedError после latency; при hang запросы не
+    завершаются. Параметры можно менять между фазами сценария.
+    """
+
+    def __init__(
+        self, slow_ratio=0.0, slow_latency=1.0, error_ratio=0.0, hang=False, **kwargs
+    ):
+        super().__init__(**kwargs)
+        self.slow_ratio = slow_ratio
+        self.slow_latency = slow_latency
+        self.error_ratio = error_ratio
+        self.hang = hang
+
+    def _delay(self):
+        if self.hang:
+            return 3600
+        if self._random.random() < self.slow_ratio:
+            return self.slow_latency
+        return super()._delay()
+
+    def _fail(self):
+        return self._random.random() < self.error_ratio
+
+    async def ainvoke(self, prompt):
+        if self._fail():
+            self.calls += 1
+            await asyncio.sleep(self.latency)
+            raise InjectedError("внедрённая ошибка")
+        return await super().ainvoke(prompt)
+
+    async def astream(self, prompt):
+        if self._fail():
+            self.calls += 1
+            await asyncio.sleep(self.latency)
+            raise InjectedError("внедрённая ошибка")
+        async for chunk in super().astream(prompt):
+            yield chunk
+
+
+def make_policy(models, args, **kwargs):
+    options = dict(
+        deadlines={},
+        default_deadline=args.deadline,
+        max_concurrency=args.max_concurrency,
+        hedge_min_samples=20,
+        hedge_min_delay=0.0,
+        failure_threshold=5,
+        recovery_time=args.recovery_time,
+    )
+    options.update(kwargs)
+    return LLMCallPolicy(models, **options)
+
+
+async def timed_invoke(policy, method="generate_response"):
+    started = time.perf_counter()
+    try:
+        await policy.invoke(method, PROMPT)
+        ok = True
+    except LLMUnavailable:
+        ok = False
+    return time.perf_counter() - started, ok
+
+
+async def load(policy, requests, concurrency):
+    """requests запросов, не более concurrency одновременно."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            return await timed_invoke(policy)
+
+    return await asyncio.gather(*(one() for _ in range(requests)))
+
+
+def report(name, results):
+    latencies = [latency for latency, _ in results]
+    formatted = " ".join(
+        f"{key}={value:.0f}" for key, value in percentiles(latencies).items()
+    )
+    failed = sum(not ok for _, ok in results)
+    print(f"  {name}: задержка, мс: {formatted}; неудачных {failed}")
+    return percentiles(latencies)
+
+
+async def scenario_hedge(args, check):
+    print("hedge: медленный хвост задержек")
+    results = {}
+    for hedging in (False, True):
+        llm = FaultyLLM(
+            latency=args.latency,
+            jitter=args.latency,
+            slow_ratio=args.slow_ratio,
+            slow_latency=args.slow_latency,
+        )
+        # Без хеджирования порог замеров недостижим
+        policy = make_policy(
+            [("primary", llm)],
+            args,
+            hedge_min_samples=20 if hedging else args.requests + 1,
+        )
+        # Прогрев окна задержек
+        await load(policy, 40, args.concurrency)
+        results[hedging] = report(
+            "с хеджированием" if hedging else "без хеджирования",
+            await load(policy, args.requests, args.concurrency),
+        )
+        print(f"  запросов к модели: {llm.calls}")
+    check(
+        results[True]["p99"] < results[False]["p99"] / 2,
+        "хеджирование должно сократить p99 задержки хотя бы вдвое",
+    )
+
+
+async def scenario_failover(args, check):
+    print("failover: ошибки основной модели")
+    primary = FaultyLLM(latency=args.latency, error_ratio=1.0)
+    fallback = FaultyLLM(latency=args.latency)
+    policy = make_policy([("primary", primary), ("fallback", fallback)], args)
+    results = [await timed_invoke(policy) for _ in range(args.requests // 10)]
+    report("все запросы", results)
+    print(
+        f"  запросов к основной модели: {primary.calls}, "
+        f"к резервной: {fallback.calls}"
+    )
+    check(all(ok for _, ok in results), "на все запросы должна ответить резервная")
+    check(policy.models[0].breaker.state == OPEN, "выключатель должен разомкнуться")
+    check(policy.degraded, "политика должна сообщать о деградации")
+    check(
+        primary.calls <= 2 * policy.models[0].breaker.failure_threshold,
+        "после размыкания запросы к основной модели не отправляются",
+    )
+    return policy, primary
+
+
+async def scenario_recovery(args, check, policy, primary):
+    print("recovery: основная модель восстановилась")
+    primary.error_ratio = 0.0
+    calls = primary.calls
+    await timed_invoke(policy)
+    check(primary.calls == calls, "до recovery_time основная модель пропускается")
+    await asyncio.sleep(args.recovery_time)
+    await timed_invoke(policy)
+    breaker = policy.models[0].breaker
+    print(f"  после паузы {args.recovery_time} с: выключатель {breaker.state}")
+    check(breaker.state == CLOSED, "пробный запрос должен замкнуть выключатель")
+    check(not policy.degraded, "деградация должна закончиться")
+
+
+async def scenario_deadline(args, check):
+    print("deadline: модели зависают")
+    models = [
+        ("primary", FaultyLLM(latency=args.latency, hang=True)),
+        ("fallback", FaultyLLM(latency=args.latency, hang=True)),
+    ]
+    policy = make_policy(models, args, deadlines={"should_respond": args.deadline / 4})
+    for method, deadline in (
+        ("should_respond", args.deadline / 4),
+        ("generate_response", args.deadline),
+    ):
+        latency, ok = await timed_invoke(policy, method)
+        print(f"  {method}: срок {deadline:.2f} с, завершён через {latency:.2f} с")
+        check(not ok, "зависший запрос должен завершиться LLMUnavailable")
+        check(latency < deadline + 0.1, f"{method} должен уложиться в свой срок")
+    await policy.close()
+
+
+async def scenario_outage(args, check):
+    print("outage: недоступны все модели")
+    primary = FaultyLLM(latency=args.latency, error_ratio=1.0)
+    fallback = FaultyLLM(latency=args.latency, error_ratio=1.0)
+    decision_maker = DecisionMaker(llm=primary, fallback_llms=[("fallback", fallback)])
+    decision_maker.policy = make_policy(
+        [("primary", primary), ("fallback", fallback)], args
+    )
+    decision_maker.cache = None
+    question, statement = MessageHistory(10), MessageHistory(10)
+    question.append(Message("Участник", "кто смотрел матч ?"))
+    statement.append(Message("Участник", "я смотрел матч"))
+    now = time.time()
+
+    started = time.perf_counter()
+    decisions = [
+        await decision_maker.should_respond(history, now, 0)
+        for history in (question, statement) * 5
+    ]
+    elapsed = time.perf_counter() - started
+    print(f"  решения по эвристике: {decisions[:2]}, {elapsed * 100:.0f} мс на решение")
+    check(decisions == [True, False] * 5, "эвристика: отвечать только на вопросы")
+    calls = primary.calls + fallback.calls
+    await decision_maker.should_respond(question, now, 0)
+    check(
+        primary.calls + fallback.calls == calls,
+        "при разомкнутом выключателе решение принимается без запросов к LLM",
+    )
+
+    response = await decision_maker.generate_response(question)
+    check(response is None, "без LLM ответ не генерируется")
+    result = await decision_maker.decide_and_generate(question, now, 0)
+    check(result == (False, None), "без ответа бот молчит, а не извиняется")
+    chunks = [chunk async for chunk in decision_maker.stream_response(question)]
+    check(chunks == [], "потоковый ответ без LLM пуст")
+
+    # Резервная модель восстановилась: потоковый ответ идёт через неё
+    fallback.error_ratio = 0.0
+    await asyncio.sleep(args.recovery_time)
+    chunks = [chunk async for chunk in decision_maker.stream_response(question)]
+    print(f"  потоковый ответ резервной модели: {''.join(chunks)!r}")
+    check("".join(chunks) == fallback.reply, "поток должен перейти к резервной")
+    await decision_maker.close()
+
+
+async def scenario_overload(args, check):
+    print("overload: запросы ждут слота параллельности")
+    deadline = args.latency * 3
+    model = FaultyLLM(latency=args.latency, chunk_words=1)
+    policy = make_policy([("primary", model)], args, default_deadline=deadline)
+    policy._semaphore = asyncio.Semaphore(1)
+    breaker = policy.models[0].breaker
+    results = await asyncio.gather(*(timed_invoke(policy) for _ in range(20)))
+    failed = sum(not ok for _, ok in results)
+    print(
+        f"  20 запросов на один слот: неудачных {failed}, выключатель {breaker.state}"
+    )
+    check(failed > 0, "часть запросов должна не дождаться слота")
+    check(
+        breaker.state == CLOSED,
+        "запросы, не дождавшиеся слота, не считаются ошибками модели",
+    )
+
+    # Поток занимает слот, пока получатель фрагментов ждёт очереди отправки
+    breaker.record_success()
+    streaming = asyncio.Event()
+
+    async def slow_consumer():
+        try:
+            async for _ in policy.stream("stream_response", PROMPT):
+                streaming.set()
+                await asyncio.sleep(deadline)
+        except (asyncio.TimeoutError, LLMUnavailable):
+            pass
+        finally:
+            streaming.set()
+
+    consumer = asyncio.create_task(slow_consumer())
+    await streaming.wait()
+    results = await asyncio.gather(*(timed_invoke(policy) for _ in range(10)))
+    await consumer
+    failed = sum(not ok for _, ok in results)
+    print(
+        f"  поток с медленным получателем: неудачных запросов {failed}, "
+        f"выключатель {breaker.state}"
+    )
+    check(
+        breaker.state == CLOSED and breaker.failures == 0,
+        "медленный получатель потока не считается ошибкой модели",
+    )
+
+    # Пробный запрос отменён, пока ждал слота
+    breaker.state = OPEN
+    breaker._opened_at = -args.recovery_time
+    await policy._semaphore.acquire()
+    probe = asyncio.create_task(timed_invoke(policy))
+    await asyncio.sleep(args.latency)
+    probe.cancel()
+    await asyncio.gather(probe, return_exceptions=True)
+    policy._semaphore.release()
+    latency, ok = await timed_invoke(policy)
+    print(f"  проба после отменённой пробы: выключатель {breaker.state}")
+    check(ok and breaker.state == CLOSED, "после отмены пробы проба снова возможна")
+    await policy.close()
+
+
+async def run(args):
+    failures = []
+
+    def check(condition, description):
+        if not condition:
+            failures.append(description)
+            print(f"  НЕ ПРОЙДЕНО: {description}")
+
+    await scenario_hedge(args, check)
+    policy, primary = await scenario_failover(args, check)
+    await scenario_recovery(args, check, policy, primary)
+    await scenario_deadline(args, check)
+    await scenario_outage(args, check)
+    await scenario_overload(args, check)
+    if failures:
+        print(f"Не пройдено проверок: {len(failures)}")
+        sys.exit(1)
+    print("Все проверки пройдены")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument(
+        "--concurrency", type=int, default=4, help="Одновременных запросов"
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=8,
+        help="Слотов политики; хедж не отправляется, когда все заняты",
+    )
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--slow-ratio", type=float, default=0.02)
+    parser.add_argument("--slow-latency", type=float, default=1.0)
+    parser.add_argument("--deadline", type=float, default=2.0)
+    parser.add_argument("--recovery-time", type=float, default=0.3)
+    logging.basicConfig(level=logging.CRITICAL)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Микробенчмарк истории разговора: MessageHistory против списка со срезами.
+
+Прежняя история - список, который после каждого сообщения обрезается срезом
+[-size:], а построители промптов берут из него копии [-10:] и [-5:]. Для
+каждого варианта измеряется время добавления сообщения, выборки последних
+сообщений (с обходом, как при сборке промпта) и их сочетания на каждое
+сообщение; в конце для каждого замера печатается, во сколько раз
+MessageHistory быстрее списка (меньше 1 - медленнее). Попутно проверяется,
+что выборки совпадают; при расхождении скрипт завершается с кодом 1.
+
+Пример запуска:
+
+    python scripts/history_benchmark.py --size 20 --messages 100000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.history import Message, MessageHistory  # noqa: E402
+
+RECENT = (10, 5)  # Размеры выборок построителей промптов
+
+
+class ListHistory:
+    """Прежняя история: список с обрезкой и копиями последних сообщений."""
+
+    def __init__(self, size):
+        self.size = size
+        self.messages = []
+
+    def append(self, message):
+        self.messages.append(message)
+        self.messages = self.messages[-self.size :]
+
+    def last(self, count):
+        return self.messages[-count:]
+
+
+def per_message(run, messages):
+    started = time.perf_counter()
+    run()
+    return (time.perf_counter() - started) / messages * 1e9
+
+
+def bench(factory, messages, size, repeat):
+    """Наилучшее из repeat время в нс на сообщение: добавление, выборки, вместе."""
+    items = [
+        Message(f"Участник{index % 5}", f"сообщение {index}")
+        for index in range(messages)
+    ]
+
+    def append_only():
+        history = factory(size)
+        for item in items:
+            history.append(item)
+
+    filled = factory(size)
+    for item in items[:size]:
+        filled.append(item)
+
+    def views_only():
+        for _ in range(messages):
+            for count in RECENT:
+                for _ in filled.last(count):
+                    pass
+
+    def both():
+        history = factory(size)
+        for item in items:
+            history.append(item)
+            for count in RECENT:
+                for _ in history.last(count):
+                    pass
+
+    return [
+        min(per_message(run, messages) for _ in range(repeat))
+        for run in (append_only, views_only, both)
+    ]
+
+
+def check_equal(messages, size):
+    ring, reference = MessageHistory(size), ListHistory(size)
+    for index in range(messages):
+        item = Message("Участник", f"сообщение {index}")
+        ring.append(item)
+        reference.append(item)
+        for count in (*RECENT, size, size + 1):
+            if list(ring.last(count)) != reference.last(count):
+                return False
+    return list(ring) == reference.messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=20, help="Размер истории")
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if not check_equal(args.size * 3, args.size):
+        print("НЕ ПРОЙДЕНО: выборки MessageHistory и списка различаются")
+        sys.exit(1)
+
+    results = {
+        "список": bench(ListHistory, args.messages, args.size, args.repeat),
+        "MessageHistory": bench(MessageHistory, args.messages, args.size, args.repeat),
+    }
+    print(f"Сообщений: {args.messages}, размер истории {args.size}, нс на сообщение:")
+    for name, (append, views, both) in results.items():
+        print(
+            f"  {name}: добавление {append:.0f}, выборки {views:.0f}, "
+            f"добавление и выборки {both:.0f}"
+        )
+    print("Во сколько раз MessageHistory быстрее списка:")
+    for name, old, new in zip(
+        ("добавление", "выборки", "добавление и выборки"),
+        results["список"],
+        results["MessageHistory"],
+    ):
+        print(f"  {name}: {old / new:.2f}")
+
+
+if __name__ == "__main__":
+    main()
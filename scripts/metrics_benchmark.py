@@ -0,0 +1,232 @@
+"""
+Накладные расходы метрик: стоимость операций и их доля в обработке сообщения.
+
+Сначала измеряется стоимость отдельных операций bot/metrics.py: инкремент
+счётчика, наблюдение гистограммы, замер блока через time(), обёртка timed
+вокруг корутины и отрисовка /metrics. Затем через TelegramHandler со StubLLM
+без задержки (RESPONSE_DELAY и окно объединения нулевые, ответ на каждое
+сообщение) прогоняется синтетическая переписка: один раз с подсчётом
+операций метрик на сообщение, второй - для замера процессорного времени на
+сообщение. Оценка сверху накладных расходов - число операций, умноженное на
+стоимость самой дорогой операции своего вида.
+
+Если доля метрик в обработке сообщения больше --max-share, скрипт
+завершается с кодом 1.
+
+Пример запуска:
+
+    python scripts/metrics_benchmark.py --chats 100 --messages 20
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_TOKEN", "0:offline")
+os.environ.setdefault("LLM_PROVIDER", "stub")
+
+import bot.telegram_handler as telegram_handler  # noqa: E402
+from bot import metrics  # noqa: E402
+from bot.decision_maker import DecisionMaker  # noqa: E402
+from bot.dispatcher import OutboundDispatcher  # noqa: E402
+from bot.llm import StubLLM  # noqa: E402
+from replay_benchmark import FakeBot, make_update, synthetic_log  # noqa: E402
+
+
+def per_call(run, calls, repeat):
+    """Наилучшее из repeat время одного вызова в наносекундах."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run(calls)
+        best = min(best, time.perf_counter() - started)
+    return best / calls * 1e9
+
+
+def primitives(calls, repeat):
+    """Стоимость операций метрик в наносекундах."""
+    counter = metrics.Counter("bench_total", "Счётчик", ["kind"])
+    histogram = metrics.Histogram("bench_seconds", "Гистограмма", ["stage"])
+
+    def inc(calls):
+        for _ in range(calls):
+            counter.labels("a").inc()
+
+    def observe(calls):
+        for _ in range(calls):
+            histogram.labels("a").observe(0.01)
+
+    def timer(calls):
+        for _ in range(calls):
+            with histogram.labels("a").time():
+                pass
+
+    def empty(calls):
+        for _ in range(calls):
+            pass
+
+    async def plain():
+        pass
+
+    decorated = metrics.timed(histogram.labels("b"))(plain)
+
+    def awaiting(function):
+        def run(calls):
+            async def main():
+                for _ in range(calls):
+                    await function()
+
+            loop.run_until_complete(main())
+
+        return run
+
+    loop = asyncio.new_event_loop()
+    try:
+        base = per_call(empty, calls, repeat)
+        plain_cost = per_call(awaiting(plain), calls, repeat)
+        costs = {
+            "inc": per_call(inc, calls, repeat) - base,
+            "observe": per_call(observe, calls, repeat) - base,
+            "time": per_call(timer, calls, repeat) - base,
+            "timed": per_call(awaiting(decorated), calls, repeat) - plain_cost,
+        }
+    finally:
+        loop.close()
+    return costs
+
+
+class OperationCounter:
+    """Подсчёт вызовов операций метрик подменой методов классов."""
+
+    METHODS = [
+        (metrics._HistogramValue, "observe", "observe"),
+        (metrics._Value, "inc", "inc"),
+        (metrics._Value, "dec", "inc"),
+        (metrics._Value, "set", "inc"),
+    ]
+
+    def __init__(self):
+        self.counts = {"observe": 0, "inc": 0}
+        self._originals = []
+
+    def __enter__(self):
+        for cls, name, kind in self.METHODS:
+            original = getattr(cls, name)
+            self._originals.append((cls, name, original))
+
+            def counting(*args, original=original, kind=kind):
+                self.counts[kind] += 1
+                return original(*args)
+
+            setattr(cls, name, counting)
+        return self
+
+    def __exit__(self, *exc_info):
+        for cls, name, original in self._originals:
+            setattr(cls, name, original)
+
+
+async def replay(records):
+    """Обработка переписки; процессорное время в секундах."""
+    telegram_handler.RESPONSE_DELAY = 0.0
+    telegram_handler.COALESCE_WINDOW = 0.0
+    telegram_handler.STREAMING_REPLIES = False
+    decision_maker = DecisionMaker(llm=StubLLM(latency=0, jitter=0, yes_ratio=1))
+    decision_maker.cache = None
+    fake_bot = FakeBot()
+    handler = telegram_handler.TelegramHandler(
+        os.environ["TELEGRAM_TOKEN"], decision_maker=decision_maker, bot=fake_bot
+    )
+    handler.pre_filter = None
+    handler.storage = None
+    handler.outbound = OutboundDispatcher(1e9, 1, 1e9, 1, queue_size=1000)
+    handler.outbound.start()
+
+    started = time.process_time()
+    for record in records:
+        update = make_update(
+            fake_bot, record["chat_id"], record["user"], record["text"]
+        )
+        await handler.handle_message(update, None)
+        # Сообщения не объединяются: каждое получает своё решение и ответ
+        state = handler.chat_states.get(record["chat_id"])
+        while state.in_flight:
+            await asyncio.wait(
+                [task for task in (state.pending_reply, state.replying) if task]
+            )
+    elapsed = time.process_time() - started
+
+    await handler.outbound.stop()
+    await decision_maker.close()
+    return elapsed, fake_bot.replies
+
+
+def run(args):
+    failures = []
+
+    def check(condition, description):
+        if not condition:
+            failures.append(description)
+            print(f"  НЕ ПРОЙДЕНО: {description}")
+
+    costs = primitives(args.calls, args.repeat)
+    print(
+        "Стоимость операций, нс: "
+        + ", ".join(f"{name} {cost:.0f}" for name, cost in costs.items())
+    )
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        metrics.REGISTRY.render()
+    render = (time.perf_counter() - started) / args.repeat
+    print(f"Отрисовка /metrics: {render * 1e6:.0f} мкс")
+
+    records = synthetic_log(args.chats, args.messages, 0, args.seed)
+    with OperationCounter() as operations:
+        asyncio.run(replay(records))
+    elapsed, replies = min(asyncio.run(replay(records)) for _ in range(args.repeat))
+
+    per_message = elapsed / len(records) * 1e9
+    counts = {kind: count / len(records) for kind, count in operations.counts.items()}
+    overhead = (
+        counts["observe"] * max(costs["observe"], costs["time"], costs["timed"])
+        + counts["inc"] * costs["inc"]
+    )
+    share = overhead / per_message
+    print(
+        f"Сообщений: {len(records)}, ответов {replies}; на сообщение "
+        f"{counts['observe']:.1f} наблюдений гистограмм и "
+        f"{counts['inc']:.1f} изменений счётчиков"
+    )
+    print(
+        f"Процессорное время на сообщение {per_message / 1000:.0f} мкс, "
+        f"метрики не более {overhead / 1000:.1f} мкс ({share:.1%})"
+    )
+    check(
+        share <= args.max_share,
+        f"доля метрик не должна превышать {args.max_share:.0%}",
+    )
+
+    if failures:
+        print(f"Не пройдено проверок: {len(failures)}")
+        sys.exit(1)
+    print("Все проверки пройдены")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=20, help="Сообщений на чат")
+    parser.add_argument("--calls", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-share", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    logging.basicConfig(level=logging.WARNING)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Нагрузочный тест очереди исходящих сообщений на поддельном Bot API.
+
+Поддельный Bot API проверяет лимиты Telegram скользящими окнами (не больше 30
+сообщений в секунду на бота и 20 в минуту на группу) и на каждое превышение
+отвечает ошибкой RetryAfter (429). Все сообщения всех чатов отправляются
+одновременно через OutboundDispatcher с настройками из config.py, а с --direct
+- напрямую, как до появления очереди. Отчёт: число ответов 429, пропускная
+способность относительно лимита и время ожидания в очереди по приоритетам.
+
+--speedup ускоряет тест: лимиты поддельного API и настройки очереди умножаются
+на одно и то же число.
+
+Пример запуска:
+
+    python scripts/outbound_load_test.py --chats 60 --messages 5
+    python scripts/outbound_load_test.py --direct
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import deque
+from functools import partial
+
+from telegram.error import RetryAfter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_TOKEN", "0:offline")
+os.environ.setdefault("LLM_PROVIDER", "stub")
+
+from bot.dispatcher import PROACTIVE, REPLY, OutboundDispatcher  # noqa: E402
+from config import (  # noqa: E402
+    OUTBOUND_CHAT_BURST,
+    OUTBOUND_CHAT_RATE,
+    OUTBOUND_GLOBAL_BURST,
+    OUTBOUND_GLOBAL_RATE,
+    OUTBOUND_MAX_RETRIES,
+)
+
+GLOBAL_LIMIT = (30, 1.0)  # Сообщений на бота за окно в секундах
+CHAT_LIMIT = (20, 60.0)  # Сообщений на группу за окно в секундах
+
+
+class SlidingWindow:
+    """Не больше limit событий за любые period секунд."""
+
+    def __init__(self, limit, period):
+        self.limit = limit
+        self.period = period
+        self.events = deque()
+
+    def allow(self, now):
+        while self.events and self.events[0] <= now - self.period:
+            self.events.popleft()
+        if len(self.events) >= self.limit:
+            return False
+        self.events.append(now)
+        return True
+
+
+class FakeBotAPI:
+    """Поддельный Bot API с лимитами Telegram и фиксированной задержкой."""
+
+    def __init__(self, latency, speedup):
+        self.latency = latency
+        self.speedup = speedup
+        self.global_window = SlidingWindow(GLOBAL_LIMIT[0], GLOBAL_LIMIT[1] / speedup)
+        self.chat_windows = {}
+        self.delivered = []  # Время доставки сообщений
+        self.rejected = 0  # Ответы 429
+
+    async def send_message(self, chat_id, text):
+        now = time.monotonic()
+        chat_window = self.chat_windows.setdefault(
+            chat_id, SlidingWindow(CHAT_LIMIT[0], CHAT_LIMIT[1] / self.speedup)
+        )
+        if not self.global_window.allow(now) or not chat_window.allow(now):
+            self.rejected += 1
+            await asyncio.sleep(self.latency)
+            raise RetryAfter(1)
+        self.delivered.append(now)
+        await asyncio.sleep(self.latency)
+        return text
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, len(values) * q // 100)] * 1000
+
+
+async def run(args):
+    api = FakeBotAPI(args.latency, args.speedup)
+    dispatcher = OutboundDispatcher(
+        global_rate=OUTBOUND_GLOBAL_RATE * args.speedup,
+        global_burst=OUTBOUND_GLOBAL_BURST,
+        chat_rate=OUTBOUND_CHAT_RATE * args.speedup,
+        chat_burst=OUTBOUND_CHAT_BURST,
+        queue_size=args.chats * args.messages,
+        max_retries=OUTBOUND_MAX_RETRIES,
+    )
+    dispatcher.start()
+    rng = random.Random(args.seed)
+    waits = {REPLY: [], PROACTIVE: []}
+    failed = 0
+
+    async def send(chat_id, number):
+        nonlocal failed
+        priority = PROACTIVE if rng.random() < args.proactive_ratio else REPLY
+        request = partial(api.send_message, chat_id, f"Сообщение {number}")
+        started = time.monotonic()
+        try:
+            if args.direct:
+                await request()
+            else:
+                await dispatcher.send(chat_id, request, priority)
+        except RetryAfter:
+            failed += 1
+            return
+        waits[priority].append(time.monotonic() - started - args.latency)
+
+    started = time.monotonic()
+    await asyncio.gather(
+        *(
+            send(-100 - chat, number)
+            for number in range(args.messages)
+            for chat in range(args.chats)
+        )
+    )
+    elapsed = time.monotonic() - started
+    await dispatcher.stop()
+
+    delivered = len(api.delivered)
+    span = api.delivered[-1] - api.delivered[0] if delivered > 1 else 0
+    limit = GLOBAL_LIMIT[0] / GLOBAL_LIMIT[1] * args.speedup
+    print(f"Доставлено: {delivered} из {args.chats * args.messages} за {elapsed:.1f} с")
+    print(f"Ответов 429: {api.rejected}, не доставлено: {failed}")
+    if span:
+        throughput = (delivered - 1) / span
+        print(
+            f"Пропускная способность: {throughput:.1f} сообщ/с "
+            f"({throughput / limit:.0%} от лимита {limit:.0f} сообщ/с)"
+        )
+    for priority, name in ((REPLY, "ответы"), (PROACTIVE, "проактивные")):
+        if waits[priority]:
+            print(
+                f"Ожидание в очереди ({name}), мс: "
+                f"p50={percentile(waits[priority], 50):.0f} "
+                f"p99={percentile(waits[priority], 99):.0f}"
+            )
+    return api.rejected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chats", type=int, default=60)
+    parser.add_argument("--messages", type=int, default=5, help="Сообщений на чат")
+    parser.add_argument("--proactive-ratio", type=float, default=0.3)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--speedup", type=float, default=1.0)
+    parser.add_argument(
+        "--direct", action="store_true", help="Отправка напрямую, без очереди"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    rejected = asyncio.run(run(parser.parse_args()))
+    sys.exit(1 if rejected else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+"""
+Офлайн-бенчмарк бота: воспроизведение переписки без Telegram и Gemini.
+
+Сообщения из записанного журнала (JSON Lines с полями chat_id, user, text и
+необязательным t - секундами от начала) или синтетической переписки подаются
+в TelegramHandler.handle_message через поддельные объекты Update, ответы
+уходят в поддельного бота, а вместо Gemini используется StubLLM с заданной
+задержкой. После воспроизведения бенчмарк ждёт проактивные сообщения.
+
+Отчёт: сообщений в секунду, перцентили задержек решения и генерации, время от
+получения сообщения до первого текста ответа и до его окончательного вида,
+число запросов к LLM на сообщение и пиковое потребление памяти. С --stream
+ответы отправляются потоково с правками сообщения. С --compare-modes одна и
+та же переписка воспроизводится во всех режимах DecisionMaker (separate,
+combined, speculative), и результаты выводятся одной таблицей. С --json
+результаты сохраняются в файл для сравнения в CI.
+
+Пример запуска:
+
+    python scripts/replay_benchmark.py --chats 200 --messages 20 --llm-latency 0.2
+    python scripts/replay_benchmark.py --log chat.jsonl --speed 10 --json result.json
+    python scripts/replay_benchmark.py --stream --chunk-delay 0.05 --response-delay 0
+    python scripts/replay_benchmark.py --compare-modes --chats 50 --yes-ratio 0.3
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_TOKEN", "0:offline")
+os.environ.setdefault("LLM_PROVIDER", "stub")
+
+import bot.telegram_handler as telegram_handler  # noqa: E402
+from bot.decision_maker import DecisionMaker  # noqa: E402
+from bot.llm import StubLLM  # noqa: E402
+
+MODES = ["separate", "combined", "speculative"]  # Режимы DecisionMaker
+
+SYNTHETIC_PHRASES = [
+    "Всем привет",
+    "Кто-нибудь смотрел вчерашний матч?",
+    "Да, было интересно",
+    "Как вам новая версия приложения?",
+    "Я думаю, что это хорошая идея",
+    "Почему так долго не выходит обновление?",
+    "Согласен",
+    "Давайте обсудим планы на выходные",
+    "Где можно почитать подробнее?",
+    "Спасибо",
+]
+
+
+class FakeBot:
+    """Поддельный бот Telegram, запоминающий отправленные сообщения."""
+
+    id = 1
+    username = "context_aware_bot"
+
+    def __init__(self):
+        self.replies = 0
+        self.proactive = 0
+        self.edits = 0
+        self.sent = []  # Отправленные ответы (FakeSentMessage)
+
+    async def send_message(self, chat_id, text):
+        self.proactive += 1
+
+
+class FakeSentMessage:
+    """Отправленный ответ с методом edit_text и временем отправки и правок."""
+
+    def __init__(self, bot, received, text):
+        self._bot = bot
+        self.received = received  # Время получения сообщения, на которое дан ответ
+        self.first_text = self.final_text = time.perf_counter()
+        self.text = text
+
+    async def edit_text(self, text):
+        self._bot.edits += 1
+        self.final_text = time.perf_counter()
+        self.text = text
+
+
+class FakeMessage:
+    """Поддельное входящее сообщение с методом reply_text."""
+
+    def __init__(self, bot, chat_type, text):
+        self._bot = bot
+        self.chat = SimpleNamespace(type=chat_type)
+        self.text = text
+        self.reply_to_message = None
+        self.received = time.perf_counter()
+
+    async def reply_text(self, text):
+        self._bot.replies += 1
+        sent = FakeSentMessage(self._bot, self.received, text)
+        self._bot.sent.append(sent)
+        return sent
+
+
+def make_update(bot, chat_id, user, text, chat_type="supergroup"):
+    """Поддельный Update с текстовым сообщением в групповом чате."""
+    return SimpleNamespace(
+        message=FakeMessage(bot, chat_type, text),
+        effective_user=SimpleNamespace(first_name=user),
+        effective_chat=SimpleNamespace(id=chat_id),
+    )
+
+
+def load_log(path):
+    """Чтение записанной переписки в формате JSON Lines."""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                record.setdefault("t", 0.0)
+                records.append(record)
+    records.sort(key=lambda record: record["t"])
+    return records
+
+
+def synthetic_log(chats, messages, interval, seed):
+    """Синтетическая переписка: messages сообщений в каждом из chats чатов."""
+    rng = random.Random(seed)
+    records = []
+    for chat in range(chats):
+        t = rng.uniform(0, interval)
+        for _ in range(messages):
+            records.append(
+                {
+                    "chat_id": -100 - chat,
+                    "user": f"Участник{rng.randrange(5)}",
+                    "text": rng.choice(SYNTHETIC_PHRASES),
+                    "t": t,
+                }
+            )
+            t += rng.expovariate(1 / interval) if interval else 0.0
+    records.sort(key=lambda record: record["t"])
+    return records
+
+
+def percentiles(values):
+    """Перцентили p50/p95/p99 в миллисекундах."""
+    if not values:
+        return {}
+    values = sorted(values)
+    return {
+        f"p{q}": values[min(len(values) - 1, len(values) * q // 100)] * 1000
+        for q in (50, 95, 99)
+    }
+
+
+def instrument(decision_maker, latencies):
+    """Замер длительности методов DecisionMaker по стадиям."""
+    stages = {
+        "should_respond": "decision",
+        "_decide_and_generate_combined": "decision",
+        "generate_response": "generation",
+        "initiate_conversation": "initiation",
+    }
+    for name, stage in stages.items():
+        method = getattr(decision_maker, name)
+
+        async def timed(*args, _method=method, _stage=stage, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await _method(*args, **kwargs)
+            finally:
+                latencies[_stage].append(time.perf_counter() - started)
+
+        setattr(decision_maker, name, timed)
+
+
+async def run(args):
+    telegram_handler.RESPONSE_DELAY = args.response_delay
+    telegram_handler.COALESCE_WINDOW = args.coalesce_window
+    telegram_handler.COALESCE_MAX_DELAY = max(
+        args.coalesce_window, telegram_handler.COALESCE_MAX_DELAY
+    )
+    telegram_handler.STREAMING_REPLIES = args.stream
+    telegram_handler.STREAM_EDIT_INTERVAL = args.edit_interval
+
+    if args.log:
+        records = load_log(args.log)
+    else:
+        records = synthetic_log(args.chats, args.messages, args.interval, args.seed)
+
+    llm = StubLLM(
+        latency=args.llm_latency,
+        jitter=args.llm_jitter,
+        yes_ratio=args.yes_ratio,
+        seed=args.seed,
+        chunk_delay=args.chunk_delay,
+    )
+    decision_maker = DecisionMaker(llm=llm)
+    decision_maker.decision_mode = args.mode
+    decision_maker.min_human_response_time = args.proactive_after
+    decision_maker.proactive_threshold = args.proactive_after
+    latencies = {"decision": [], "generation": [], "initiation": []}
+    instrument(decision_maker, latencies)
+
+    fake_bot = FakeBot()
+    handler = telegram_handler.TelegramHandler(
+        os.environ["TELEGRAM_TOKEN"], decision_maker=decision_maker, bot=fake_bot
+    )
+    if args.no_prefilter:
+        handler.pre_filter = None
+    else:
+        handler.pre_filter.min_bot_interval = args.min_bot_interval
+    handler.outbound.start()
+    handler.scheduler.start()
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    for record in records:
+        if args.speed:
+            delay = started + record["t"] / args.speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        update = make_update(
+            fake_bot, record["chat_id"], record["user"], record["text"]
+        )
+        await handler.handle_message(update, None)
+        await asyncio.sleep(0)
+
+    # Ожидание завершения всех отложенных ответов
+    while any(state.in_flight for state in handler.chat_states):
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+
+    await asyncio.sleep(args.drain)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    await handler.scheduler.stop()
+    await handler.outbound.stop()
+    await decision_maker.close()
+
+    messages = len(records)
+    result = {
+        "messages": messages,
+        "chats": len({record["chat_id"] for record in records}),
+        "mode": args.mode,
+        "elapsed_s": elapsed,
+        "messages_per_s": messages / elapsed if elapsed else 0.0,
+        "llm_calls": llm.calls,
+        "llm_calls_per_message": llm.calls / messages if messages else 0.0,
+        "replies": fake_bot.replies,
+        "proactive_messages": fake_bot.proactive,
+        "decision_ms": percentiles(latencies["decision"]),
+        "generation_ms": percentiles(latencies["generation"]),
+        "initiation_ms": percentiles(latencies["initiation"]),
+        "first_text_ms": percentiles(
+            [sent.first_text - sent.received for sent in fake_bot.sent]
+        ),
+        "final_text_ms": percentiles(
+            [sent.final_text - sent.received for sent in fake_bot.sent]
+        ),
+        "edits": fake_bot.edits,
+        "peak_memory_mb": peak_memory / 1024 / 1024,
+    }
+    if handler.pre_filter is not None:
+        result["prefilter_avoided_calls"] = handler.pre_filter.avoided_calls
+    return result
+
+
+def print_comparison(results):
+    """Таблица результатов по режимам DecisionMaker."""
+    first = next(iter(results.values()))
+    print(f"Сообщений: {first['messages']} в {first['chats']} чатах")
+    columns = [
+        ("режим", 12),
+        ("LLM/сообщ", 10),
+        ("ответов", 8),
+        ("решение p50", 12),
+        ("решение p95", 12),
+        ("ответ p50", 10),
+        ("ответ p95", 10),
+    ]
+    print(" ".join(f"{name:>{width}}" for name, width in columns))
+    for mode, result in results.items():
+        decision = result["decision_ms"]
+        reply = result["first_text_ms"]
+        row = [
+            mode,
+            f"{result['llm_calls_per_message']:.2f}",
+            str(result["replies"]),
+            f"{decision.get('p50', 0):.1f}",
+            f"{decision.get('p95', 0):.1f}",
+            f"{reply.get('p50', 0):.1f}",
+            f"{reply.get('p95', 0):.1f}",
+        ]
+        print(" ".join(f"{value:>{width}}" for value, (_, width) in zip(row, columns)))
+    print("Задержки в мс; ответ - от получения сообщения до первого текста ответа")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--log", help="Записанная переписка в формате JSON Lines")
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=20, help="Сообщений на чат")
+    parser.add_argument(
+        "--interval", type=float, default=1.0, help="Средний интервал в чате, с"
+    )
+    parser.add_argument(
+        "--speed", type=float, default=0, help="Ускорение времени (0 - без пауз)"
+    )
+    parser.add_argument("--llm-latency", type=float, default=0.1)
+    parser.add_argument("--llm-jitter", type=float, default=0.05)
+    parser.add_argument(
+        "--chunk-delay",
+        type=float,
+        default=0.0,
+        help="Интервал между фрагментами ответа заглушки LLM, с",
+    )
+    parser.add_argument("--stream", action="store_true", help="Потоковые ответы")
+    parser.add_argument(
+        "--edit-interval",
+        type=float,
+        default=1.0,
+        help="Минимальный интервал между правками сообщения, с",
+    )
+    parser.add_argument("--yes-ratio", type=float, default=0.5)
+    parser.add_argument("--mode", choices=MODES, default="separate")
+    parser.add_argument(
+        "--compare-modes",
+        action="store_true",
+        help="Воспроизвести переписку во всех режимах и сравнить их",
+    )
+    parser.add_argument("--no-prefilter", action="store_true")
+    parser.add_argument(
+        "--min-bot-interval",
+        type=float,
+        default=0.0,
+        help="Минимальный интервал между ответами в предварительном фильтре, с",
+    )
+    parser.add_argument("--response-delay", type=float, default=0.0)
+    parser.add_argument("--coalesce-window", type=float, default=0.05)
+    parser.add_argument("--proactive-after", type=float, default=1.0)
+    parser.add_argument(
+        "--drain", type=float, default=2.0, help="Ожидание проактивных сообщений, с"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", metavar="PATH", help="Сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    if args.compare_modes:
+        results = {
+            mode: asyncio.run(run(argparse.Namespace(**{**vars(args), "mode": mode})))
+            for mode in MODES
+        }
+        print_comparison(results)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+        return
+    result = asyncio.run(run(args))
+
+    print(f"Сообщений: {result['messages']} в {result['chats']} чатах")
+    print(f"Сообщений в секунду: {result['messages_per_s']:.1f}")
+    print(f"Запросов к LLM на сообщение: {result['llm_calls_per_message']:.2f}")
+    for stage in ("decision", "generation", "initiation", "first_text", "final_text"):
+        values = result[f"{stage}_ms"]
+        if values:
+            formatted = " ".join(f"{key}={value:.1f}" for key, value in values.items())
+            print(f"Задержка {stage}, мс: {formatted}")
+    print(
+        f"Ответов: {result['replies']} (правок: {result['edits']}), "
+        f"проактивных сообщений: {result['proactive_messages']}"
+    )
+    print(f"Пиковая память: {result['peak_memory_mb']:.1f} МБ")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
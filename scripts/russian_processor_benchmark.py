@@ -0,0 +1,188 @@
+"""
+Проверка токенизации RussianProcessor и её пропускная способность.
+
+Случайные тексты из русских и английских слов, чисел, знаков препинания,
+кавычек и многоточий токенизируются RussianProcessor.tokenize и эталоном -
+nltk.word_tokenize. Если данных punkt нет (офлайн), эталоном служит
+токенизатор Treebank, которым nltk.word_tokenize разбирает каждое
+предложение; это сообщается в отчёте. Любое расхождение - ошибка, скрипт
+завершается с кодом 1.
+
+Затем на корпусе синтетических сообщений сравниваются process_many и прежний
+путь обработки: lower, nltk.word_tokenize и четыре записи журнала уровня INFO
+с f-строками на каждое сообщение. Журнал пишется в os.devnull с уровнем
+--log-level (как у бота, INFO).
+
+Пример запуска:
+
+    python scripts/russian_processor_benchmark.py --texts 50000 --corpus 10000
+"""
+
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from language.russian_processor import RussianProcessor  # noqa: E402
+from replay_benchmark import SYNTHETIC_PHRASES  # noqa: E402
+
+WORDS = (
+    "привет как дела кто-нибудь знает настроить nginx сервер версия матч "
+    "ёлка объявление hello world python bot cannot gonna wanna gimme "
+    "it's don't Москва Ёжик"
+).split()
+NUMBERS = ["1", "42", "2024", "1,5", "10:30", "3.14", "1-2", "100%"]
+PUNCTUATION = [",", ";", ":", "!", "?", "(", ")", "-", "--", ",,", ".", "..."]
+QUOTES = ['"', "«", "»", "'", "``", "''"]
+# Части, из которых состоят простые тексты (быстрый путь tokenize)
+SIMPLE_NUMBERS = ["1", "42", "2024", "1,5", "10:30", "1-2"]
+SIMPLE_PUNCTUATION = [",", ";", ":", "!", "?", "(", ")", "-", "--", ",,"]
+
+
+def reference_tokenizer():
+    """
+    Эталонный токенизатор и его описание для отчёта.
+
+    :return: Пара (функция text -> список токенов, описание).
+    """
+    import nltk
+
+    try:
+        nltk.word_tokenize("проверка", language="russian")
+    except LookupError:
+        from nltk.tokenize import NLTKWordTokenizer
+
+        return (
+            NLTKWordTokenizer().tokenize,
+            "токенизатор Treebank (данных punkt нет, разбиение на предложения "
+            "не проверяется)",
+        )
+    return (
+        lambda text: nltk.word_tokenize(text, language="russian"),
+        "nltk.word_tokenize",
+    )
+
+
+def fuzz_text(rng, simple):
+    """
+    Случайный текст в нижнем регистре, как его получает tokenize.
+
+    :param simple: Собирать текст только из частей простых текстов.
+    """
+    numbers = SIMPLE_NUMBERS if simple else NUMBERS
+    punctuation = SIMPLE_PUNCTUATION if simple else PUNCTUATION
+    parts = []
+    for _ in range(rng.randint(1, 12)):
+        kind = rng.random()
+        if kind < 0.55:
+            parts.append(rng.choice(WORDS))
+        elif kind < 0.65:
+            parts.append(rng.choice(numbers))
+        elif kind < 0.9 or simple:
+            parts.append(rng.choice(punctuation))
+        else:
+            parts.append(rng.choice(QUOTES))
+        parts.append(rng.choice(["", " ", " ", " ", "  "]))
+    if rng.random() < 0.4:
+        parts.append(rng.choice([".", ". ", "!", "?", "?!"]))
+    return "".join(parts).strip().lower()
+
+
+def old_process(text, word_tokenize):
+    """Прежний RussianProcessor.process."""
+    logging.info(f"Обработка текста: {text}")
+    text = text.lower()
+    logging.info(f"Текст в нижнем регистре: {text}")
+    tokens = word_tokenize(text)
+    logging.info(f"Токенизированный текст: {tokens}")
+    processed_text = " ".join(tokens)
+    logging.info(f"Итоговый обработанный текст: {processed_text}")
+    return processed_text
+
+
+def throughput(run, texts, repeat):
+    """Наилучшая из repeat пропускная способность в сообщениях в секунду."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run(texts)
+        best = min(best, time.perf_counter() - started)
+    return len(texts) / best
+
+
+def run(args):
+    failures = []
+
+    def check(condition, description):
+        if not condition:
+            failures.append(description)
+            print(f"  НЕ ПРОЙДЕНО: {description}")
+
+    reference, description = reference_tokenizer()
+    print(f"Эталон: {description}")
+    processor = RussianProcessor()
+    slow = []  # Тексты, переданные NLTK
+
+    def nltk_tokenize(text, language):
+        # Медленный путь идёт в тот же эталон, без загрузки данных NLTK
+        slow.append(text)
+        return reference(text)
+
+    processor._word_tokenize = nltk_tokenize
+
+    rng = random.Random(args.seed)
+    texts = [fuzz_text(rng, simple=index % 2 == 0) for index in range(args.texts)]
+    texts += [phrase.lower() for phrase in SYNTHETIC_PHRASES]
+    mismatches = []
+    for text in texts:
+        if processor.tokenize(text) != reference(text):
+            mismatches.append(text)
+    print(
+        f"Текстов: {len(texts)}, через быстрый путь: {len(texts) - len(slow)}, "
+        f"расхождений: {len(mismatches)}"
+    )
+    for text in mismatches[:10]:
+        print(f"  {text!r}: {processor.tokenize(text)} != {reference(text)}")
+    check(not mismatches, "токены должны совпадать с эталоном")
+
+    corpus = [rng.choice(SYNTHETIC_PHRASES) for _ in range(args.corpus)]
+    logging.basicConfig(
+        filename=os.devnull, level=getattr(logging, args.log_level), force=True
+    )
+    new = throughput(processor.process_many, corpus, args.repeat)
+    old = throughput(
+        lambda batch: [old_process(text, reference) for text in batch],
+        corpus,
+        args.repeat,
+    )
+    print(
+        f"Корпус {len(corpus)} сообщений, журнал {args.log_level}: "
+        f"process_many {new:.0f} сообщ/с, прежний путь {old:.0f} сообщ/с "
+        f"(быстрее в {new / old:.1f} раза)"
+    )
+    check(new > old, "process_many должен быть быстрее прежнего пути")
+
+    if failures:
+        print(f"Не пройдено проверок: {len(failures)}")
+        sys.exit(1)
+    print("Все проверки пройдены")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--texts", type=int, default=50000, help="Случайных текстов")
+    parser.add_argument("--corpus", type=int, default=10000, help="Сообщений корпуса")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING"]
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
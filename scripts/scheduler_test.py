@@ -0,0 +1,200 @@
+"""
+Проверка ProactiveScheduler на 50k чатов на виртуальных часах.
+
+Чатам назначаются случайные дедлайны в пределах часа, часть из них
+переносится и отменяется, как при новых сообщениях и ответах бота.
+Планировщик работает на цикле с виртуальным временем (см. virtual_clock.py),
+поэтому час проходит мгновенно. Проверяется, что каждый чат срабатывает
+ровно один раз и точно в свой последний дедлайн, отменённые не срабатывают,
+а цикл просыпается только к дедлайнам - без периодического опроса.
+
+Отдельно проверяется TelegramHandler: если initiate_conversation не дала
+сообщения или очередь исходящих переполнена, чат снова назначается через
+min_human_response_time, а не выпадает из планировщика.
+
+Если проверка не пройдена, скрипт завершается с кодом 1.
+
+Пример запуска:
+
+    python scripts/scheduler_test.py --chats 50000 --horizon 3600
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_TOKEN", "0:offline")
+os.environ.setdefault("LLM_PROVIDER", "stub")
+
+import bot.telegram_handler as telegram_handler  # noqa: E402
+import virtual_clock  # noqa: E402
+from bot.decision_maker import DecisionMaker  # noqa: E402
+from bot.dispatcher import OutboundDispatcher  # noqa: E402
+from bot.llm import StubLLM  # noqa: E402
+from bot.scheduler import ProactiveScheduler  # noqa: E402
+from replay_benchmark import FakeBot  # noqa: E402
+
+CHAT_ID = -100
+
+
+class FailingDecisionMaker(DecisionMaker):
+    """DecisionMaker, у которого первые failures инициаций не удаются."""
+
+    def __init__(self, failures):
+        super().__init__(llm=StubLLM())
+        self.failures = failures
+        self.attempts = []  # Время каждой попытки инициации
+
+    async def initiate_conversation(self, conversation_history, summary=""):
+        self.attempts.append(asyncio.get_running_loop().time())
+        if len(self.attempts) <= self.failures:
+            return False
+        return "Как у всех дела?"
+
+
+async def many_chats(args, check):
+    loop = asyncio.get_running_loop()
+    rng = random.Random(args.seed)
+    fired = []
+
+    async def callback(chat_id):
+        fired.append((chat_id, loop.time()))
+
+    scheduler = ProactiveScheduler(callback, workers=4, clock=loop.time)
+    scheduler.start()
+    deadlines = {}
+    for chat_id in range(args.chats):
+        deadlines[chat_id] = rng.uniform(1, args.horizon)
+        scheduler.schedule(chat_id, deadlines[chat_id])
+    # Перенос и отмена части дедлайнов, как при новых сообщениях и ответах бота
+    for chat_id in rng.sample(range(args.chats), args.chats // 5):
+        deadlines[chat_id] = rng.uniform(1, args.horizon)
+        scheduler.schedule(chat_id, deadlines[chat_id])
+    cancelled = set(rng.sample(range(args.chats), args.chats // 10))
+    for chat_id in cancelled:
+        scheduler.cancel(chat_id)
+        del deadlines[chat_id]
+
+    waits_before = loop.idle_waits
+    await asyncio.sleep(args.horizon + 1)
+    idle_waits = loop.idle_waits - waits_before
+    await scheduler.stop()
+
+    print(
+        f"Чатов: {args.chats}, сработало {len(fired)}, отменено {len(cancelled)}, "
+        f"пробуждений без дела {idle_waits} на {len(set(deadlines.values()))} "
+        f"дедлайнов за {args.horizon:.0f} с"
+    )
+    fired_ids = [chat_id for chat_id, _ in fired]
+    check(
+        sorted(fired_ids) == sorted(deadlines), "каждый чат срабатывает ровно один раз"
+    )
+    check(not cancelled & set(fired_ids), "отменённые чаты не срабатывают")
+    late = max(
+        (abs(at - deadlines[chat_id]) for chat_id, at in fired if chat_id in deadlines),
+        default=0,
+    )
+    check(late < 1e-6, f"чаты срабатывают в свой дедлайн (отклонение {late:.2e} с)")
+    check(
+        idle_waits <= len(set(deadlines.values())) + 1,
+        "цикл просыпается только к дедлайнам",
+    )
+    check(len(scheduler) == 0, "после срабатывания дедлайны не остаются")
+
+
+async def proactive_attempts(failures, queue_size):
+    """
+    Проактивные сообщения в одном чате за четыре интервала min_human_response_time.
+
+    :param failures: Число первых неудачных инициаций.
+    :param queue_size: Размер очереди исходящих сообщений.
+
+    :return: Время попыток инициации от первого сообщения, интервал и число
+        отправленных проактивных сообщений.
+    """
+    loop = asyncio.get_running_loop()
+    virtual_clock.patch_time(telegram_handler)
+    decision_maker = FailingDecisionMaker(failures)
+    fake_bot = FakeBot()
+    handler = telegram_handler.TelegramHandler(
+        os.environ["TELEGRAM_TOKEN"], decision_maker=decision_maker, bot=fake_bot
+    )
+    handler.storage = None
+    handler.scheduler.clock = loop.time
+    handler.outbound = OutboundDispatcher(1e9, 1, 1e9, 1, queue_size=queue_size)
+    handler.outbound.start()
+    handler.scheduler.start()
+
+    state = handler.chat_states.get_or_create(CHAT_ID)
+    started = loop.time()
+    handler._add_message(state, "Участник", "всем привет", started, persist=False)
+    interval = decision_maker.min_human_response_time
+    await asyncio.sleep(4 * interval)
+    await handler.scheduler.stop()
+    await handler.outbound.stop()
+    attempts = [at - started for at in decision_maker.attempts]
+    return attempts, interval, fake_bot.proactive
+
+
+async def failed_initiation(args, check):
+    attempts, interval, proactive = await proactive_attempts(2, 1000)
+    print(
+        "Инициации: "
+        + ", ".join(f"{at:.0f} с" for at in attempts)
+        + f", отправлено проактивных сообщений: {proactive}"
+    )
+    check(
+        attempts == [interval, 2 * interval, 3 * interval],
+        "после неудачной инициации чат назначается снова",
+    )
+    check(proactive == 1, "третья попытка отправляет сообщение")
+
+
+async def full_outbound(args, check):
+    # Очередь нулевого размера: каждая отправка выбрасывает QueueFull
+    attempts, interval, proactive = await proactive_attempts(0, 0)
+    print(
+        "Инициации при переполненной очереди: "
+        + ", ".join(f"{at:.0f} с" for at in attempts)
+    )
+    check(
+        attempts[:3] == [interval, 2 * interval, 3 * interval],
+        "при переполненной очереди исходящих чат назначается снова",
+    )
+    check(proactive == 0, "при переполненной очереди сообщения не отправляются")
+
+
+async def run(args, check):
+    await many_chats(args, check)
+    await failed_initiation(args, check)
+    await full_outbound(args, check)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chats", type=int, default=50000)
+    parser.add_argument("--horizon", type=float, default=3600, help="Секунд")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    failures = []
+
+    def check(condition, description):
+        if not condition:
+            failures.append(description)
+            print(f"  НЕ ПРОЙДЕНО: {description}")
+
+    virtual_clock.run(run(args, check))
+    if failures:
+        print(f"Не пройдено проверок: {len(failures)}")
+        sys.exit(1)
+    print("Все проверки пройдены")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Масштабирование многопроцессного режима по числу шардов.
+
+Синтетические обновления Telegram (словари в формате Bot API) передаются
+через ShardPool процессам-шардам, как это делает фронтенд ShardedRunner. В
+шардах вместо Gemini работает StubLLM, а ответы уходят в поддельного бота без
+ограничений частоты. Для каждого числа шардов измеряется время от передачи
+первого обновления до остановки всех шардов (с ожиданием готовящихся
+ответов), пропускная способность и время маршрутизации во фронтенде.
+
+Пример запуска:
+
+    python scripts/shard_benchmark.py --shards 1 2 4 --chats 200 --messages 20
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_TOKEN", "0:offline")
+os.environ.setdefault("LLM_PROVIDER", "stub")
+
+import bot.telegram_handler as telegram_handler  # noqa: E402
+from bot.decision_maker import DecisionMaker  # noqa: E402
+from bot.dispatcher import OutboundDispatcher  # noqa: E402
+from bot.llm import StubLLM  # noqa: E402
+from bot.sharding import ShardPool  # noqa: E402
+from replay_benchmark import SYNTHETIC_PHRASES  # noqa: E402
+
+
+class BenchBot:
+    """Поддельный бот с тем интерфейсом, который нужен Update.de_json и ответам."""
+
+    id = 1
+    username = "context_aware_bot"
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def send_message(self, chat_id, text, **kwargs):
+        return self
+
+    async def edit_text(self, text):
+        return self
+
+
+def make_handler(token, shard):
+    """Создание TelegramHandler шарда (вызывается в процессе шарда)."""
+    telegram_handler.RESPONSE_DELAY = 0.0
+    telegram_handler.COALESCE_WINDOW = 0.0
+    llm = StubLLM(latency=float(os.environ["BENCH_LLM_LATENCY"]), seed=shard[0])
+    handler = telegram_handler.TelegramHandler(
+        token, decision_maker=DecisionMaker(llm=llm), bot=BenchBot(), shard=shard
+    )
+    handler.metrics_server = None
+    handler.storage = None
+    handler.pre_filter.min_bot_interval = 0.0
+    handler.outbound = OutboundDispatcher(1e9, 1, 1e9, 1, queue_size=10**6)
+    return handler
+
+
+def synthetic_updates(chats, messages, seed):
+    """Обновления Bot API: messages сообщений в каждом из chats чатов вперемешку."""
+    rng = random.Random(seed)
+    order = [chat for chat in range(chats) for _ in range(messages)]
+    rng.shuffle(order)
+    updates = []
+    for number, chat in enumerate(order):
+        user = rng.randrange(5)
+        updates.append(
+            {
+                "update_id": number,
+                "message": {
+                    "message_id": number,
+                    "date": int(time.time()),
+                    "chat": {"id": -100 - chat, "type": "supergroup", "title": "Чат"},
+                    "from": {
+                        "id": 1000 + user,
+                        "is_bot": False,
+                        "first_name": f"Участник{user}",
+                    },
+                    "text": rng.choice(SYNTHETIC_PHRASES),
+                },
+            }
+        )
+    return updates
+
+
+async def run(shards, updates, args):
+    pool = ShardPool(
+        os.environ["TELEGRAM_TOKEN"], shards, len(updates), factory=make_handler
+    )
+    pool.start()
+    await pool.wait_ready()
+
+    started = time.perf_counter()
+    for update in updates:
+        pool.submit(update["message"]["chat"]["id"], "message", update)
+    routed = time.perf_counter() - started
+    await pool.stop(timeout=600)
+    elapsed = time.perf_counter() - started
+    return elapsed, routed
+
+
+async def main_async(args):
+    os.environ["BENCH_LLM_LATENCY"] = str(args.llm_latency)
+    updates = synthetic_updates(args.chats, args.messages, args.seed)
+    print(f"Сообщений: {len(updates)} в {args.chats} чатах, ядер: {os.cpu_count()}")
+    baseline = None
+    for shards in args.shards:
+        elapsed, routed = await run(shards, updates, args)
+        throughput = len(updates) / elapsed
+        baseline = baseline or throughput
+        print(
+            f"Шардов: {shards}: {throughput:.0f} сообщ/с "
+            f"(x{throughput / baseline:.2f}), {elapsed:.2f} с; "
+            f"маршрутизация {routed / len(updates) * 1e6:.1f} мкс/сообщ"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=20, help="Сообщений на чат")
+    parser.add_argument("--llm-latency", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
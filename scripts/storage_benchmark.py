@@ -0,0 +1,237 @@
+"""
+Скорость записи и перезапуска хранилищ истории на миллионе сообщений.
+
+Для каждого бэкенда (журнал JSON Lines и SQLite) в хранилище пачками по
+STORAGE_BATCH_SIZE пишутся messages сообщений chats чатов, затем хранилище
+открывается заново и восстанавливает последние HISTORY_SIZE сообщений
+каждого чата. Отчёт: записей в секунду и время перезапуска - для журнала
+после штатного закрытия (только снимок) и после сбоя (снимок и хвост
+журнала). Восстановленные сообщения сравниваются с ожидаемыми.
+
+Отдельно проверяется восстановление журнала после сбоя: неполная последняя
+строка отрезается, даже если она разбирается как JSON, а следующая пачка
+не склеивается с ней; повреждённая строка в середине пропускается, записи
+после неё сохраняются. Снимок, сделанный при закрытии сразу после
+отрезания неполной строки, не указывает за конец журнала.
+
+Если проверка не пройдена, скрипт завершается с кодом 1.
+
+Пример запуска:
+
+    python scripts/storage_benchmark.py --messages 1000000 --chats 10000
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict, deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_TOKEN", "0:offline")
+os.environ.setdefault("LLM_PROVIDER", "stub")
+
+from bot.storage import AppendLogStorage, create_storage  # noqa: E402
+from config import HISTORY_SIZE, MAX_CHATS, STORAGE_BATCH_SIZE  # noqa: E402
+from replay_benchmark import SYNTHETIC_PHRASES  # noqa: E402
+
+
+def synthetic_records(messages, chats, seed):
+    """Записи (chat_id, user, message, timestamp) вперемешку по чатам."""
+    rng = random.Random(seed)
+    return [
+        (
+            -100 - rng.randrange(chats),
+            f"Участник{rng.randrange(5)}",
+            rng.choice(SYNTHETIC_PHRASES),
+            1.7e9 + index * 0.01,
+        )
+        for index in range(messages)
+    ]
+
+
+def expected_recent(records, limit):
+    recent = defaultdict(lambda: deque(maxlen=limit))
+    for chat_id, user, message, timestamp in records:
+        recent[chat_id].append((user, message, timestamp))
+    return {chat_id: list(messages) for chat_id, messages in recent.items()}
+
+
+def normalize(recent):
+    return {
+        chat_id: [tuple(record) for record in records]
+        for chat_id, records in recent.items()
+    }
+
+
+def make_storage(backend, path):
+    return create_storage(
+        backend,
+        path,
+        recent_limit=HISTORY_SIZE,
+        batch_size=STORAGE_BATCH_SIZE,
+        flush_interval=3600,
+        max_chats=MAX_CHATS,
+    )
+
+
+async def write(storage, records):
+    """Запись пачками; время в секундах."""
+    await storage.open()
+    started = time.perf_counter()
+    for start in range(0, len(records), storage.batch_size):
+        for record in records[start : start + storage.batch_size]:
+            storage.append(*record)
+        await storage.flush()
+    return time.perf_counter() - started
+
+
+async def crash(storage):
+    """Остановка журнала без закрытия и снимка, как при сбое процесса."""
+    storage._writer_task.cancel()
+    await asyncio.gather(storage._writer_task, return_exceptions=True)
+    storage._file.close()
+
+
+async def restart(backend, path):
+    """Повторное открытие; время в секундах и восстановленные сообщения."""
+    storage = make_storage(backend, path)
+    started = time.perf_counter()
+    await storage.open()
+    recent = await storage.load_recent(HISTORY_SIZE)
+    elapsed = time.perf_counter() - started
+    await storage.close()
+    return elapsed, normalize(recent)
+
+
+async def bench(args, records, expected, check):
+    with tempfile.TemporaryDirectory() as directory:
+        for backend in ("log", "sqlite"):
+            path = os.path.join(directory, f"history.{backend}")
+            storage = make_storage(backend, path)
+            elapsed = await write(storage, records)
+            if backend == "log":
+                await crash(storage)
+                after_crash, recent = await restart(backend, path)
+                check(recent == expected, f"{backend}: восстановление после сбоя")
+            else:
+                await storage.close()
+            restarted, recent = await restart(backend, path)
+            check(recent == expected, f"{backend}: восстановление после закрытия")
+            size = sum(
+                os.path.getsize(os.path.join(directory, name))
+                for name in os.listdir(directory)
+                if name.startswith(f"history.{backend}")
+            )
+            line = (
+                f"{backend}: запись {len(records) / elapsed:.0f} сообщ/с, "
+                f"перезапуск {restarted:.2f} с"
+            )
+            if backend == "log":
+                line += f" (после сбоя {after_crash:.2f} с)"
+            print(f"{line}, на диске {size / 2**20:.0f} МБ")
+
+
+async def recovery(check):
+    """Восстановление журнала после неполной записи и повреждённой строки."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "history.log")
+        records = synthetic_records(10, 2, seed=1)
+
+        storage = AppendLogStorage(path, HISTORY_SIZE, snapshot_interval=10**9)
+        await write(storage, records[:5])
+        await crash(storage)
+        # Сбой посреди пачки: строка записана без перевода строки
+        with open(path, "ab") as f:
+            f.write('[-100, "Бот", "не", 1]'.encode("utf-8"))
+
+        storage = AppendLogStorage(path, HISTORY_SIZE, snapshot_interval=10**9)
+        await write(storage, records[5:8])
+        await crash(storage)
+        # Повреждённая полная строка в середине журнала
+        with open(path, "ab") as f:
+            f.write(b"{not json\n")
+        storage = AppendLogStorage(path, HISTORY_SIZE, snapshot_interval=10**9)
+        await write(storage, records[8:])
+        await crash(storage)
+
+        storage = AppendLogStorage(path, HISTORY_SIZE, snapshot_interval=10**9)
+        await storage.open()
+        recent = normalize(await storage.load_recent(HISTORY_SIZE))
+        await storage.close()
+        check(
+            recent == expected_recent(records, HISTORY_SIZE),
+            "журнал: неполная строка отрезана, записи после повреждённой сохранены",
+        )
+        with open(path, "rb") as f:
+            lines = f.read().split(b"\n")
+        check(
+            len(lines) == len(records) + 2 and lines[-1] == b"",
+            "журнал: все строки завершены переводом строки, склеенных строк нет",
+        )
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "history.log")
+        records = synthetic_records(6, 2, seed=2)
+
+        storage = AppendLogStorage(path, HISTORY_SIZE, snapshot_interval=10**9)
+        await write(storage, records[:3])
+        await crash(storage)
+        with open(path, "ab") as f:
+            f.write('[-100, "Бот", "не'.encode("utf-8"))
+        # Штатный запуск и остановка без новых сообщений: снимок при закрытии
+        storage = AppendLogStorage(path, HISTORY_SIZE, snapshot_interval=10**9)
+        await storage.open()
+        await storage.close()
+        storage = AppendLogStorage(path, HISTORY_SIZE, snapshot_interval=10**9)
+        await write(storage, records[3:])
+        await crash(storage)
+
+        storage = AppendLogStorage(path, HISTORY_SIZE, snapshot_interval=10**9)
+        await storage.open()
+        recent = normalize(await storage.load_recent(HISTORY_SIZE))
+        await storage.close()
+        check(
+            recent == expected_recent(records, HISTORY_SIZE),
+            "журнал: снимок после отрезания неполной строки не теряет новые записи",
+        )
+
+
+async def run(args):
+    failures = []
+
+    def check(condition, description):
+        if not condition:
+            failures.append(description)
+            print(f"  НЕ ПРОЙДЕНО: {description}")
+
+    await recovery(check)
+    records = synthetic_records(args.messages, args.chats, args.seed)
+    expected = expected_recent(records, HISTORY_SIZE)
+    print(
+        f"Сообщений: {len(records)} в {args.chats} чатах, "
+        f"пачка {STORAGE_BATCH_SIZE}, восстанавливается по {HISTORY_SIZE}"
+    )
+    await bench(args, records, expected, check)
+
+    if failures:
+        print(f"Не пройдено проверок: {len(failures)}")
+        sys.exit(1)
+    print("Все проверки пройдены")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--chats", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    logging.basicConfig(level=logging.ERROR)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
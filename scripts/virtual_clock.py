@@ -0,0 +1,62 @@
+"""
+Цикл событий asyncio с виртуальным временем для тестов в scripts/.
+
+Когда готовых к выполнению задач нет, цикл не ждёт, а сразу переводит часы
+к ближайшему таймеру, поэтому asyncio.sleep(60) выполняется мгновенно, а
+порядок событий остаётся таким же, как в реальном времени. Модули, которые
+читают time.time() или time.monotonic(), подключаются к тем же часам через
+patch_time.
+"""
+
+import asyncio
+import selectors
+from types import SimpleNamespace
+
+
+class _VirtualSelector(selectors.SelectSelector):
+    def __init__(self):
+        super().__init__()
+        self.now = 0.0
+        self.idle_waits = 0  # Сколько раз циклу было нечего делать до таймера
+
+    def select(self, timeout=None):
+        events = super().select(0)
+        if not events and timeout != 0:
+            if timeout is None:
+                raise RuntimeError("Нет ни готовых задач, ни таймеров")
+            self.now += timeout
+            self.idle_waits += 1
+        return events
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """Цикл событий, время которого идёт только до следующего таймера."""
+
+    def __init__(self, start=0.0):
+        self._clock = _VirtualSelector()
+        self._clock.now = start
+        super().__init__(self._clock)
+
+    def time(self):
+        return self._clock.now
+
+    @property
+    def idle_waits(self):
+        return self._clock.idle_waits
+
+
+def patch_time(*modules):
+    """Подменяет модуль time в modules часами текущего цикла событий."""
+    loop = asyncio.get_running_loop()
+    clock = SimpleNamespace(time=loop.time, monotonic=loop.time, perf_counter=loop.time)
+    for module in modules:
+        module.time = clock
+
+
+def run(main, start=0.0):
+    """asyncio.run для корутины main на цикле с виртуальным временем."""
+    loop = VirtualClockLoop(start)
+    try:
+        return loop.run_until_complete(main)
+    finally:
+        loop.close()
@@ -0,0 +1,129 @@
+"""
+Нагрузочный тест приёма обновлений через вебхук без реального Telegram.
+
+Поднимает WebhookServer на локальном порту, отправляет на него синтетические
+обновления Telegram в формате JSON и измеряет пропускную способность и
+задержку от отправки запроса до вызова process_update. Повторные доставки
+(--duplicates) проверяют дедупликацию по update_id.
+
+Пример запуска:
+
+    python scripts/webhook_load_test.py --updates 20000 --concurrency 64
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.webhook import WebhookServer  # noqa: E402
+
+
+class FakeApplication:
+    """Заменитель telegram.ext.Application, фиксирующий время обработки."""
+
+    bot = None
+
+    def __init__(self, handle_time):
+        self.handle_time = handle_time
+        self.processed = {}  # update_id -> время обработки
+
+    async def process_update(self, update):
+        self.processed[update.update_id] = time.perf_counter()
+        if self.handle_time:
+            await asyncio.sleep(self.handle_time)
+
+
+def make_update(update_id, chat_count):
+    """Синтетическое обновление с текстовым сообщением в групповом чате."""
+    chat_id = -1000000000000 - update_id % chat_count
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "supergroup", "title": "Нагрузка"},
+            "from": {"id": update_id % 997, "is_bot": False, "first_name": "Тест"},
+            "text": f"Сообщение номер {update_id}",
+        },
+    }
+
+
+async def run(args):
+    application = FakeApplication(args.handle_time)
+    server = WebhookServer(
+        application,
+        "127.0.0.1",
+        args.port,
+        "/telegram",
+        queue_size=args.queue_size,
+        workers=args.workers,
+    )
+    await server.start()
+
+    url = f"http://127.0.0.1:{args.port}/telegram"
+    sent = {}
+    statuses = {}
+    update_ids = list(range(args.updates)) + list(range(args.duplicates))
+    position = 0
+
+    async def sender(session):
+        nonlocal position
+        while position < len(update_ids):
+            update_id = update_ids[position]
+            position += 1
+            payload = make_update(update_id, args.chats)
+            while True:
+                sent.setdefault(update_id, time.perf_counter())
+                async with session.post(url, json=payload) as response:
+                    statuses[response.status] = statuses.get(response.status, 0) + 1
+                    if response.status != 503:
+                        break
+                await asyncio.sleep(0.01)  # Очередь полна: повтор, как у Telegram
+
+    started = time.perf_counter()
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*(sender(session) for _ in range(args.concurrency)))
+    await server.queue.join()
+    elapsed = time.perf_counter() - started
+    await server.stop()
+
+    latencies = sorted(
+        (application.processed[update_id] - sent[update_id]) * 1000
+        for update_id in application.processed
+    )
+    print(f"Обновлений обработано: {len(application.processed)} из {args.updates}")
+    print(f"Ответы сервера: {dict(sorted(statuses.items()))}")
+    print(f"Пропускная способность: {len(application.processed) / elapsed:.0f} обн/с")
+    if latencies:
+        print(
+            "Задержка, мс: "
+            f"p50={statistics.median(latencies):.2f} "
+            f"p95={latencies[int(len(latencies) * 0.95) - 1]:.2f} "
+            f"p99={latencies[int(len(latencies) * 0.99) - 1]:.2f} "
+            f"max={latencies[-1]:.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--updates", type=int, default=10000)
+    parser.add_argument("--duplicates", type=int, default=100)
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--queue-size", type=int, default=1000)
+    parser.add_argument("--handle-time", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=8765)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()